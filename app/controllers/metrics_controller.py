@@ -0,0 +1,64 @@
+import time
+from typing import Callable, Optional
+
+from fastapi import APIRouter, Request, Response
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+from app.utils.metrics import CONTENT_TYPE, MetricsRegistry, registry
+
+HTTP_LATENCY = registry.histogram(
+    "http_request_duration_seconds", "API request latency by route template", ("method", "route", "status")
+)
+
+
+class TimedRoute(APIRoute):
+    """记录每次请求耗时的路由类（按路由模板、方法和状态码分组写入 http_request_duration_seconds）。
+
+    使用方法：APIRouter(prefix=..., route_class=TimedRoute)；include_router 时路由类会被保留。
+    流式响应（SSE）只计到响应对象返回为止。
+    异常按默认异常处理器给出的状态码记录：HTTPException 为其状态码，参数校验失败为 422，
+    其它未处理的异常为 500。
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def timed_handler(request: Request) -> Response:
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status_code
+                return response
+            except HTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+
+        return timed_handler
+
+
+class MetricsController:
+    """GET /metrics：以 Prometheus 文本格式输出本进程的指标（app.utils.metrics.registry）。
+
+    包括抓取耗时 / 字节数 / 条目数（RSSPipeline）、入库延迟（FetchedItemRepository）、调度延迟（Scheduler，
+    与 API 同进程运行时）以及 RSSController 各路由的请求耗时。
+
+    使用方法：
+        app.include_router(MetricsController().router)
+    """
+
+    def __init__(self, prefix: str = "", metrics: Optional[MetricsRegistry] = None):
+        self.metrics = metrics or registry
+        self.router = APIRouter(prefix=prefix)
+        self.router.get("/metrics")(self.get_metrics)
+
+    async def get_metrics(self):
+        return Response(content=self.metrics.render(), media_type=CONTENT_TYPE)
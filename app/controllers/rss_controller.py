@@ -1,9 +1,44 @@
 from typing import List, Optional, Any
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
 from datetime import datetime
+import asyncio
+import hashlib
+import json
+import os
+import time
 
+from app.controllers.metrics_controller import TimedRoute
 from app.utils.logger import logger
+from app.utils.event_bus import EventBus, event_bus as shared_event_bus
+from app.utils.lru_cache import TTLCache
+
+# 详情响应缓存：条目数上限与存活时间（秒）。缓存以 (id, updated_at) 为键，任何进程的写入都会立即换用新键
+DETAIL_CACHE_SIZE = int(os.getenv("RSS_DETAIL_CACHE_SIZE", "1024"))
+DETAIL_CACHE_TTL = float(os.getenv("RSS_DETAIL_CACHE_TTL", "30"))
+# 列表版本号（max updated_at）在本进程内复用的秒数，期间重复请求不查询数据库
+LIST_VERSION_TTL = float(os.getenv("RSS_LIST_VERSION_TTL", "2"))
+# 列表页面缓存：以 ETag（含版本号）为键，版本变化后旧项不再命中，TTL 只决定旧项多久被清出
+LIST_CACHE_SIZE = int(os.getenv("RSS_LIST_CACHE_SIZE", "256"))
+LIST_CACHE_TTL = float(os.getenv("RSS_LIST_CACHE_TTL", "60"))
+# SSE：空闲时发送注释行的间隔（秒），防止代理断开长连接
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("RSS_STREAM_KEEPALIVE", "15"))
+
+
+def _strong_etag(*parts: Any) -> str:
+    digest = hashlib.blake2b("|".join(str(p) for p in parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or tag.removeprefix("W/") == etag:
+            return True
+    return False
 
 
 class ArticleSummary(BaseModel):
@@ -29,6 +64,28 @@ class ArticleDetail(BaseModel):
     is_starred: Optional[bool] = None
 
 
+_SUMMARY_LIST = TypeAdapter(List[ArticleSummary])
+
+
+class ArticleCounts(BaseModel):
+    total: int
+    unread: int
+    starred: int
+
+
+class MarkReadRequest(BaseModel):
+    """批量标记条件：ids / before / source_id 可组合（取交集）；都不给时需要 all=True。"""
+    ids: Optional[List[str]] = None
+    before: Optional[datetime] = None
+    source_id: Optional[str] = None
+    all: bool = False
+    is_read: bool = True
+
+
+class MarkReadResult(BaseModel):
+    updated: int
+
+
 class FlagsUpdate(BaseModel):
     is_read: Optional[bool] = None
     is_starred: Optional[bool] = None
@@ -37,10 +94,31 @@ class FlagsUpdate(BaseModel):
 class RSSController:
     """负责返回 RSS 文章相关的 API。构造时注入一个 RSSService（或具有等价方法的对象）。
 
-    service 必须实现：
-      - list_summaries(limit, offset, status) -> List[dict]
+    service 的以下方法必须是协程（async def），在事件循环中直接 await：
+      - list_summaries_page(limit, offset, status, cursor) -> (List[dict], next_cursor | None)
+      - count_by_status() -> {"total", "unread", "starred"}
+      - search(q, limit, offset, source_id, since, until, status) -> List[dict]
       - get_article(item_id) -> dict | None
+      - article_version(item_id) -> str | None
+      - list_duplicates(item_id) -> List[dict]
       - update_flags(item_id, is_read=None, is_starred=None) -> bool
+      - mark_read(ids, before, source_id, all_items, is_read) -> int
+      - list_version() -> str
+
+    列表接口支持游标分页：响应头 X-Next-Cursor 给出下一页游标，下一次请求传 ?cursor=...（优先于 offset）。
+
+    HTTP 缓存：列表与详情响应都带强 ETag，请求携带匹配的 If-None-Match 时返回 304。
+      - 详情：序列化后的响应体按 (item id, 条目版本) 缓存在进程内 LRU（带 TTL），ETag 为响应体哈希。
+        每次请求先按主键读取版本号（service.article_version()，即该条目的 updated_at），命中时不再加载正文；
+        任何进程修改条目后版本号随之变化，旧的缓存项不会再被命中。
+      - 列表：ETag 只由数据版本（service.list_version()，即 max(updated_at)）和查询参数得出，多个 worker 进程一致；
+        版本号在 LIST_VERSION_TTL 秒内复用（本进程写入后立即重新读取），序列化后的页面按 ETag 缓存。
+
+    新条目推送：GET /stream 为 Server-Sent Events，转发 event_bus 上的 "item" 事件（新入库条目的摘要）。
+    抓取运行在其它进程时，事件由 ItemEventRelay（app.services.item_event_relay，在 app.main 的 lifespan 中启动）
+    轮询数据库后发布。
+    断线重连时浏览器会带上 Last-Event-ID（也可用 ?last_event_id=），从服务端环形缓冲区补发错过的事件；
+    无法续传时先发送 "reset" 事件，客户端应重新拉取列表。消费过慢的连接会被断开。
 
     使用方法：
         from app.controllers.rss_controller import RSSController
@@ -48,61 +126,215 @@ class RSSController:
         app.include_router(router, prefix="/rss")
     """
 
-    def __init__(self, service: Any, prefix: str = ""):
+    def __init__(self, service: Any, prefix: str = "", event_bus: Optional[EventBus] = None):
         self.service = service
-        self.router = APIRouter(prefix=prefix)
+        self.event_bus = event_bus or shared_event_bus
+        # 每个路由的请求耗时记录到 /metrics（见 TimedRoute）
+        self.router = APIRouter(prefix=prefix, route_class=TimedRoute)
+        self._detail_cache = TTLCache(maxsize=DETAIL_CACHE_SIZE, ttl_seconds=DETAIL_CACHE_TTL)
+        self._list_cache = TTLCache(maxsize=LIST_CACHE_SIZE, ttl_seconds=LIST_CACHE_TTL)
+        self._list_version: Optional[str] = None
+        self._list_version_at = 0.0
         self._register_routes()
 
+    def _invalidate(self) -> None:
+        """本进程修改了条目：下一次列表请求重新读取版本号（详情缓存键含条目版本，无需失效）。"""
+        self._list_version = None
+
+    async def _current_list_version(self) -> str:
+        now = time.monotonic()
+        if self._list_version is None or now - self._list_version_at >= LIST_VERSION_TTL:
+            self._list_version = await self.service.list_version()
+            self._list_version_at = now
+        return self._list_version
+
+    @staticmethod
+    def _cached_response(body: bytes, etag: str, if_none_match: Optional[str], headers: Optional[dict] = None) -> Response:
+        headers = dict(headers or {})
+        headers["ETag"] = etag
+        # 允许浏览器缓存，但每次使用前都要带 If-None-Match 重新验证
+        headers["Cache-Control"] = "no-cache"
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
     def _register_routes(self):
         self.router.get("/", response_model=List[ArticleSummary])(self.list_articles)
+        # 固定路径必须在 /{item_id} 之前注册
+        self.router.get("/counts", response_model=ArticleCounts)(self.get_counts)
+        self.router.get("/search", response_model=List[ArticleSummary])(self.search_articles)
+        self.router.post("/mark-read", response_model=MarkReadResult)(self.mark_read)
+        self.router.get("/stream")(self.stream)
         self.router.get("/{item_id}", response_model=ArticleDetail)(self.get_article)
+        self.router.get("/{item_id}/duplicates", response_model=List[ArticleSummary])(self.list_duplicates)
         self.router.patch("/{item_id}/flags")(self.update_flags)
 
-    async def list_articles(self, limit: int = Query(20, ge=1, le=200), offset: int = Query(0, ge=0), status: str = Query("all")):
+    async def list_articles(
+        self,
+        limit: int = Query(20, ge=1, le=200),
+        offset: int = Query(0, ge=0),
+        status: str = Query("all"),
+        cursor: Optional[str] = Query(None),
+        if_none_match: Optional[str] = Header(None),
+    ):
         try:
-            items = self.service.list_summaries(limit=limit, offset=offset, status=status)
-            results: List[ArticleSummary] = []
-            for it in items:
-                results.append(ArticleSummary(
-                    id=str(it.get("id")),
-                    title=it.get("title") or "",
-                    summary=it.get("summary"),
-                    fetched_at=it.get("fetched_at"),
-                    source_name=it.get("source_name"),
-                    is_read=it.get("is_read"),
-                    is_starred=it.get("is_starred"),
-                ))
-            return results
+            version = await self._current_list_version()
+            etag = _strong_etag("list", version, limit, offset, status, cursor)
+            cached = self._list_cache.get(etag)
+            if cached is None:
+                items, next_cursor = await self.service.list_summaries_page(limit=limit, offset=offset, status=status, cursor=cursor)
+                results: List[ArticleSummary] = []
+                for it in items:
+                    results.append(ArticleSummary(
+                        id=str(it.get("id")),
+                        title=it.get("title") or "",
+                        summary=it.get("summary"),
+                        fetched_at=it.get("fetched_at"),
+                        source_name=it.get("source_name"),
+                        is_read=it.get("is_read"),
+                        is_starred=it.get("is_starred"),
+                    ))
+                cached = (_SUMMARY_LIST.dump_json(results), next_cursor)
+                self._list_cache.set(etag, cached)
+            body, next_cursor = cached
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+            return self._cached_response(body, etag, if_none_match, headers)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="无效的分页游标")
         except Exception:
             logger.exception("RSSController: failed to list articles")
             raise HTTPException(status_code=500, detail="无法获取文章列表")
 
-    async def get_article(self, item_id: str):
+    async def search_articles(
+        self,
+        q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(20, ge=1, le=200),
+        offset: int = Query(0, ge=0),
+        source_id: Optional[str] = Query(None),
+        since: Optional[datetime] = Query(None),
+        until: Optional[datetime] = Query(None),
+        status: str = Query("all"),
+    ):
         try:
-            it = self.service.get_article(item_id)
-            if not it:
-                raise HTTPException(status_code=404, detail="文章未找到")
-            return ArticleDetail(
-                id=str(it.get("id")),
-                title=it.get("title") or "",
-                content=it.get("content") or "",
-                published_at=it.get("published_at"),
-                fetched_at=it.get("fetched_at"),
-                source_id=it.get("source_id"),
-                source_name=it.get("source_name"),
-                url=it.get("url"),
-                is_read=it.get("is_read"),
-                is_starred=it.get("is_starred"),
+            items = await self.service.search(
+                q, limit=limit, offset=offset, source_id=source_id, since=since, until=until, status=status
             )
+            return [ArticleSummary(**it) for it in items]
+        except NotImplementedError:
+            raise HTTPException(status_code=501, detail="当前数据库不支持全文搜索")
+        except Exception:
+            logger.exception("RSSController: failed to search articles for %r", q)
+            raise HTTPException(status_code=500, detail="搜索失败")
+
+    async def stream(
+        self,
+        last_event_id: Optional[str] = Header(None),
+        last_event_id_param: Optional[str] = Query(None, alias="last_event_id"),
+    ):
+        sub = self.event_bus.subscribe(last_event_id or last_event_id_param)
+        return StreamingResponse(
+            self._stream_events(sub),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    async def _stream_events(self, sub):
+        try:
+            yield "retry: 3000\n\n"
+            if sub.reset:
+                yield "event: reset\ndata: {}\n\n"
+            for ev in sub.replay:
+                yield self._format_event(ev)
+            while True:
+                try:
+                    ev = await asyncio.wait_for(sub.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if ev is None:
+                    # 缓冲区已满被丢弃：结束响应，客户端重连后凭 Last-Event-ID 续传
+                    break
+                yield self._format_event(ev)
+        finally:
+            self.event_bus.unsubscribe(sub)
+
+    @staticmethod
+    def _format_event(ev) -> str:
+        return f"id: {ev.id}\nevent: {ev.kind}\ndata: {json.dumps(ev.data, ensure_ascii=False, default=str)}\n\n"
+
+    async def get_counts(self):
+        try:
+            return ArticleCounts(**await self.service.count_by_status())
+        except Exception:
+            logger.exception("RSSController: failed to count articles")
+            raise HTTPException(status_code=500, detail="无法获取文章计数")
+
+    async def mark_read(self, body: MarkReadRequest):
+        """批量标记已读（is_read=false 时为未读），一次集合式 UPDATE，返回受影响的条目数。"""
+        try:
+            updated = await self.service.mark_read(
+                ids=body.ids,
+                before=body.before,
+                source_id=body.source_id,
+                all_items=body.all,
+                is_read=body.is_read,
+            )
+            if updated:
+                self._invalidate()
+            return MarkReadResult(updated=updated)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="需要指定 ids、before、source_id 或 all=true")
+        except Exception:
+            logger.exception("RSSController: failed to bulk mark articles")
+            raise HTTPException(status_code=500, detail="无法批量更新文章标记")
+
+    async def get_article(self, item_id: str, if_none_match: Optional[str] = Header(None)):
+        try:
+            version = await self.service.article_version(item_id)
+            if version is None:
+                raise HTTPException(status_code=404, detail="文章未找到")
+            key = (item_id, version)
+            cached = self._detail_cache.get(key)
+            if cached is None:
+                # 读取期间条目被修改时，存下的是更新后的内容，键仍是旧版本，之后的请求读到新版本号不会命中它
+                it = await self.service.get_article(item_id)
+                if not it:
+                    raise HTTPException(status_code=404, detail="文章未找到")
+                body = ArticleDetail(
+                    id=str(it.get("id")),
+                    title=it.get("title") or "",
+                    content=it.get("content") or "",
+                    published_at=it.get("published_at"),
+                    fetched_at=it.get("fetched_at"),
+                    source_id=it.get("source_id"),
+                    source_name=it.get("source_name"),
+                    url=it.get("url"),
+                    is_read=it.get("is_read"),
+                    is_starred=it.get("is_starred"),
+                ).model_dump_json().encode("utf-8")
+                cached = (body, _strong_etag("detail", hashlib.blake2b(body, digest_size=16).hexdigest()))
+                self._detail_cache.set(key, cached)
+            body, etag = cached
+            return self._cached_response(body, etag, if_none_match)
         except HTTPException:
             raise
         except Exception:
             logger.exception("RSSController: failed to get article %s", item_id)
             raise HTTPException(status_code=500, detail="无法获取文章详情")
 
+    async def list_duplicates(self, item_id: str):
+        """同一近似重复簇中的其它文章（其它源转载的同一篇报道等），信息流中只显示簇头。"""
+        try:
+            items = await self.service.list_duplicates(item_id)
+            return [ArticleSummary(**it) for it in items]
+        except Exception:
+            logger.exception("RSSController: failed to list duplicates of %s", item_id)
+            raise HTTPException(status_code=500, detail="无法获取相似文章")
+
     async def update_flags(self, item_id: str, flags: FlagsUpdate):
         try:
-            ok = self.service.update_flags(item_id, is_read=flags.is_read, is_starred=flags.is_starred)
+            ok = await self.service.update_flags(item_id, is_read=flags.is_read, is_starred=flags.is_starred)
+            self._invalidate()
             if not ok:
                 raise HTTPException(status_code=404, detail="文章未找到或未更新")
             return {"ok": True}
@@ -0,0 +1,63 @@
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import APIRouter, HTTPException, Query
+
+from app.pipelines.fetch_policy import DEFAULT_INTERVAL
+from app.storage.db import pool_status
+from app.storage.job_queue import JobQueue
+from app.storage.source_repository import AsyncSourceRepository
+from app.utils.logger import logger
+
+
+class SystemController:
+    """运维相关的只读接口。
+
+    - GET /db-pool：数据库连接池配置（DB_POOL_SIZE / DB_MAX_OVERFLOW / DB_POOL_RECYCLE / DB_STATEMENT_TIMEOUT_MS 等）
+      与当前使用情况（已签出 / 空闲 / 溢出连接数），同步引擎（管道、调度器）和异步引擎（API）分别给出。
+    - GET /fetch-stats：每个 source 的自适应调度状态（学习到的间隔、发布速率、连续失败次数）与累计拉取统计，
+      以及固定间隔与自适应间隔下的预计每日拉取次数对比。
+    - GET /job-queue：抓取任务队列的深度（待执行 / 执行中 / 等待重试）、最老可执行任务的等待时间、
+      最近 window 秒的吞吐（完成 / 死信任务数）以及最近的死信。
+
+    使用方法：
+        router = SystemController(prefix="/system").router
+        app.include_router(router)
+    """
+
+    def __init__(
+        self,
+        prefix: str = "",
+        pool_status_fn: Optional[Callable[[], Dict[str, Any]]] = None,
+        fetch_stats_fn: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+        job_stats_fn: Optional[Callable[..., Awaitable[Dict[str, Any]]]] = None,
+    ):
+        self.pool_status_fn = pool_status_fn or pool_status
+        self.fetch_stats_fn = fetch_stats_fn or AsyncSourceRepository().fetch_stats
+        self.job_stats_fn = job_stats_fn or JobQueue().stats_async
+        self.router = APIRouter(prefix=prefix)
+        self._register_routes()
+
+    def _register_routes(self):
+        self.router.get("/db-pool")(self.get_db_pool)
+        self.router.get("/fetch-stats")(self.get_fetch_stats)
+        self.router.get("/job-queue")(self.get_job_queue)
+
+    async def get_db_pool(self):
+        try:
+            return self.pool_status_fn()
+        except Exception:
+            logger.exception("SystemController: failed to read pool status")
+            raise HTTPException(status_code=500, detail="无法获取连接池状态")
+
+    async def get_fetch_stats(self):
+        try:
+            return await self.fetch_stats_fn(default_interval_seconds=DEFAULT_INTERVAL)
+        except Exception:
+            logger.exception("SystemController: failed to read fetch stats")
+            raise HTTPException(status_code=500, detail="无法获取抓取统计")
+
+    async def get_job_queue(self, window: int = Query(3600, ge=60, le=7 * 86400)):
+        try:
+            return await self.job_stats_fn(window_seconds=window)
+        except Exception:
+            logger.exception("SystemController: failed to read job queue stats")
+            raise HTTPException(status_code=500, detail="无法获取任务队列状态")
@@ -1,24 +1,42 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 
-from app.storage.fetched_item_repository import FetchedItemRepository
-from app.storage.source_repository import SourceRepository
+from app.storage.db import dispose_async_engine
+from app.storage.fetched_item_repository import AsyncFetchedItemRepository
+from app.storage.source_repository import AsyncSourceRepository
 from app.services.rss_service import RSSService
+from app.services.item_event_relay import ItemEventRelay
 from app.controllers.rss_controller import RSSController
+from app.controllers.system_controller import SystemController
+from app.controllers.metrics_controller import MetricsController
 
 
-def create_app():
-    app = FastAPI(title="MyInfoPlatform")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 抓取在调度器进程中运行：轮询新入库的条目并发布到本进程的 event_bus，/rss/stream 才能收到
+    app.state.item_event_relay.start()
+    yield
+    await app.state.item_event_relay.stop()
+    await dispose_async_engine()
 
-    # 静态前端（开发 demo）
-    app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
 
-    # repositories / service / controller
-    fetched_repo = FetchedItemRepository()
-    source_repo = SourceRepository()
+def create_app():
+    app = FastAPI(title="MyInfoPlatform", lifespan=lifespan)
+
+    # repositories / service / controller（API 使用异步仓库，不阻塞事件循环）
+    fetched_repo = AsyncFetchedItemRepository()
+    source_repo = AsyncSourceRepository()
     service = RSSService(fetched_repo, source_repo)
     rss_controller = RSSController(service, prefix="/rss")
     app.include_router(rss_controller.router)
+    app.include_router(SystemController(prefix="/system").router)
+    app.include_router(MetricsController().router)
+    app.state.item_event_relay = ItemEventRelay(fetched_repo)
+
+    # 静态前端（开发 demo）。挂载在 "/" 会匹配所有路径，必须放在 API 路由之后注册
+    app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
 
     return app
 
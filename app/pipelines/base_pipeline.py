@@ -1,20 +1,39 @@
 import hashlib
 import logging
+import multiprocessing
+import os
+import queue
+import threading
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import Any, Callable, List, Tuple, Optional
 
 from app.storage.source_repository import SourceRepository
 from app.storage.fetched_item_repository import FetchedItemRepository
+from app.storage.job_queue import JobQueue
 
 logger = logging.getLogger(__name__)
 
+# queue sentinel marking the end of a stage's input
+_DONE = object()
+
+# Start method of the parse process pool. The pool starts its workers lazily, while the download and
+# dispatch threads (and, inside the scheduler process, its fetch workers) are running; forking then can copy
+# locks held by other threads into the child. forkserver/spawn children start from a clean interpreter.
+PARSE_START_METHOD = os.getenv(
+    "PARSE_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
 
 class BasePipeline(ABC):
     """Pipeline 基类，提供通用的源/项仓库注入与批量执行逻辑。
 
     子类需要实现 run_for_source(source_id) 来完成单个 source 的处理。
-    提供 run_all_enabled() 的默认实现，会遍历启用的 sources 并调用 run_for_source。
+    提供 run_all_enabled() 的默认实现，会遍历启用的 sources 并调用 run_for_source（可选经由持久化任务队列 JobQueue）。
+
+    另外提供 run_all_staged() 分阶段模式：下载（I/O，线程）→ 解析（CPU，进程池）→ 写入（单写线程），
+    阶段之间用有界队列连接以形成背压。子类通过实现 stage_download / stage_parse_task / stage_persist 接入。
     """
 
     def __init__(self, source_repo: Optional[SourceRepository] = None, item_repo: Optional[FetchedItemRepository] = None):
@@ -26,9 +45,26 @@ class BasePipeline(ABC):
         """处理单个 source，返回保存结果列表 (item_id, created)。"""
         raise NotImplementedError
 
-    def run_all_enabled(self) -> None:
-        """遍历所有启用的 source 并调用 run_for_source，单个 source 错误不会中断整个流程。"""
+    def run_all_enabled(self, job_queue: Optional[JobQueue] = None, workers: int = 8) -> None:
+        """遍历所有启用的 source 并调用 run_for_source，单个 source 错误不会中断整个流程。
+
+        传入 job_queue 时改为经由持久化任务队列执行：所有 source 入队后由 workers 个线程并行消化，
+        失败的 source 按队列的退避策略重试（本调用会等待重试完成或进入死信）。本调用只执行、只等待自己入队的任务：
+        已有未完成任务的 source（例如调度器入队的）跳过，由该任务的执行者处理；进程中途退出时，
+        未完成的任务留在队列中，由调度器继续执行。
+        """
         sources = self.source_repo.list(enabled_only=True)
+        if job_queue is not None:
+            job_ids = job_queue.enqueue(s.get("id") for s in sources)
+            if len(job_ids) < len(sources):
+                logger.info("%d sources already have an unfinished job, skipped", len(sources) - len(job_ids))
+            job_queue.drain(
+                lambda job: job_queue.run(job, lambda j: self.run_for_source(j.source_id)),
+                workers=workers,
+                wait_for_retries=True,
+                job_ids=job_ids,
+            )
+            return
         for s in sources:
             sid = s.get("id")
             try:
@@ -36,6 +72,102 @@ class BasePipeline(ABC):
             except Exception:
                 logger.exception("Error processing source %s", sid)
 
+    def run_all_staged(self, download_workers: int = 8, parse_workers: Optional[int] = None, queue_size: int = 32) -> None:
+        """分阶段处理所有启用的 source，解析吞吐随 CPU 核数扩展。
+
+        - stage 1: download_workers 个线程调用 stage_download(src) 下载原始数据
+        - stage 2: 一个分发线程把 stage_parse_task(src, payload) 提交到 ProcessPoolExecutor（parse_workers 个进程，
+          以 PARSE_START_METHOD 启动，不在有其它线程运行时 fork）
+        - stage 3: 当前线程作为唯一写入者，按提交顺序取解析结果并调用 stage_persist(src, payload, parsed)
+
+        两个队列都有 queue_size 上限：写入跟不上时解析分发会阻塞，解析跟不上时下载线程会阻塞，
+        因此同时驻留内存的 feed 数量有界。单个 source 的错误只记录日志，不会中断整个流程。
+        """
+        sources = self.source_repo.list(enabled_only=True)
+        if not sources:
+            return
+        parse_workers = parse_workers or os.cpu_count() or 1
+        download_workers = max(1, min(download_workers, len(sources)))
+
+        todo: "queue.Queue[Any]" = queue.Queue()
+        for s in sources:
+            todo.put(s)
+        downloaded: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+        parsed: "queue.Queue[Any]" = queue.Queue(maxsize=queue_size)
+
+        def download_loop():
+            while True:
+                try:
+                    src = todo.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    payload = self.stage_download(src)
+                except Exception:
+                    logger.exception("Error downloading source %s", src.get("id"))
+                    continue
+                downloaded.put((src, payload))
+
+        def dispatch_loop(pool: ProcessPoolExecutor):
+            finished = 0
+            while finished < download_workers:
+                entry = downloaded.get()
+                if entry is _DONE:
+                    finished += 1
+                    continue
+                src, payload = entry
+                fut: Optional[Future] = None
+                try:
+                    task = self.stage_parse_task(src, payload)
+                    if task is not None:
+                        func, args = task
+                        fut = pool.submit(func, *args)
+                except Exception:
+                    logger.exception("Error scheduling parse for source %s", src.get("id"))
+                    continue
+                parsed.put((src, payload, fut))
+            parsed.put(_DONE)
+
+        def downloader():
+            try:
+                download_loop()
+            finally:
+                downloaded.put(_DONE)
+
+        mp_context = multiprocessing.get_context(PARSE_START_METHOD)
+        with ProcessPoolExecutor(max_workers=parse_workers, mp_context=mp_context) as pool:
+            threads = [threading.Thread(target=downloader, name=f"stage-download-{i}", daemon=True) for i in range(download_workers)]
+            threads.append(threading.Thread(target=dispatch_loop, args=(pool,), name="stage-dispatch", daemon=True))
+            for t in threads:
+                t.start()
+            while True:
+                entry = parsed.get()
+                if entry is _DONE:
+                    break
+                src, payload, fut = entry
+                try:
+                    result = fut.result() if fut is not None else None
+                    self.stage_persist(src, payload, result)
+                except Exception:
+                    logger.exception("Error processing source %s", src.get("id"))
+            for t in threads:
+                t.join()
+
+    def stage_download(self, src: dict) -> Any:
+        """分阶段模式 stage 1：下载 src 的原始数据（在下载线程中执行）。"""
+        raise NotImplementedError
+
+    def stage_parse_task(self, src: dict, payload: Any) -> Optional[Tuple[Callable[..., Any], tuple]]:
+        """分阶段模式 stage 2：返回 (func, args) 交给进程池执行；func 必须是可 pickle 的模块级函数。
+
+        返回 None 表示无需解析（例如未变化或下载失败），stage_persist 会收到 parsed=None。
+        """
+        raise NotImplementedError
+
+    def stage_persist(self, src: dict, payload: Any, parsed: Any) -> List[Tuple[str, bool]]:
+        """分阶段模式 stage 3：保存解析结果（只在写入线程中执行）。"""
+        raise NotImplementedError
+
     def update_last_fetch(self, source_id: str, when: Optional[datetime]) -> bool:
         """更新 source 的 last_fetch_at 字段（委托给 SourceRepository）。"""
         return self.source_repo.update_last_fetch(source_id, when)
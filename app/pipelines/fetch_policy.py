@@ -0,0 +1,99 @@
+"""Adaptive per-source fetch intervals.
+
+A static interval polls a feed that posts twice a week as often as a news wire. AdaptiveIntervalPolicy
+learns each source's publish rate from the number of items a fetch created and picks the interval
+that is expected to find about target_new_items new items per fetch, clamped to [min, max]:
+
+- the rate is a continuous-time EWMA: a fetch covering `elapsed` seconds with `created` new items moves
+  the estimate towards created / elapsed with weight 1 - exp(-elapsed / rate_window), so the estimate
+  averages over roughly rate_window seconds no matter how often the source is polled;
+- a fetch without a previous one (elapsed None: the first fetch of a new source) has no baseline: the
+  items it creates are the feed's backlog, not what was published since the last poll. It keeps the
+  rate unknown and the interval where it was, so a new source starts at its base interval;
+- the interval may shrink at once (a quiet feed that starts posting is picked up on the next fetch) but
+  grows by at most growth_factor per fetch, so one lucky empty poll does not push a feed to max;
+- failed fetches back off exponentially from the current interval (doubling per consecutive failure, up
+  to max_backoff); the next success resets the failure count.
+
+Per-source overrides live in sources.config: "adaptive": false keeps fetch_interval_seconds fixed,
+"min_interval" / "max_interval" replace the global bounds.
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# interval of sources without fetch_interval_seconds, and the starting point before a rate is known
+DEFAULT_INTERVAL = int(os.getenv("FETCH_DEFAULT_INTERVAL", "3600"))
+MIN_INTERVAL = int(os.getenv("FETCH_MIN_INTERVAL", "300"))
+MAX_INTERVAL = int(os.getenv("FETCH_MAX_INTERVAL", "86400"))
+MAX_BACKOFF = int(os.getenv("FETCH_MAX_BACKOFF", "86400"))
+TARGET_NEW_ITEMS = float(os.getenv("FETCH_TARGET_NEW_ITEMS", "1.0"))
+RATE_WINDOW_SECONDS = float(os.getenv("FETCH_RATE_WINDOW", str(2 * 86400)))
+GROWTH_FACTOR = 2.0
+
+
+@dataclass
+class SourceSchedule:
+    """Scheduling state of one source, persisted in the sources table between runs."""
+    base_interval: int
+    interval: Optional[int] = None
+    # new items per day; None until a successful fetch with a previous fetch to measure from
+    rate_per_day: Optional[float] = None
+    consecutive_failures: int = 0
+    adaptive: bool = True
+    min_interval: Optional[int] = None
+    max_interval: Optional[int] = None
+
+    @property
+    def current_interval(self) -> int:
+        return self.interval or self.base_interval
+
+
+class AdaptiveIntervalPolicy:
+    def __init__(
+        self,
+        min_interval: int = MIN_INTERVAL,
+        max_interval: int = MAX_INTERVAL,
+        max_backoff: int = MAX_BACKOFF,
+        target_new_items: float = TARGET_NEW_ITEMS,
+        rate_window_seconds: float = RATE_WINDOW_SECONDS,
+        growth_factor: float = GROWTH_FACTOR,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_backoff = max_backoff
+        self.target_new_items = target_new_items
+        self.rate_window_seconds = rate_window_seconds
+        self.growth_factor = growth_factor
+
+    def observe(self, state: SourceSchedule, created: Optional[int], elapsed: Optional[float]) -> int:
+        """Update state with the outcome of one fetch and return the delay until the next one (seconds).
+
+        created: number of new items, None when the fetch failed; elapsed: seconds covered by this fetch
+        (time since the previous fetch of the source), None when the source was never fetched before.
+        """
+        if created is None:
+            state.consecutive_failures += 1
+            return int(min(state.current_interval * 2 ** state.consecutive_failures, max(self.max_backoff, state.current_interval)))
+        state.consecutive_failures = 0
+        if elapsed is None:
+            # first fetch: created is the whole backlog of the feed, which says nothing about its rate
+            state.interval = state.current_interval
+            return state.interval
+        elapsed = max(float(elapsed), 1.0)
+        observed = created * 86400.0 / elapsed
+        if state.rate_per_day is None:
+            state.rate_per_day = observed
+        else:
+            weight = 1.0 - math.exp(-elapsed / self.rate_window_seconds)
+            state.rate_per_day += weight * (observed - state.rate_per_day)
+        if not state.adaptive:
+            state.interval = state.base_interval
+            return state.interval
+        lo = state.min_interval or self.min_interval
+        hi = max(state.max_interval or self.max_interval, lo)
+        target = self.target_new_items * 86400.0 / state.rate_per_day if state.rate_per_day > 0 else hi
+        interval = min(max(target, lo), hi, state.current_interval * self.growth_factor)
+        state.interval = int(max(interval, lo))
+        return state.interval
@@ -1,14 +1,55 @@
+import asyncio
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import List, Tuple
+from typing import Iterable, List, Optional, Tuple
 
 from app.pipelines.base_pipeline import BasePipeline
-from app.sources.rss import RSSSource
-from app.storage.fetched_item_repository import FetchedItemRepository
+from app.pipelines.seen_cache import SeenEntryCache
+from app.sources.async_fetcher import AsyncFeedFetcher, FetchRequest, FetchResult, fetch_sync
+from app.sources.base import FetchedItem
+from app.sources.http_client import HostThrottled, PoliteHttpClient, RobotsDisallowed, http_client
+from app.sources.rss import RSSSource, parse_feed_entries
+from app.sources.url_canonical import canonicalize_url
+from app.storage.fetched_item_repository import FetchedItemRepository, make_summary
+from app.storage.job_queue import JobQueue
 from app.storage.source_repository import SourceRepository
+from app.utils.event_bus import EventBus, event_bus as shared_event_bus
+from app.utils.metrics import BYTES_BUCKETS, registry
 
 logger = logging.getLogger(__name__)
 
+# incremental mode: stop parsing a feed after this many consecutive already-seen entries (0 = never stop)
+STOP_AFTER_SEEN = int(os.getenv("RSS_STOP_AFTER_SEEN", "20"))
+# an entry that failed to persist in this many runs is given up (see RSSPipeline._give_up); 0 = never
+ENTRY_MAX_ATTEMPTS = int(os.getenv("RSS_ENTRY_MAX_ATTEMPTS", "3"))
+# failing entries whose attempts are remembered (oldest forgotten first)
+ENTRY_FAILURES_SIZE = 10000
+# the counters below carry a source_id label: "all" by default, the real source id with METRICS_PER_SOURCE=1
+# (one series per source and status; the duration histogram stays unlabelled either way, as its buckets
+# would multiply that by the bucket count)
+METRICS_PER_SOURCE = os.getenv("METRICS_PER_SOURCE", "0").lower() not in ("0", "false", "no", "off")
+
+FETCH_SECONDS = registry.histogram("rss_fetch_duration_seconds", "Download, parse and persist time of one feed")
+FETCH_SIZE = registry.histogram("rss_fetch_size_bytes", "Size of downloaded feed documents", (), BYTES_BUCKETS)
+FETCH_BYTES = registry.counter("rss_fetch_bytes_total", "Feed bytes downloaded", ("source_id",))
+FETCHES = registry.counter(
+    "rss_fetches_total", "Feed fetches by outcome (ok, not_modified, throttled, disallowed, error)", ("source_id", "status")
+)
+ENTRIES_PARSED = registry.counter("rss_entries_parsed_total", "Feed entries read from downloaded feeds", ("source_id",))
+ITEMS_CREATED = registry.counter("rss_items_created_total", "Items created from feed entries", ("source_id",))
+ITEMS_UPDATED = registry.counter("rss_items_updated_total", "Stored items updated from feed entries", ("source_id",))
+
+
+class ItemsNotSaved(Exception):
+    """Some entries of a feed could not be persisted. The source's fetch state (validators, high-water
+    mark) is left as it was, so the next run downloads and processes the feed again (until the entries
+    are given up after ENTRY_MAX_ATTEMPTS runs)."""
+
 
 class RSSPipeline(BasePipeline):
     """Service/pipeline to pull RSS feeds and save items.
@@ -17,16 +58,69 @@ class RSSPipeline(BasePipeline):
         svc = RSSPipeline()
         svc.run_for_source(source_id)
         svc.run_all_enabled()
+
+    With async_fetch=True (default) run_all_enabled downloads all enabled feeds concurrently through
+    AsyncFeedFetcher and hands the bytes to run_for_source, so a full cycle takes about as long as the
+    slowest feed instead of the sum of all feeds.
+
+    run_all_staged() (see BasePipeline) is the CPU-bound alternative: downloads on threads, feedparser and
+    HTML cleaning in a process pool, and a single writer thread persisting the parsed batches.
+
+    Entries already stored and unchanged since (same id/link and raw digest, see SeenEntryCache) are
+    skipped before date parsing, HTML cleaning and fingerprinting. Pass skip_known=False to process
+    every entry.
+
+    Parsing is incremental: each source keeps a high-water mark (newest published date / entry id stored)
+    and a feed is abandoned after stop_after_seen consecutive entries at or below it (per-source override:
+    config["stop_after_seen"]). run_for_source(..., full_resync=True) ignores validators, the seen cache
+    and the high-water mark and processes the whole feed.
+
+    An entry that cannot be persisted fails its run (ItemsNotSaved) so that the next run tries it again.
+    After failing in ENTRY_MAX_ATTEMPTS runs it is given up: it goes into the seen cache as if stored, so
+    it is skipped while unchanged (a changed version is tried again) and no longer holds back the
+    validators and the high-water mark. Attempts are counted in memory, per process.
+
+    Every newly created item is published as an "item" event (summary fields only) on event_bus, which
+    the API streams to clients at /rss/stream when the pipeline runs in the same process. Items ingested
+    by other processes (the scheduler) reach the API through app.services.item_event_relay.
     """
 
-    def __init__(self, source_repo: SourceRepository | None = None, item_repo: FetchedItemRepository | None = None):
+    def __init__(
+        self,
+        source_repo: SourceRepository | None = None,
+        item_repo: FetchedItemRepository | None = None,
+        async_fetch: bool = True,
+        fetcher_factory=AsyncFeedFetcher,
+        seen_cache: SeenEntryCache | None = None,
+        skip_known: bool = True,
+        stop_after_seen: int = STOP_AFTER_SEEN,
+        event_bus: EventBus | None = None,
+        http: PoliteHttpClient | None = None,
+    ):
         super().__init__(source_repo=source_repo, item_repo=item_repo)
+        self.async_fetch = async_fetch
+        self.fetcher_factory = fetcher_factory
+        self.skip_known = skip_known
+        self.stop_after_seen = stop_after_seen
+        self.seen_cache = seen_cache or SeenEntryCache(self.item_repo)
+        self.event_bus = event_bus or shared_event_bus
+        # pooled, per-host rate-limited HTTP access shared by every download path (see app.sources.http_client)
+        self.http = http or http_client
+        # (source_id, fingerprint) -> runs in which the entry could not be persisted
+        self._entry_failures: "OrderedDict[Tuple[str, str], int]" = OrderedDict()
+        self._failures_lock = threading.Lock()
 
-    def run_for_source(self, source_id: str) -> List[Tuple[str, bool]]:
+    def run_for_source(self, source_id: str, prefetched: Optional[FetchResult] = None, full_resync: bool = False) -> List[Tuple[str, bool]]:
         """Fetch a single source by id, save items and update last_fetch_at.
 
+        prefetched: result of an already finished download (async fetch mode); when None the feed is
+        downloaded synchronously. Both paths send the stored ETag/Last-Modified validators; on a 304 the
+        feed is not parsed at all, only last_fetch_at and last_fetch_status="not_modified" are recorded.
+        full_resync: download unconditionally and process every entry of the feed.
+
         Returns list of (item_id, created) tuples saved from this source.
-        Raises if source not found or on unexpected errors.
+        Raises if source not found or on unexpected errors, and ItemsNotSaved when some entries could not be
+        persisted: the validators are then not advanced and the run counts as failed (the job queue retries it).
         """
         src = self.source_repo.get(source_id)
         if not src:
@@ -40,38 +134,316 @@ class RSSPipeline(BasePipeline):
         name = src.get("name") or "unknown"
 
         logger.info("Fetching source %s (%s)", name, url)
-        rss = RSSSource(name, url)
+        if full_resync:
+            rss = RSSSource(name, url, http=self.http, respect_robots=self._respect_robots(src))
+        else:
+            def is_known(key, digest):
+                return self.seen_cache.is_known(source_id, key, digest)
+
+            rss = RSSSource(
+                name, url,
+                etag=src.get("etag"),
+                modified=src.get("last_modified"),
+                is_known=is_known if self.skip_known else None,
+                http=self.http,
+                respect_robots=self._respect_robots(src),
+                **self._incremental_args(src),
+            )
         results: List[Tuple[str, bool]] = []
+        # a prefetched feed was downloaded before this call: its download time counts towards the fetch
+        started = time.perf_counter() - (prefetched.elapsed if prefetched is not None else 0.0)
+        if prefetched is not None and prefetched.not_modified:
+            self._record_fetch(source_id, "not_modified", prefetched.etag, prefetched.last_modified)
+            logger.info("Source %s not modified since last fetch", name)
+            self._observe_fetch(source_id, "not_modified", started)
+            return results
         try:
             # iterate fetch() and use repository to persist — keep source layer decoupled from storage
-            for it in rss.fetch():
-                fp = self._calc_fingerprint(it.url, it.title, it.content, it.raw_content)
-                data = {
-                    "url": it.url,
-                    "title": it.title,
-                    "content": it.content,
-                    "raw_content": it.raw_content,
-                    "authors": it.authors,
-                    "source": it.source,
-                    "published_date": it.published_date,
-                    "meta": it.meta or {},
-                }
-                try:
-                    item_id, created = self.item_repo.upsert_by_fingerprint(fp, data)
-                    results.append((item_id, created))
-                except Exception:
-                    logger.exception("Failed to persist item from source %s", name)
-            # update last_fetch_at to now (UTC)
-            self.source_repo.update_last_fetch(source_id, datetime.now(timezone.utc))
-            logger.info("Finished fetching %s: %d items processed", name, len(results))
+            content = prefetched.content if prefetched is not None else None
+            results, saved_keys = self._save_items(source_id, name, rss.fetch(content))
+            if rss.not_modified:
+                self._record_fetch(source_id, "not_modified", rss.etag, rss.modified)
+                logger.info("Source %s not modified since last fetch", name)
+                self._observe_fetch(source_id, "not_modified", started)
+                return results
+            if prefetched is not None:
+                self._record_fetch(source_id, "ok", prefetched.etag, prefetched.last_modified, rss, saved_keys)
+            else:
+                self._record_fetch(source_id, "ok", rss.etag, rss.modified, rss, saved_keys)
+            self._log_finished(name, results, rss)
+        except (HostThrottled, RobotsDisallowed) as e:
+            # not a failure: the caller (JobQueue.run) retries after e.retry_after
+            logger.info("Not fetching source %s now: %s", name, e)
+            self._observe_fetch(source_id, "throttled" if isinstance(e, HostThrottled) else "disallowed", started)
+            raise
         except Exception:
             logger.exception("Failed to fetch source %s (%s)", name, url)
+            self._observe_fetch(source_id, "error", started)
             raise
+        nbytes = len(content) if content is not None else rss.bytes_fetched
+        self._observe_fetch(source_id, "ok", started, nbytes, rss, results)
+        return results
+
+    def _save_items(self, source_id: str, name: str, items: Iterable[FetchedItem]) -> Tuple[List[Tuple[str, bool]], List[Optional[str]]]:
+        """Persist the items of one feed; returns the (item_id, created) results and the entry ids of the saved rows."""
+        rows = []
+        for it in items:
+            rows.append({
+                "fingerprint": self._calc_fingerprint(it.url, it.title, it.content, it.raw_content),
+                "source_id": source_id,
+                "url": it.url,
+                "canonical_url": it.canonical_url or canonicalize_url(it.url),
+                "title": it.title,
+                "content": it.content,
+                "raw_content": it.raw_content,
+                "authors": it.authors,
+                "source": it.source,
+                "published_date": it.published_date,
+                "meta": it.meta or {},
+            })
+        saved = self._persist_rows(name, rows)
+        saved_rows = {id(r) for r, _ in saved}
+        failed = [r for r in rows if id(r) not in saved_rows]
+        given_up = self._give_up(source_id, name, [r for r, _ in saved], failed)
+        # given-up entries count as handled: skipped while unchanged, passed by the high-water mark
+        handled = [r for r, _ in saved] + given_up
+        self.seen_cache.add_many(source_id, ((r["meta"].get("entry_id"), r["meta"].get("entry_hash")) for r in handled))
+        self._publish_created(source_id, name, saved)
+        if len(failed) > len(given_up):
+            # storing the new ETag/Last-Modified now would turn the next run into a 304 and lose these entries
+            raise ItemsNotSaved(f"{len(failed)} of {len(rows)} items from source {name} could not be saved")
+        return [res for _, res in saved], [r["meta"].get("entry_id") for r in handled]
+
+    def _give_up(self, source_id: str, name: str, saved: List[dict], failed: List[dict]) -> List[dict]:
+        """Count the failed rows' attempts; return those that reached ENTRY_MAX_ATTEMPTS, which the caller
+        treats as handled so a permanently failing entry does not pin the source's fetch state."""
+        given_up = []
+        with self._failures_lock:
+            for r in saved:
+                self._entry_failures.pop((source_id, r.get("fingerprint")), None)
+            for r in failed:
+                key = (source_id, r.get("fingerprint"))
+                attempts = self._entry_failures.pop(key, 0) + 1
+                self._entry_failures[key] = attempts
+                if ENTRY_MAX_ATTEMPTS and attempts >= ENTRY_MAX_ATTEMPTS:
+                    given_up.append(r)
+            while len(self._entry_failures) > ENTRY_FAILURES_SIZE:
+                self._entry_failures.popitem(last=False)
+        for r in given_up:
+            logger.error(
+                "Giving up on entry %s of source %s after %d failed runs", r["meta"].get("entry_id") or r.get("url"), name, ENTRY_MAX_ATTEMPTS
+            )
+        return given_up
+
+    def _persist_rows(self, name: str, rows: List[dict]) -> List[Tuple[dict, Tuple[str, bool]]]:
+        """Write all rows of one feed in a single batch; if the batch fails, retry item by item so one bad
+        entry does not lose the rest of the feed. Returns (row, (item_id, created)) for every saved row;
+        _save_items raises ItemsNotSaved afterwards when some rows are missing."""
+        if not rows:
+            return []
+        try:
+            return list(zip(rows, self.item_repo.upsert_many(rows)))
+        except Exception:
+            logger.exception("Batch upsert failed for source %s, retrying item by item", name)
+        saved: List[Tuple[dict, Tuple[str, bool]]] = []
+        for row in rows:
+            try:
+                saved.append((row, self.item_repo.upsert_by_fingerprint(row.get("fingerprint"), row)))
+            except Exception:
+                logger.exception("Failed to persist item from source %s", name)
+        return saved
+
+    def _publish_created(self, source_id: str, name: str, saved: List[Tuple[dict, Tuple[str, bool]]]) -> None:
+        created_ids = [item_id for _, (item_id, created) in saved if created]
+        if not created_ids:
+            return
+        # near-duplicates of stored stories are hidden from the feed, so they are not pushed either
+        try:
+            hidden = set(self.item_repo.duplicate_ids(created_ids))
+        except Exception:
+            logger.exception("Failed to look up near-duplicates for source %s", name)
+            hidden = set()
+        fetched_at = datetime.now(timezone.utc).isoformat()
+        for row, (item_id, created) in saved:
+            if not created or item_id in hidden:
+                continue
+            published = row.get("published_date")
+            self.event_bus.publish("item", {
+                "id": item_id,
+                "title": row.get("title") or "",
+                "summary": make_summary(row.get("content")),
+                "url": row.get("url"),
+                "source_id": source_id,
+                "source_name": name,
+                "published_at": published.isoformat() if published else None,
+                "fetched_at": fetched_at,
+            })
+
+    def _incremental_args(self, src: dict) -> dict:
+        stop_after = (src.get("config") or {}).get("stop_after_seen", self.stop_after_seen)
+        return {
+            "hwm_published_at": src.get("hwm_published_at"),
+            "hwm_entry_id": src.get("hwm_entry_id"),
+            "stop_after_seen": stop_after,
+        }
+
+    def _record_fetch(
+        self,
+        source_id: str,
+        status: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+        rss: Optional[RSSSource] = None,
+        saved_keys: Iterable[Optional[str]] = (),
+    ) -> None:
+        # update last_fetch_at to now (UTC) together with the validators for the next conditional GET
+        # and the high-water mark reached by this run, computed from the entries that are stored
+        hwm_published_at, hwm_entry_id = rss.high_water_mark(saved_keys) if rss is not None else (None, None)
+        self.source_repo.update_fetch_state(
+            source_id,
+            datetime.now(timezone.utc),
+            status,
+            etag=etag,
+            last_modified=last_modified,
+            hwm_published_at=hwm_published_at,
+            hwm_entry_id=hwm_entry_id,
+        )
+
+    @staticmethod
+    def _observe_fetch(
+        source_id: str,
+        status: str,
+        started: float,
+        nbytes: int = 0,
+        rss: Optional[RSSSource] = None,
+        results: Iterable[Tuple[str, bool]] = (),
+    ) -> None:
+        """Record one fetch of source_id in the metrics registry (started: time.perf_counter() at its start)."""
+        label = source_id if METRICS_PER_SOURCE else "all"
+        FETCH_SECONDS.observe(time.perf_counter() - started)
+        FETCHES.inc(source_id=label, status=status)
+        if nbytes:
+            FETCH_BYTES.inc(nbytes, source_id=label)
+            FETCH_SIZE.observe(nbytes)
+        if rss is not None:
+            ENTRIES_PARSED.inc(rss.entries, source_id=label)
+            created = sum(1 for _, was_created in results if was_created)
+            ITEMS_CREATED.inc(created, source_id=label)
+            ITEMS_UPDATED.inc(len(results) - created, source_id=label)
+
+    @staticmethod
+    def _failed_status(res: FetchResult) -> str:
+        if isinstance(res.error, HostThrottled):
+            return "throttled"
+        return "disallowed" if isinstance(res.error, RobotsDisallowed) else "error"
+
+    @staticmethod
+    def _log_finished(name: str, results: List[Tuple[str, bool]], rss: RSSSource) -> None:
+        logger.info(
+            "Finished fetching %s: %d items processed, %d unchanged skipped%s",
+            name, len(results), rss.skipped, " (stopped at high-water mark)" if rss.stopped_early else "",
+        )
+
+    def run_all_enabled(self, job_queue: Optional[JobQueue] = None, workers: int = 8) -> None:
+        """遍历所有启用的 source；传入 job_queue 时经由任务队列并行执行（见基类），
+        否则 async_fetch 为 True 时并发下载，为 False 时退回基类的逐个执行。"""
+        if job_queue is not None or not self.async_fetch:
+            return super().run_all_enabled(job_queue=job_queue, workers=workers)
+        asyncio.run(self.run_all_enabled_async())
+
+    async def run_all_enabled_async(self) -> None:
+        """Download every enabled feed concurrently and persist each one as soon as it arrives.
+
+        Parsing and persisting run on a single worker thread: the repositories are synchronous and
+        SourceRepository shares one session, so writes stay serialized while downloads overlap.
+        A failed download or persist is logged and does not interrupt the other sources.
+        """
+        sources = self.source_repo.list(enabled_only=True)
+        requests = [self._fetch_request(s) for s in sources]
+        if not requests:
+            return
+
+        loop = asyncio.get_running_loop()
+        writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rss-writer")
+        pending = []
+        try:
+            async with self.fetcher_factory(http=self.http) as fetcher:
+                async for res in fetcher.fetch_many(requests):
+                    if not res.ok:
+                        logger.error("Skipping source %s (%s): download failed: %s", res.source_id, res.url, res.error)
+                        self._observe_fetch(res.source_id, self._failed_status(res), time.perf_counter() - res.elapsed)
+                        continue
+                    logger.debug("Downloaded %s in %.2fs (%d bytes)", res.url, res.elapsed, len(res.content or b""))
+                    pending.append(loop.run_in_executor(writer, self._persist_downloaded, res))
+                if pending:
+                    await asyncio.gather(*pending)
+        finally:
+            writer.shutdown(wait=True)
+
+    @staticmethod
+    def _respect_robots(src: dict) -> bool:
+        return (src.get("config") or {}).get("robots", True) is not False
+
+    def _fetch_request(self, src: dict) -> FetchRequest:
+        return FetchRequest(
+            source_id=src.get("id"),
+            url=src.get("base_url"),
+            timeout=(src.get("config") or {}).get("timeout"),
+            etag=src.get("etag"),
+            last_modified=src.get("last_modified"),
+            respect_robots=self._respect_robots(src),
+        )
+
+    # --- staged mode (BasePipeline.run_all_staged): download threads -> parser processes -> one writer ---
+
+    def stage_download(self, src: dict) -> FetchResult:
+        return fetch_sync(self._fetch_request(src), self.http)
+
+    def stage_parse_task(self, src: dict, payload: FetchResult):
+        if not payload.ok or payload.not_modified:
+            return None
+        known = self.seen_cache.snapshot(src.get("id")) if self.skip_known else None
+        inc = self._incremental_args(src)
+        return parse_feed_entries, (
+            src.get("name") or "unknown",
+            src.get("base_url"),
+            payload.content,
+            known,
+            inc["hwm_published_at"],
+            inc["hwm_entry_id"],
+            inc["stop_after_seen"],
+        )
+
+    def stage_persist(self, src: dict, payload: FetchResult, parsed) -> List[Tuple[str, bool]]:
+        source_id = src.get("id")
+        name = src.get("name") or "unknown"
+        # parsing ran in another process and is not included, only download and persist time
+        started = time.perf_counter() - payload.elapsed
+        if not payload.ok:
+            logger.error("Skipping source %s (%s): download failed: %s", source_id, payload.url, payload.error)
+            self._observe_fetch(source_id, self._failed_status(payload), started)
+            return []
+        if payload.not_modified:
+            self._record_fetch(source_id, "not_modified", payload.etag, payload.last_modified)
+            logger.info("Source %s not modified since last fetch", name)
+            self._observe_fetch(source_id, "not_modified", started)
+            return []
+        items, rss = parsed
+        results, saved_keys = self._save_items(source_id, name, items)
+        self._record_fetch(source_id, "ok", payload.etag, payload.last_modified, rss, saved_keys)
+        self._log_finished(name, results, rss)
+        self._observe_fetch(source_id, "ok", started, len(payload.content or b""), rss, results)
         return results
 
+    def _persist_downloaded(self, res: FetchResult) -> None:
+        try:
+            self.run_for_source(res.source_id, res)
+        except Exception:
+            logger.exception("Error processing source %s", res.source_id)
+
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.INFO)
     svc = RSSPipeline()
-    # 示例：对所有启用的 source 执行一次拉取（基类实现）
+    # 示例：对所有启用的 source 执行一次拉取（并发下载）；解析密集时可改用 svc.run_all_staged()
     svc.run_all_enabled()
@@ -1,85 +1,372 @@
-from datetime import datetime, timedelta
-from typing import Optional
-
-from apscheduler.triggers.interval import IntervalTrigger
+import heapq
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
 
+from app.pipelines.fetch_policy import DEFAULT_INTERVAL, AdaptiveIntervalPolicy, SourceSchedule
+from app.storage.job_queue import JOB_POLL_SECONDS, Job, JobQueue
 from app.utils.logger import logger
+from app.utils.metrics import registry
+
+# 每隔多少秒从数据库补充一次到期队列，以及每次补充的时间窗口和条数上限
+REFILL_SECONDS = 30.0
+REFILL_HORIZON_SECONDS = 60.0
+REFILL_BATCH = 2000
+# 清理已完成任务（JobQueue.purge）的间隔
+PURGE_SECONDS = 3600.0
+
+# 调度延迟：任务实际开始时间 - 计划时间（首次为到期时间，重试为退避后的时间）
+SCHEDULER_LAG = registry.histogram(
+    "scheduler_lag_seconds", "Actual minus planned start time of scheduled fetches",
+    buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0, 300.0, 900.0, 3600.0),
+)
+
+
+def _epoch(dt: Optional[datetime]) -> Optional[float]:
+    if dt is None:
+        return None
+    if dt.tzinfo is None:
+        # SQLite 返回不带时区的时间，库中统一存 UTC
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _utc(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc)
 
 
 class Scheduler:
-    def __init__(self, pipeline, source_repo, scheduler, default_interval_seconds=3600):
+    """单个调度循环 + 最小堆 + 有界工作线程池，按 sources.next_fetch_at 拉取到期的 source。
+
+    - 每个 source 的下一次拉取时间持久化在 sources.next_fetch_at（带索引）。调度线程每 refill_seconds 秒用一条
+      SQL（SourceRepository.list_due_sources）取出 refill_horizon_seconds 内到期的 source，放入
+      (next_run_at, source_id) 最小堆；之后只看堆顶，不再为每个 source 维护单独的定时任务或重复查询。
+    - 堆顶到期时写入持久化任务队列（job_queue，默认 JobQueue，即 fetch_jobs 表）；调度线程从队列领取（lease）任务，
+      交给最多 max_workers 个线程并行执行 pipeline.run_for_source，同一 source 不会同时运行两次。
+      失败的任务由队列按指数退避 + 抖动重试，超过 JOB_MAX_ATTEMPTS 次进入死信；进程崩溃时未完成的任务留在表中，
+      租约过期后由重启的调度器继续执行，停机后积压的任务同样按 max_workers 并行消化。
+    - 任务完成（或进入死信）后由 policy（默认 AdaptiveIntervalPolicy，见 app.pipelines.fetch_policy）根据本次新建的条目数
+      更新该 source 的发布速率估计并给出下一次间隔（进入死信时指数退避），下一次时间 = 本次开始时间 + 间隔 × (1 ± jitter_ratio)；
+      结果与累计统计一并写回 sources（SourceRepository.record_schedule），并视情况入堆。
+      尚未排期的 source（新建或升级前的数据）若已逾期，会在 startup_spread_seconds 内随机分散，避免上万个
+      source 在启动时同一时刻到期。
+    - 停用 source 不会再被取出；修改 enabled / fetch_interval_seconds 在下一次补充时生效。
+
+    使用方法：
+        scheduler = Scheduler(RSSPipeline(async_fetch=False), SourceRepository())
+        scheduler.start()
+        ...
+        scheduler.stop()
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        source_repo,
+        default_interval_seconds: Optional[int] = DEFAULT_INTERVAL,
+        max_workers: int = 8,
+        jitter_ratio: float = 0.1,
+        startup_spread_seconds: float = 300.0,
+        refill_seconds: float = REFILL_SECONDS,
+        refill_horizon_seconds: float = REFILL_HORIZON_SECONDS,
+        policy: Optional[AdaptiveIntervalPolicy] = None,
+        job_queue: Optional[JobQueue] = None,
+    ):
         self.pipeline = pipeline
         self.source_repo = source_repo
-        self.scheduler = scheduler
         self.default_interval_seconds = default_interval_seconds
+        self.max_workers = max_workers
+        self.jitter_ratio = jitter_ratio
+        self.startup_spread_seconds = startup_spread_seconds
+        self.refill_seconds = refill_seconds
+        self.refill_horizon_seconds = max(refill_horizon_seconds, refill_seconds)
+        self.policy = policy or AdaptiveIntervalPolicy()
+        self.job_queue = job_queue or JobQueue()
 
-    def _job(self, source_id: str):
-        logger.info("Scheduled job start: source %s", source_id)
-        try:
-            self.pipeline.run_for_source(source_id)
-        except Exception:
-            logger.exception("Scheduled fetch failed for source %s", source_id)
+        self._heap: List[Tuple[float, str]] = []
+        # source_id -> 堆中有效条目的时间；堆中其它条目（被重新排期的旧条目）出堆时丢弃
+        self._planned: Dict[str, float] = {}
+        self._states: Dict[str, SourceSchedule] = {}
+        # source_id -> 上一次运行开始的时间，用于计算本次拉取覆盖的时长
+        self._last_run: Dict[str, float] = {}
+        self._running: Set[str] = set()
+        # 正在运行的任务（续租用）；已在队列中（含等待重试）的 source，补充时跳过
+        self._jobs: Dict[str, Job] = {}
+        self._queued: Set[str] = set()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._refill_requested = True
+        # 有 worker 空出来，下一轮立即从队列领取任务
+        self._leasable = False
+        self._thread: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # --- 生命周期 ---
+
+    def start(self) -> None:
+        """启动调度线程和工作线程池（非阻塞）。"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch-worker")
+        self._thread = threading.Thread(target=self._loop, name="fetch-scheduler", daemon=True)
+        self._thread.start()
+        logger.info("Scheduler started with %d workers", self.max_workers)
 
-    def _compute_next_run_time(self, sid: str, interval: int, now: datetime) -> datetime:
-        src_info = self.source_repo.get(sid)
-        last_fetch = src_info.get("last_fetch_at") if src_info else None
-        next_run_time = now
-        if last_fetch is not None:
+    def stop(self, wait: bool = True) -> None:
+        """停止调度；wait 为 True 时等待正在运行的拉取结束。"""
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+    def sync_jobs(self) -> None:
+        """要求调度线程立即从数据库补充到期队列（例如批量修改 source 之后）。"""
+        with self._cond:
+            self._refill_requested = True
+            self._cond.notify_all()
+
+    def schedule_now(self, source_id: str) -> None:
+        """让某个 source 立即到期（写入 next_fetch_at 并放入堆）。"""
+        now = time.time()
+        self.source_repo.set_next_fetch({source_id: _utc(now)})
+        with self._cond:
+            self._plan(source_id, now)
+            self._cond.notify_all()
+
+    # --- 调度循环 ---
+
+    def _loop(self) -> None:
+        next_refill = next_poll = 0.0
+        next_heartbeat = next_purge = time.time()
+        while not self._stop.is_set():
+            now = time.time()
+            if self._refill_requested or now >= next_refill:
+                self._refill_requested = False
+                try:
+                    self._refill(now)
+                except Exception:
+                    logger.exception("Scheduler: failed to load due sources")
+                next_refill = now + self.refill_seconds
+            with self._cond:
+                due = self._pop_due(time.time())
+                free = self.max_workers - len(self._running)
+                jobs = list(self._jobs.values())
             try:
-                candidate = last_fetch + timedelta(seconds=int(interval))
-                if candidate > now:
-                    next_run_time = candidate
+                if due:
+                    self.job_queue.enqueue(due)
+                if free > 0 and (due or self._leasable or time.time() >= next_poll):
+                    self._leasable = False
+                    self._start_jobs(self.job_queue.lease(free))
+                    next_poll = time.time() + JOB_POLL_SECONDS
+                if jobs and time.time() >= next_heartbeat:
+                    self.job_queue.heartbeat(jobs)
+                    next_heartbeat = time.time() + self.job_queue.lease_seconds / 3
+                if time.time() >= next_purge:
+                    self.job_queue.purge()
+                    next_purge = time.time() + PURGE_SECONDS
             except Exception:
-                next_run_time = now
-        return next_run_time
-
-    def add_job_for_source(self, source_id: str, interval_seconds: Optional[int] = None) -> None:
-        """为单个 source 添加或替换定时任务。若 interval_seconds 为 None 且 source 的配置也为 None，则会移除该任务（不自动调度）。"""
-        now = datetime.utcnow()
-        src = self.source_repo.get(source_id)
-        if not src or not src.get("enabled", True):
-            # remove existing job if present
-            self.remove_job_for_source(source_id)
-            logger.info("Not scheduling source %s: not found or disabled", source_id)
-            return
-        interval = interval_seconds if interval_seconds is not None else (src.get("fetch_interval_seconds") or self.default_interval_seconds)
-        job_id = f"source_{source_id}"
-        if interval is None:
-            self.remove_job_for_source(source_id)
-            logger.info("Not scheduling source %s: interval is None", source_id)
+                logger.exception("Scheduler: job queue operation failed")
+            with self._cond:
+                wake = [next_refill, next_heartbeat if self._running else next_refill]
+                if self._heap:
+                    wake.append(self._heap[0][0])
+                if len(self._running) < self.max_workers:
+                    wake.append(next_poll)
+                timeout = min(wake) - time.time()
+                if timeout > 0 and not self._refill_requested and not self._leasable and not self._stop.is_set():
+                    # 运行结束、schedule_now、sync_jobs、stop 都会 notify
+                    self._cond.wait(timeout)
+
+    def _refill(self, now: float) -> None:
+        """从数据库取出时间窗口内到期的 source 放入堆；给尚未排期的 source 分配带随机分散的首次时间。"""
+        # 以数据库为准刷新已入队集合（任务也可能由其它进程完成，例如 BasePipeline.run_all_enabled）。
+        # 必须先于 list_due_sources 查询：否则两次查询之间完成的任务会按旧的 next_fetch_at 再次排期
+        queued = self.job_queue.active_source_ids()
+        rows = self.source_repo.list_due_sources(
+            _utc(now + self.refill_horizon_seconds), default_interval_seconds=self.default_interval_seconds, limit=REFILL_BATCH
+        )
+        first_runs: Dict[str, datetime] = {}
+        with self._cond:
+            self._queued = queued
+            for r in rows:
+                sid = r["id"]
+                self._load_state(r)
+                at = _epoch(r.get("next_fetch_at"))
+                if at is None:
+                    at = self._first_run_at(r, now)
+                    first_runs[sid] = _utc(at)
+                if sid not in self._planned and sid not in self._running and sid not in self._queued:
+                    self._plan(sid, at)
+        self.source_repo.set_next_fetch(first_runs)
+        if rows:
+            logger.debug("Scheduler: %d sources due within %.0fs, %d queued", len(rows), self.refill_horizon_seconds, len(self._planned))
+
+    def _load_state(self, row: dict) -> None:
+        """用 list_due_sources 的行刷新内存中的调度状态（配置可能已被修改；运行中的 source 保留内存状态）。"""
+        sid = row["id"]
+        config = row.get("config") or {}
+        state = self._states.get(sid)
+        if state is None or sid not in self._running:
+            state = SourceSchedule(
+                base_interval=int(row["fetch_interval_seconds"]),
+                interval=row.get("effective_interval_seconds"),
+                rate_per_day=row.get("publish_rate_per_day"),
+                consecutive_failures=row.get("consecutive_failures") or 0,
+                adaptive=config.get("adaptive", True),
+                min_interval=config.get("min_interval"),
+                max_interval=config.get("max_interval"),
+            )
+            self._states[sid] = state
+        last = _epoch(row.get("last_fetch_at"))
+        if last is not None and sid not in self._last_run:
+            self._last_run[sid] = last
+
+    def _first_run_at(self, row: dict, now: float) -> float:
+        interval = self._states[row["id"]].current_interval
+        last = _epoch(row.get("last_fetch_at"))
+        at = last + interval if last is not None else now
+        if at <= now:
+            at = now + random.uniform(0, min(self.startup_spread_seconds, interval))
+        return at
+
+    def _plan(self, source_id: str, at: float) -> None:
+        # 调用方持有 self._cond
+        self._planned[source_id] = at
+        heapq.heappush(self._heap, (at, source_id))
+
+    def _pop_due(self, now: float) -> List[str]:
+        # 调用方持有 self._cond；返回到期、需要入队的 source
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            at, sid = heapq.heappop(self._heap)
+            if self._planned.get(sid) != at:
+                continue
+            del self._planned[sid]
+            if sid not in self._running and sid not in self._queued:
+                self._queued.add(sid)
+                due.append(sid)
+        return due
+
+    def _start_jobs(self, jobs: List[Job]) -> None:
+        busy = []
+        with self._cond:
+            for job in jobs:
+                if job.source_id in self._running:
+                    busy.append(job)
+                    continue
+                self._running.add(job.source_id)
+                self._jobs[job.source_id] = job
+                self._executor.submit(self._run, job)
+        for job in busy:
+            self.job_queue.release(job, delay_seconds=JOB_POLL_SECONDS)
+
+    def _run(self, job: Job) -> None:
+        source_id = job.source_id
+        started = time.time()
+        lag = started - job.run_at.timestamp()
+        SCHEDULER_LAG.observe(max(lag, 0.0))
+        logger.info("Scheduled job start: source %s (%.1fs late, attempt %d/%d)", source_id, lag, job.attempts, job.max_attempts)
+        outcome = self.job_queue.run(job, lambda j: self.pipeline.run_for_source(j.source_id))
+        if outcome.retry_at is not None:
+            # 仍在队列中等待重试：不更新调度状态，重试时间到后由队列再次交给 worker。
+            # 主机限流（HostThrottled）或 robots.txt 禁止（RobotsDisallowed，等到缓存的 robots.txt 过期）时
+            # 任务被放回队列，不计失败次数，worker 立即空出来处理其它 source
+            if outcome.deferred:
+                logger.info("Fetch of source %s deferred until %s: %s", source_id, outcome.retry_at, outcome.error)
+            else:
+                logger.warning(
+                    "Fetch of source %s failed (attempt %d/%d), retrying at %s", source_id, job.attempts, job.max_attempts, outcome.retry_at
+                )
+            self._finish_job(source_id, None)
             return
-        next_run_time = self._compute_next_run_time(source_id, int(interval), now)
-        trigger = IntervalTrigger(seconds=int(interval))
-        self.scheduler.add_job(self._job, trigger, args=[source_id], id=job_id, replace_existing=True, next_run_time=next_run_time)
-        logger.info("Added/updated job %s for source %s every %s seconds (next run %s)", job_id, source_id, interval, next_run_time)
+        created: Optional[int] = None
+        if outcome.ok:
+            created = sum(1 for _, was_created in outcome.value or () if was_created)
+        state = self._states.get(source_id) or SourceSchedule(base_interval=self.default_interval_seconds or DEFAULT_INTERVAL)
+        self._states[source_id] = state
+        # 从未抓取过的 source 没有上一次抓取作为基准，本次新增的是 feed 的全部存量，不用于估计发布速率
+        last = self._last_run.get(source_id)
+        elapsed = started - last if last is not None else None
+        self._last_run[source_id] = started
+        delay = self.policy.observe(state, created, elapsed)
+        next_at = started + delay * (1 + random.uniform(-self.jitter_ratio, self.jitter_ratio))
+        try:
+            self.source_repo.record_schedule(
+                source_id, _utc(next_at), state.interval, state.rate_per_day, state.consecutive_failures, created
+            )
+        except Exception:
+            logger.exception("Scheduler: failed to store next fetch time of source %s", source_id)
+        if created is None:
+            logger.warning(
+                "Source %s failed %d times in a row, backing off for %ds", source_id, state.consecutive_failures, delay
+            )
+        self._finish_job(source_id, next_at)
 
-    def remove_job_for_source(self, source_id: str) -> None:
-        job_id = f"source_{source_id}"
-        if self.scheduler.get_job(job_id):
-            self.scheduler.remove_job(job_id)
-            logger.info("Removed scheduled job for source %s", source_id)
+    def _finish_job(self, source_id: str, next_at: Optional[float]) -> None:
+        """next_at 为 None 表示任务仍在队列中（等待重试）。"""
+        with self._cond:
+            self._running.discard(source_id)
+            self._jobs.pop(source_id, None)
+            if next_at is not None:
+                self._queued.discard(source_id)
+                if next_at <= time.time() + self.refill_horizon_seconds:
+                    self._plan(source_id, next_at)
+            self._leasable = True
+            self._cond.notify_all()
+
+    # --- 手动触发 ---
 
     def run_due_once(self, now: Optional[datetime] = None) -> None:
-        """立即运行一次所有到期的 source（同步执行，适用于手动触发/测试）。"""
+        """把所有到期的 source 入队，并用 max_workers 个线程立即消化队列中可执行的任务（返回时全部完成，
+        等待重试的任务留在队列中），适用于手动触发/测试。"""
         if now is None:
-            now = datetime.utcnow()
+            now = datetime.now(timezone.utc)
         due = self.source_repo.list_due_sources(now, default_interval_seconds=self.default_interval_seconds)
         logger.info("Running due sources now: %d sources", len(due))
-        for s in due:
-            sid = s.get("id")
-            try:
-                self.pipeline.run_for_source(sid)
-            except Exception:
-                logger.exception("Error running due source %s", sid)
-
-    def sync_jobs(self):
-        """同步所有 source 的定时任务（增量更新）。"""
-        now = datetime.utcnow()
-        all_sources = self.source_repo.list(enabled_only=False)
-        logger.info("Syncing jobs for all sources: %d sources", len(all_sources))
-        for src in all_sources:
-            sid = src.get("id")
-            if src.get("enabled", True):
-                self.add_job_for_source(sid)
-            else:
-                self.remove_job_for_source(sid)
+        with self._cond:
+            for r in due:
+                self._load_state(r)
+        self.job_queue.enqueue(r["id"] for r in due)
+        self.job_queue.drain(self._run_once, workers=self.max_workers)
+
+    def _run_once(self, job: Job) -> None:
+        with self._cond:
+            busy = job.source_id in self._running
+            if not busy:
+                self._running.add(job.source_id)
+                self._jobs[job.source_id] = job
+        if busy:
+            self.job_queue.release(job, delay_seconds=JOB_POLL_SECONDS)
+            return
+        self._run(job)
+
+
+if __name__ == "__main__":
+    import logging
+
+    from app.pipelines.rss_pipeline import RSSPipeline
+    from app.storage.source_repository import SourceRepository
+    from app.utils.metrics import serve
+
+    logging.basicConfig(level=logging.INFO)
+    # 调度器不在 API 进程中运行时，设置 METRICS_PORT 在该端口提供本进程的 /metrics
+    if os.getenv("METRICS_PORT"):
+        serve(int(os.getenv("METRICS_PORT")))
+    # 调度线程各自同步下载（async_fetch=False），并发度由 max_workers 控制
+    scheduler = Scheduler(RSSPipeline(async_fetch=False), SourceRepository())
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        scheduler.stop()
@@ -0,0 +1,123 @@
+"""Per-source cache of feed entries that are already stored, used to skip unchanged entries before the
+expensive per-entry work (date parsing, HTML cleaning, fingerprinting, upsert).
+
+Each entry is identified by (entry_key, entry_digest): entry_key is the feed's id/guid (or link) and
+entry_digest is a cheap hash of the raw entry fields computed by RSSSource. The pair is stored in
+Item.meta at ingest time, so the cache of a source can be rebuilt from the items table with one query.
+"""
+import hashlib
+import logging
+import math
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """Minimal Bloom filter over str keys (k hash positions derived from one blake2b digest)."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class _SourceEntries:
+    def __init__(self, max_entries: int, bloom_capacity: Optional[int]):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+
+    def add(self, key: str, digest: str) -> None:
+        self.entries[key] = digest
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if self.bloom is not None:
+            self.bloom.add(f"{key}\x00{digest}")
+
+    def contains(self, key: str, digest: str) -> bool:
+        stored = self.entries.get(key)
+        if stored is not None:
+            self.entries.move_to_end(key)
+            return stored == digest
+        # only reached for entries already evicted from the LRU part
+        return self.bloom is not None and f"{key}\x00{digest}" in self.bloom
+
+
+class SeenEntryCache:
+    """Bounded per-source LRU of (entry_key -> entry_digest), optionally backed by a Bloom filter.
+
+    item_repo: must provide list_entry_keys(source_id, limit) -> [(entry_key, entry_digest)]
+    max_entries_per_source: LRU bound per source; the newest stored entries are loaded first
+    bloom_capacity: when set, every (key, digest) pair also goes into a per-source Bloom filter so entries
+        evicted from the LRU are still recognised. A false positive (rate ~0.1%) makes a changed entry
+        look unchanged until it is seen again with a different digest, so leave this off unless the
+        feeds are much larger than max_entries_per_source.
+    """
+
+    def __init__(self, item_repo, max_entries_per_source: int = 2000, bloom_capacity: Optional[int] = None):
+        self.item_repo = item_repo
+        self.max_entries_per_source = max_entries_per_source
+        self.bloom_capacity = bloom_capacity
+        self._sources: Dict[str, _SourceEntries] = {}
+        self._lock = threading.Lock()
+
+    def _entries(self, source_id: str) -> _SourceEntries:
+        with self._lock:
+            se = self._sources.get(source_id)
+            if se is not None:
+                return se
+        se = _SourceEntries(self.max_entries_per_source, self.bloom_capacity)
+        try:
+            keys = self.item_repo.list_entry_keys(source_id, limit=self.max_entries_per_source)
+        except Exception:
+            logger.exception("Failed to load seen entries for source %s, starting empty", source_id)
+            keys = []
+        # repository returns newest first; insert oldest first so the newest end up most recently used
+        for key, digest in reversed(keys):
+            se.add(key, digest)
+        with self._lock:
+            return self._sources.setdefault(source_id, se)
+
+    def is_known(self, source_id: str, key: Optional[str], digest: Optional[str]) -> bool:
+        if not key or not digest:
+            return False
+        se = self._entries(source_id)
+        with self._lock:
+            return se.contains(key, digest)
+
+    def add_many(self, source_id: str, pairs: Iterable[Tuple[Optional[str], Optional[str]]]) -> None:
+        se = self._entries(source_id)
+        with self._lock:
+            for key, digest in pairs:
+                if key and digest:
+                    se.add(key, digest)
+
+    def snapshot(self, source_id: str) -> frozenset:
+        """Immutable copy of the LRU part for one source, e.g. to hand to a parser running in another process."""
+        se = self._entries(source_id)
+        with self._lock:
+            return frozenset(se.entries.items())
+
+    def forget(self, source_id: str) -> None:
+        """Drop the cached entries of one source; they are reloaded from the items table on next use."""
+        with self._lock:
+            self._sources.pop(source_id, None)
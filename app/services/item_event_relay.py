@@ -0,0 +1,130 @@
+import asyncio
+import os
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Optional
+
+from app.utils.event_bus import EventBus, event_bus as shared_event_bus
+from app.utils.logger import logger
+
+# 轮询新条目的间隔（秒），0 表示不启动（只转发本进程 pipeline 直接发布的事件）
+SSE_POLL_SECONDS = float(os.getenv("RSS_STREAM_POLL_SECONDS", "2"))
+# 每次查询向前多看的秒数：晚提交的事务、SQLite 秒级精度的 created_at 不会被漏掉，重复的由 id 去重
+POLL_OVERLAP_SECONDS = 10.0
+POLL_BATCH = 500
+# 记住最近转发过的条目 id 的数量（去重用）
+RECENT_IDS = 10000
+
+
+class ItemEventRelay:
+    """把其它进程（调度器 / pipeline）新入库的条目转发到本进程的 event_bus，供 GET /rss/stream 推送。
+
+    event_bus 只在进程内有效，而抓取通常运行在独立的调度器进程（python -m app.pipelines.scheduler）中。
+    API 进程因此每 poll_seconds 秒查询一次 created_at 晚于水位的条目（走 updated_at 索引，见
+    AsyncFetchedItemRepository.list_created_since），按入库顺序发布与 RSSPipeline 相同格式的 "item" 事件。
+    近似重复条目不发布；本进程 pipeline 已直接发布过的条目、重叠窗口内重复查到的条目按 id 去重。
+    没有新条目时水位推进到数据库的当前时间，查询范围不会因为长时间没有新条目而越来越大。
+    多个 uvicorn worker 各自轮询并推送给自己的连接。
+
+    使用方法（见 app.main 的 lifespan）：
+        relay = ItemEventRelay(AsyncFetchedItemRepository())
+        relay.start()
+        ...
+        await relay.stop()
+    """
+
+    def __init__(
+        self,
+        fetched_repo: Any,
+        event_bus: Optional[EventBus] = None,
+        poll_seconds: float = SSE_POLL_SECONDS,
+        overlap_seconds: float = POLL_OVERLAP_SECONDS,
+        batch: int = POLL_BATCH,
+    ):
+        self.fetched_repo = fetched_repo
+        self.event_bus = event_bus or shared_event_bus
+        self.poll_seconds = poll_seconds
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self.batch = batch
+        self._since = None
+        self._initialized = False
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """在当前事件循环中启动轮询（poll_seconds 为 0 时不启动）。"""
+        if self.poll_seconds > 0 and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                since = self._since
+                # 一批查满且水位前进时说明积压未取完，立即继续；否则等待下一轮
+                if await self.poll_once() < self.batch or self._since == since:
+                    await asyncio.sleep(self.poll_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("ItemEventRelay: failed to poll new items")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def poll_once(self) -> int:
+        """查询一次新条目并发布；返回本次查到的行数（等于 batch 时说明还有更多）。"""
+        if not self._initialized:
+            # 以数据库时钟为准，从启动时刻开始转发（不补发启动前入库的条目）；启动时表为空则 _since 保持 None，转发全部新条目
+            self._since = await self.fetched_repo.last_updated_at()
+            self._initialized = True
+            if self._since is not None:
+                # 重叠窗口内已有的条目记为已转发，避免第一次轮询把它们当作新条目推送
+                for row in await self.fetched_repo.list_created_since(self._since - self.overlap, limit=self.batch):
+                    self._remember(row["id"])
+        since = self._since - self.overlap if self._since is not None else None
+        rows = await self.fetched_repo.list_created_since(since, limit=self.batch)
+        if not rows:
+            # 水位停在最后一个新条目上时，之后被修改过（已读、加星）的旧条目都落在 updated_at 范围内，
+            # 每次轮询扫描的行越来越多；推进到数据库时钟，下次仍向前多看 overlap 秒
+            now = await self.fetched_repo.db_now()
+            if now is not None and (self._since is None or now > self._since):
+                self._since = now
+            return 0
+        published = {e.data.get("id") for e in self.event_bus.history("item")}
+        for row in rows:
+            item_id = row["id"]
+            if item_id in self._recent or item_id in published:
+                continue
+            self._remember(item_id)
+            self.event_bus.publish("item", self._event_data(row))
+        newest = rows[-1]["created_at"]
+        if newest is not None and (self._since is None or newest > self._since):
+            self._since = newest
+        return len(rows)
+
+    def _remember(self, item_id: str) -> None:
+        self._recent[item_id] = None
+        while len(self._recent) > RECENT_IDS:
+            self._recent.popitem(last=False)
+
+    @staticmethod
+    def _event_data(row: dict) -> dict:
+        # 与 RSSPipeline._publish_created 发布的字段一致
+        published, fetched = row.get("published_at"), row.get("fetched_at")
+        return {
+            "id": row["id"],
+            "title": row.get("title") or "",
+            "summary": row.get("summary"),
+            "url": row.get("url"),
+            "source_id": row.get("source_id"),
+            "source_name": row.get("source_name"),
+            "published_at": published.isoformat() if published else None,
+            "fetched_at": fetched.isoformat() if fetched else None,
+        }
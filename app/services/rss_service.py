@@ -1,72 +1,142 @@
-from typing import List, Optional, Any, Dict
+from datetime import datetime
+from typing import List, Optional, Any, Dict, Tuple
+from app.storage.source_catalog import SourceCatalog, source_catalog
 from app.utils.logger import logger
 
 
 class RSSService:
     """Service 层：为 Controller 提供主页面列表与文章详情数据。
 
-    注入：
-      - fetched_repo: 提供 list(limit, offset) 和 get(item_id)，返回 dict（包含 fetched_at 和 source_id 等）。
-      - source_repo: 提供 get(source_id) 返回包含 name 的 dict。
+    所有方法都是协程：仓库通过 AsyncSession 访问数据库，async controller 直接 await，数据库往返不会阻塞事件循环。
+
+    注入（均为异步仓库，例如 AsyncFetchedItemRepository / AsyncSourceRepository）：
+      - fetched_repo: 提供 async 的 list_page(limit, cursor, offset, status)、count_by_status()、version()、list_cluster(item_id) 和 get(item_id)，返回 dict（包含 fetched_at 和 source_id 等）；
+        list_page 只返回摘要列（含预先计算的 summary，不含正文），get 返回完整条目。
+      - source_repo: 提供 async get(source_id) 返回包含 name 的 dict。
+      - catalog: 进程级的 source 元数据缓存（默认共享的 source_catalog），按 TTL 批量加载，SourceRepository
+        写入时失效；source 名称优先取列表查询 join 出的 source_name，其次查 catalog，不再逐个查询数据库。
 
     返回的数据为纯 Python dict，便于 Controller 将其映射到 Pydantic 模型。
     """
 
-    def __init__(self, fetched_repo: Any, source_repo: Any):
+    def __init__(self, fetched_repo: Any, source_repo: Any, catalog: Optional[SourceCatalog] = None):
         self.fetched_repo = fetched_repo
         self.source_repo = source_repo
+        self.catalog = catalog or source_catalog
 
-    def list_summaries(self, limit: int = 20, offset: int = 0, status: str = "all") -> List[Dict[str, Any]]:
+    async def _source_name(self, source_id: Optional[str]) -> Optional[str]:
+        if not source_id:
+            return None
+        try:
+            return await self.catalog.aname(source_id)
+        except Exception:
+            logger.exception("RSSService: failed to look up source %s in catalog, querying source_repo", source_id)
+        try:
+            src = await self.source_repo.get(source_id)
+            return src.get("name") if src else None
+        except Exception:
+            logger.exception("RSSService: failed to get source for id %s", source_id)
+            return None
+
+    async def list_summaries(self, limit: int = 20, offset: int = 0, status: str = "all", cursor: Optional[str] = None) -> List[Dict[str, Any]]:
         """返回文章摘要列表：每项包含 id, title, summary, fetched_at, source_name
 
         status: "all" | "unread" | "read" | "starred"
         """
+        results, _ = await self.list_summaries_page(limit=limit, offset=offset, status=status, cursor=cursor)
+        return results
+
+    async def list_summaries_page(
+        self, limit: int = 20, offset: int = 0, status: str = "all", cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """与 list_summaries 相同，但额外返回下一页的游标（没有更多数据时为 None）。
+
+        传入 cursor 时使用游标分页并忽略 offset；cursor 非法时抛出 ValueError。
+        status 过滤在仓库的 SQL 查询中完成，因此只要有足够的匹配数据，每页都是满的。
+        """
         try:
-            items = self.fetched_repo.list(limit=limit, offset=offset)
+            items, next_cursor = await self.fetched_repo.list_page(limit=limit, cursor=cursor, offset=offset, status=status)
+        except ValueError:
+            raise
         except Exception:
             logger.exception("RSSService: failed to list items from fetched_repo")
             raise
 
-        results: List[Dict[str, Any]] = []
-        # 缓存 source_name，避免重复查询
-        source_name_cache: Dict[Optional[str], Optional[str]] = {}
-
-        for it in items:
-            # 过滤逻辑
-            is_read = bool(it.get("is_read"))
-            is_starred = bool(it.get("is_starred"))
-            if status == "unread" and is_read:
-                continue
-            if status == "read" and not is_read:
-                continue
-            if status == "starred" and not is_starred:
-                continue
-
-            source_id = it.get("source_id")
-            if source_id not in source_name_cache:
-                try:
-                    src = self.source_repo.get(source_id) if source_id else None
-                    source_name_cache[source_id] = src.get("name") if src else None
-                except Exception:
-                    logger.exception("RSSService: failed to get source for id %s", source_id)
-                    source_name_cache[source_id] = None
-
-            summary = it.get("summary") or ( (it.get("content") or "")[:200] )
-            results.append({
-                "id": it.get("id"),
-                "title": it.get("title") or "",
-                "summary": summary,
-                "fetched_at": it.get("fetched_at"),
-                "source_name": source_name_cache.get(source_id),
-                "is_read": is_read,
-                "is_starred": is_starred,
-            })
-        return results
+        return [await self._summary(it) for it in items], next_cursor
+
+    async def _summary(self, it: Dict[str, Any]) -> Dict[str, Any]:
+        source_name = it.get("source_name") if "source_name" in it else await self._source_name(it.get("source_id"))
+        summary = it.get("summary") or ( (it.get("content") or "")[:200] )
+        return {
+            "id": it.get("id"),
+            "title": it.get("title") or "",
+            "summary": summary,
+            "fetched_at": it.get("fetched_at"),
+            "source_name": source_name,
+            "is_read": bool(it.get("is_read")),
+            "is_starred": bool(it.get("is_starred")),
+        }
+
+    async def search(
+        self,
+        q: str,
+        limit: int = 20,
+        offset: int = 0,
+        source_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        status: str = "all",
+    ) -> List[Dict[str, Any]]:
+        """全文搜索标题与正文，按相关度排序；返回与 list_summaries 相同结构的摘要列表。
+
+        可按 source、时间窗口 [since, until) 和 status 过滤。
+        """
+        try:
+            items = await self.fetched_repo.search(
+                q, limit=limit, offset=offset, source_id=source_id, since=since, until=until, status=status
+            )
+        except Exception:
+            logger.exception("RSSService: failed to search items for %r", q)
+            raise
+        return [await self._summary(it) for it in items]
+
+    async def list_duplicates(self, item_id: str) -> List[Dict[str, Any]]:
+        """返回与该文章近似重复（同一簇）的其它文章摘要，结构与 list_summaries 相同；信息流中只显示簇头。"""
+        try:
+            items = await self.fetched_repo.list_cluster(item_id)
+        except Exception:
+            logger.exception("RSSService: failed to list duplicates of %s", item_id)
+            raise
+        return [await self._summary(it) for it in items]
 
-    def get_article(self, item_id: str) -> Optional[Dict[str, Any]]:
+    async def count_by_status(self) -> Dict[str, int]:
+        """返回 {"total", "unread", "starred"} 计数，供侧边栏角标等使用。"""
+        try:
+            return await self.fetched_repo.count_by_status()
+        except Exception:
+            logger.exception("RSSService: failed to count items")
+            raise
+
+    async def list_version(self) -> str:
+        """返回条目数据的版本号（任一条目插入或更新后都会变化），用于列表响应的 ETag。"""
+        try:
+            return await self.fetched_repo.version()
+        except Exception:
+            logger.exception("RSSService: failed to read items version")
+            raise
+
+    async def article_version(self, item_id: str) -> Optional[str]:
+        """返回单篇文章的版本号（该条目每次更新后都会变化，按主键读取），文章不存在时返回 None；用作详情缓存的键。"""
+        try:
+            return await self.fetched_repo.item_version(item_id)
+        except Exception:
+            logger.exception("RSSService: failed to read version of item %s", item_id)
+            raise
+
+    async def get_article(self, item_id: str) -> Optional[Dict[str, Any]]:
         """返回单篇文章详情：包含 id, title, content, published_at, fetched_at, source_id, source_name, url"""
         try:
-            it = self.fetched_repo.get(item_id)
+            it = await self.fetched_repo.get(item_id)
         except Exception:
             logger.exception("RSSService: failed to get item %s from fetched_repo", item_id)
             raise
@@ -75,13 +145,7 @@ class RSSService:
             return None
 
         source_id = it.get("source_id")
-        source_name = None
-        if source_id:
-            try:
-                src = self.source_repo.get(source_id)
-                source_name = src.get("name") if src else None
-            except Exception:
-                logger.exception("RSSService: failed to get source for id %s", source_id)
+        source_name = await self._source_name(source_id)
 
         return {
             "id": it.get("id"),
@@ -96,7 +160,7 @@ class RSSService:
             "is_starred": bool(it.get("is_starred")),
         }
 
-    def update_flags(self, item_id: str, is_read: Optional[bool] = None, is_starred: Optional[bool] = None) -> bool:
+    async def update_flags(self, item_id: str, is_read: Optional[bool] = None, is_starred: Optional[bool] = None) -> bool:
         """更新指定文章的 is_read / is_starred 标记，返回是否成功。"""
         fields = {}
         if is_read is not None:
@@ -106,7 +170,27 @@ class RSSService:
         if not fields:
             return False
         try:
-            return bool(self.fetched_repo.update_flags(item_id, fields))
+            return bool(await self.fetched_repo.update_flags(item_id, fields))
         except Exception:
             logger.exception("RSSService: failed to update flags for %s", item_id)
             raise
+
+    async def mark_read(
+        self,
+        ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+        source_id: Optional[str] = None,
+        all_items: bool = False,
+        is_read: bool = True,
+    ) -> int:
+        """批量标记已读/未读（按 id 列表、时间、source 或全部），返回受影响的条目数。
+
+        没有任何条件且 all_items 不为 True 时抛出 ValueError。
+        """
+        try:
+            return await self.fetched_repo.mark_read(ids=ids, before=before, source_id=source_id, all_items=all_items, is_read=is_read)
+        except ValueError:
+            raise
+        except Exception:
+            logger.exception("RSSService: failed to bulk update read state")
+            raise
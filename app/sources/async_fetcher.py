@@ -0,0 +1,213 @@
+"""Concurrent feed downloader built on asyncio + a shared httpx.AsyncClient.
+
+Only the network part lives here: the fetcher returns raw bytes and leaves parsing/persisting to the
+existing source/pipeline code (see RSSSource.fetch(data=...) and RSSPipeline.run_all_enabled_async).
+
+Concurrency is bounded twice: a global limit over all in-flight downloads and a per-host limit so that a
+host serving many of our feeds is not hit by all of them at once. On top of that every request goes
+through the shared PoliteHttpClient (app.sources.http_client): per-host token-bucket rate limits,
+429/503 back-off and robots.txt; a host throttled for longer than HTTP_HOST_MAX_WAIT fails its
+downloads with HostThrottled instead of holding them. Every download is wrapped in its own timeout (not
+counting the wait for the host's rate limit), so one slow host only delays its own sources.
+
+fetch_sync() offers the same request/result contract with the shared blocking client for thread-based callers.
+"""
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.sources.http_client import FETCH_CONCURRENCY, FETCH_TIMEOUT, USER_AGENT, PoliteHttpClient, http_client
+
+logger = logging.getLogger(__name__)
+
+# Read defaults from environment, same as app.storage.db does for DB settings
+# (RSS_FETCH_CONCURRENCY / RSS_FETCH_TIMEOUT / RSS_USER_AGENT are read by app.sources.http_client)
+FETCH_PER_HOST = int(os.getenv("RSS_FETCH_PER_HOST", "4"))
+
+
+@dataclass
+class FetchRequest:
+    source_id: str
+    url: str
+    timeout: Optional[float] = None
+    # validators from the previous fetch, sent back as If-None-Match / If-Modified-Since
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    # False skips the robots.txt check (per-source config {"robots": false})
+    respect_robots: bool = True
+
+
+@dataclass
+class FetchResult:
+    source_id: str
+    url: str
+    content: Optional[bytes] = None
+    status_code: Optional[int] = None
+    elapsed: float = 0.0
+    error: Optional[BaseException] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def not_modified(self) -> bool:
+        return self.error is None and self.status_code == 304
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and (self.content is not None or self.not_modified)
+
+
+def _conditional_headers(req: FetchRequest) -> Dict[str, str]:
+    headers = {}
+    if req.etag:
+        headers["If-None-Match"] = req.etag
+    if req.last_modified:
+        headers["If-Modified-Since"] = req.last_modified
+    return headers
+
+
+def _fill_result(result: FetchResult, resp: httpx.Response) -> None:
+    result.status_code = resp.status_code
+    result.etag = resp.headers.get("ETag")
+    result.last_modified = resp.headers.get("Last-Modified")
+    if resp.status_code != 304:
+        result.content = resp.content
+
+
+def fetch_sync(req: FetchRequest, http: Optional[PoliteHttpClient] = None) -> FetchResult:
+    """Download a single feed with the shared blocking client (used by the staged pipeline's download threads).
+
+    Same contract as AsyncFeedFetcher.fetch: never raises, 304 gives not_modified=True. A host throttled for
+    longer than HTTP_HOST_MAX_WAIT is not waited for: the result's error is then HostThrottled.
+    """
+    http = http or http_client
+    timeout = req.timeout or FETCH_TIMEOUT
+    result = FetchResult(source_id=req.source_id, url=req.url)
+    try:
+        http.prepare(req.url, req.respect_robots)
+        start = time.monotonic()
+        try:
+            resp = http.client.get(req.url, headers=_conditional_headers(req), timeout=timeout)
+        finally:
+            result.elapsed = time.monotonic() - start
+        http.observe(req.url, resp)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+        _fill_result(result, resp)
+    except Exception as e:
+        result.error = e
+        logger.warning("Failed to fetch %s: %s", req.url, e)
+    return result
+
+
+class AsyncFeedFetcher:
+    """Download many feeds concurrently with one shared HTTP client.
+
+    Usage:
+        async with AsyncFeedFetcher() as fetcher:
+            async for res in fetcher.fetch_many(requests):
+                ...
+
+    max_concurrency: global cap on in-flight downloads
+    per_host_limit: cap on in-flight downloads against the same host
+    timeout: default per-source timeout in seconds (covers connect + full body read)
+    http: rate limiter / robots.txt policy (default: the shared http_client)
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        timeout: Optional[float] = None,
+        client: Optional[httpx.AsyncClient] = None,
+        http: Optional[PoliteHttpClient] = None,
+    ):
+        self.max_concurrency = max_concurrency or FETCH_CONCURRENCY
+        self.per_host_limit = per_host_limit or FETCH_PER_HOST
+        self.timeout = timeout or FETCH_TIMEOUT
+        self.http = http or http_client
+        self._client = client
+        self._owns_client = client is None
+        # semaphores are created lazily so they bind to the running loop
+        self._global_sem: Optional[asyncio.Semaphore] = None
+        self._host_sems: Dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self) -> "AsyncFeedFetcher":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = self.http.new_async_client(self.max_concurrency)
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None and self._owns_client:
+            await self._client.aclose()
+            self._client = None
+
+    def _host_sem(self, url: str) -> asyncio.Semaphore:
+        host = (urlsplit(url).hostname or "").lower()
+        sem = self._host_sems.get(host)
+        if sem is None:
+            sem = asyncio.Semaphore(self.per_host_limit)
+            self._host_sems[host] = sem
+        return sem
+
+    async def _download(self, req: FetchRequest, timeout: float) -> httpx.Response:
+        resp = await self.client.get(req.url, headers=_conditional_headers(req), timeout=timeout)
+        self.http.observe(req.url, resp)
+        if resp.status_code != 304:
+            resp.raise_for_status()
+        return resp
+
+    async def fetch(self, req: FetchRequest) -> FetchResult:
+        """Download a single feed. Never raises: errors are returned on FetchResult.error.
+
+        A 304 answer to the conditional request comes back with content=None and not_modified=True.
+        """
+        if self._global_sem is None:
+            self._global_sem = asyncio.Semaphore(self.max_concurrency)
+        timeout = req.timeout or self.timeout
+        result = FetchResult(source_id=req.source_id, url=req.url)
+        async with self._host_sem(req.url):
+            try:
+                # robots.txt and the host's rate limit are waited for without holding a global slot
+                await self.http.prepare_async(self.client, req.url, req.respect_robots)
+            except Exception as e:
+                result.error = e
+                logger.warning("Not fetching %s: %s", req.url, e)
+                return result
+            async with self._global_sem:
+                start = time.monotonic()
+                try:
+                    resp = await asyncio.wait_for(self._download(req, timeout), timeout)
+                    _fill_result(result, resp)
+                except asyncio.TimeoutError as e:
+                    result.error = e
+                    logger.warning("Timed out after %.1fs fetching %s", timeout, req.url)
+                except Exception as e:
+                    result.error = e
+                    logger.warning("Failed to fetch %s: %s", req.url, e)
+                result.elapsed = time.monotonic() - start
+        return result
+
+    async def fetch_many(self, requests: Iterable[FetchRequest]) -> AsyncIterator[FetchResult]:
+        """Download all requests concurrently and yield results in completion order."""
+        tasks = [asyncio.ensure_future(self.fetch(r)) for r in requests]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                yield await fut
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
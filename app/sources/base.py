@@ -3,6 +3,8 @@ from typing import Iterable
 from dataclasses import dataclass
 from datetime import datetime
 
+from app.sources.http_client import PoliteHttpClient, http_client
+
 @dataclass
 class FetchedItem:
     url: str
@@ -13,11 +15,22 @@ class FetchedItem:
     source: str | None
     published_date: datetime | None
     meta: dict
+    # dedupe key from app.sources.url_canonical; None means "canonicalize url"
+    canonical_url: str | None = None
 
 class BaseSource(ABC):
-    def __init__(self, name: str, url: str):
+    """Base of all sources. Network access goes through self.http (default: the shared, rate-limited
+    app.sources.http_client.http_client) so every source shares connection pools and per-host limits."""
+
+    def __init__(self, name: str, url: str, http: "PoliteHttpClient | None" = None):
         self.name = name
         self.base_url = url
+        # only stored when given: the shared client holds locks and sockets and cannot be pickled
+        self._http = http
+
+    @property
+    def http(self) -> "PoliteHttpClient":
+        return self._http or http_client
 
     @abstractmethod
     def fetch(self) -> Iterable[FetchedItem]:
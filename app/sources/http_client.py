@@ -0,0 +1,429 @@
+"""Shared, polite HTTP access for all sources.
+
+Every source (RSSSource, AsyncFeedFetcher, future crawlers) goes through one PoliteHttpClient, the shared
+`http_client` below, so that:
+
+- connections are pooled and kept alive per host: one httpx.Client for blocking callers, and
+  new_async_client() for asyncio callers with the same settings;
+- requests to a host are spaced by a per-host token bucket (HTTP_HOST_RATE requests per second, bursts
+  of HTTP_HOST_BURST; per-host overrides in HTTP_HOST_RATES="example.com=5,slow.org=0.2"). It does not
+  matter how many of our feeds a host serves. A 429/503 answer blocks the host for its Retry-After and
+  halves its rate. The rate then recovers with every successful request. Other hosts are not slowed down.
+  A request that would have to wait longer than HTTP_HOST_MAX_WAIT seconds for its host raises
+  HostThrottled (without taking a token) instead of sleeping, so a throttled host never ties up a worker:
+  the caller gives the fetch back and retries after HostThrottled.retry_after (JobQueue.run does this);
+- robots.txt is fetched once per origin, cached for HTTP_ROBOTS_TTL seconds and evaluated for our
+  user agent. A Crawl-delay lowers that host's rate. Missing robots.txt (4xx) allows everything. An
+  unreachable one (5xx, network error) is retried after a short delay and does not block the feeds in
+  the meantime. HTTP_ROBOTS=0 disables the check; a source can opt out with config {"robots": false}.
+  A disallowed URL raises RobotsDisallowed, whose retry_after is the time until the cached robots.txt
+  expires: nothing can change before then, so the caller defers the fetch like a throttled one instead
+  of spending retries on it;
+
+Rate limiting waits happen before a request is sent and are not counted against the request timeout.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+from urllib.robotparser import RobotFileParser
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = os.getenv("RSS_USER_AGENT", "MyInfoPlatform/0.1 (+feed fetcher)")
+FETCH_CONCURRENCY = int(os.getenv("RSS_FETCH_CONCURRENCY", "50"))
+FETCH_TIMEOUT = float(os.getenv("RSS_FETCH_TIMEOUT", "30"))
+HOST_RATE = float(os.getenv("HTTP_HOST_RATE", "2"))
+HOST_BURST = int(os.getenv("HTTP_HOST_BURST", "4"))
+HOST_RATES = os.getenv("HTTP_HOST_RATES", "")
+RESPECT_ROBOTS = os.getenv("HTTP_ROBOTS", "1").lower() not in ("0", "false", "no", "off")
+ROBOTS_TTL = float(os.getenv("HTTP_ROBOTS_TTL", str(6 * 3600)))
+# longest wait for a host's rate limit before a request gives up with HostThrottled
+HOST_MAX_WAIT = float(os.getenv("HTTP_HOST_MAX_WAIT", "30"))
+# an unreachable robots.txt is asked for again after this many seconds
+ROBOTS_ERROR_TTL = 300.0
+ROBOTS_TIMEOUT = 10.0
+# a throttled host without Retry-After is left alone this long
+DEFAULT_RETRY_AFTER = 60.0
+# rates never drop below this many requests per second after throttling
+MIN_HOST_RATE = 0.02
+
+
+class RobotsDisallowed(Exception):
+    """robots.txt of the target host forbids fetching the URL.
+
+    retry_after: seconds until the cached robots.txt expires and is asked for again; retry_at: the same
+    as an aware UTC datetime.
+    """
+
+    def __init__(self, url: str, retry_after: float):
+        super().__init__(f"robots.txt of {RobotsCache.origin(url)} disallows {url}")
+        self.url = url
+        self.retry_after = retry_after
+        self.retry_at = datetime.now(timezone.utc) + timedelta(seconds=retry_after)
+
+    def __reduce__(self):
+        return type(self), (self.url, self.retry_after)
+
+
+class HostThrottled(Exception):
+    """The host's rate limit (or its Retry-After) delays the request by more than the wait threshold.
+
+    retry_after: seconds until the request can be sent; retry_at: the same as an aware UTC datetime.
+    """
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} is throttled for another {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+        self.retry_at = datetime.now(timezone.utc) + timedelta(seconds=retry_after)
+
+    def __reduce__(self):
+        return type(self), (self.host, self.retry_after)
+
+
+def _host(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def _parse_rates(spec: str) -> Dict[str, float]:
+    rates = {}
+    for part in spec.split(","):
+        host, _, rate = part.strip().partition("=")
+        if host and rate:
+            try:
+                rates[host.lower()] = float(rate)
+            except ValueError:
+                logger.warning("Ignoring invalid HTTP_HOST_RATES entry %r", part)
+    return rates
+
+
+def retry_after_seconds(resp: httpx.Response) -> float:
+    """Retry-After of a response in seconds (delta or HTTP date), DEFAULT_RETRY_AFTER when absent."""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return DEFAULT_RETRY_AFTER
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class TokenBucket:
+    """Token bucket with reservation: reserve() takes a token (possibly borrowing from the future) and returns
+    how long the caller has to wait before using it, so concurrent callers are spaced 1/rate apart."""
+
+    def __init__(self, rate: float, burst: int):
+        self.base_rate = self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._stamp = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, max_wait: Optional[float] = None) -> float:
+        """Take a token and return the wait before using it. A wait above max_wait is returned without taking
+        the token: the caller must not send the request then."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            wait = max(wait, self._blocked_until - now)
+            if max_wait is not None and wait > max_wait:
+                self._tokens += 1
+            return wait
+
+    def throttle(self, seconds: float) -> None:
+        """The host answered 429/503: pause it for `seconds` and halve its rate."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._blocked_until = max(self._blocked_until, now + seconds)
+            self.rate = max(self.rate / 2, MIN_HOST_RATE)
+            self._tokens = min(self._tokens, 0.0)
+
+    def recover(self) -> None:
+        if self.rate < self.base_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.base_rate, self.rate + self.base_rate / 10)
+
+    def limit(self, rate: float) -> None:
+        """Cap the rate (e.g. robots.txt Crawl-delay)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.base_rate = min(self.base_rate, rate)
+            self.rate = min(self.rate, self.base_rate)
+
+
+class HostLimiter:
+    """One TokenBucket per host. wait()/wait_async() raise HostThrottled instead of waiting longer than max_wait."""
+
+    def __init__(
+        self,
+        rate: float = HOST_RATE,
+        burst: int = HOST_BURST,
+        overrides: Optional[Mapping[str, float]] = None,
+        max_wait: float = HOST_MAX_WAIT,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.overrides = dict(_parse_rates(HOST_RATES) if overrides is None else overrides)
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url: str) -> TokenBucket:
+        host = _host(url)
+        b = self._buckets.get(host)
+        if b is None:
+            with self._lock:
+                b = self._buckets.get(host)
+                if b is None:
+                    b = self._buckets[host] = TokenBucket(self.overrides.get(host, self.rate), self.burst)
+        return b
+
+    def _reserve(self, url: str) -> float:
+        delay = self.bucket(url).reserve(self.max_wait)
+        if delay > self.max_wait:
+            raise HostThrottled(_host(url), delay)
+        return delay
+
+    def wait(self, url: str) -> None:
+        delay = self._reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url: str) -> None:
+        delay = self._reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def observe(self, url: str, resp: httpx.Response) -> None:
+        if resp.status_code in (429, 503):
+            delay = retry_after_seconds(resp)
+            logger.warning("%s answered %d, pausing the host for %.0fs", _host(url), resp.status_code, delay)
+            self.bucket(url).throttle(delay)
+        else:
+            self.bucket(url).recover()
+
+
+class RobotsCache:
+    """TTL cache of parsed robots.txt per origin (scheme://host:port). None stands for "allow everything"."""
+
+    def __init__(self, user_agent: str = USER_AGENT, ttl: float = ROBOTS_TTL, error_ttl: float = ROBOTS_ERROR_TTL):
+        self.user_agent = user_agent
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self._entries: Dict[str, Tuple[Optional[RobotFileParser], float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        # origin -> in-flight async fetch, so concurrent downloads from one host share a single request
+        self.pending: Dict[str, "asyncio.Future"] = {}
+
+    @staticmethod
+    def origin(url: str) -> str:
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def cached(self, origin: str):
+        entry = self._entries.get(origin)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry
+        return None
+
+    def store(self, origin: str, status: Optional[int], text: str = "") -> Tuple[Optional[RobotFileParser], float]:
+        """Cache the outcome of fetching origin/robots.txt (status None: network error)."""
+        if status is not None and 200 <= status < 300:
+            parser = RobotFileParser()
+            parser.parse(text.splitlines())
+            parser.modified()
+            entry = (parser, time.monotonic() + self.ttl)
+        elif status is not None and 400 <= status < 500:
+            entry = (None, time.monotonic() + self.ttl)
+        else:
+            entry = (None, time.monotonic() + self.error_ttl)
+        self._entries[origin] = entry
+        return entry
+
+    def origin_lock(self, origin: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(origin, threading.Lock())
+
+    def allowed(self, parser: Optional[RobotFileParser], url: str) -> bool:
+        return parser is None or parser.can_fetch(self.user_agent, url)
+
+    def crawl_delay(self, parser: Optional[RobotFileParser]) -> Optional[float]:
+        if parser is None:
+            return None
+        delay = parser.crawl_delay(self.user_agent)
+        rate = parser.request_rate(self.user_agent)
+        if rate is not None and rate.requests:
+            delay = max(delay or 0.0, rate.seconds / rate.requests)
+        return float(delay) if delay else None
+
+
+class PoliteHttpClient:
+    """Pooled HTTP client with per-host rate limits and robots.txt checks (see module docstring).
+
+    Usage:
+        resp = http_client.get(url, headers={...})              # blocking
+        async with http_client.new_async_client() as client:    # asyncio
+            await http_client.prepare_async(client, url)
+            resp = await client.get(url)
+            http_client.observe(url, resp)
+    """
+
+    def __init__(
+        self,
+        limiter: Optional[HostLimiter] = None,
+        robots: Optional[RobotsCache] = None,
+        respect_robots: bool = RESPECT_ROBOTS,
+        user_agent: str = USER_AGENT,
+        max_connections: int = FETCH_CONCURRENCY,
+        timeout: float = FETCH_TIMEOUT,
+    ):
+        self.limiter = limiter or HostLimiter()
+        self.robots = robots or RobotsCache(user_agent)
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client: Optional[httpx.Client] = None
+        self._client_lock = threading.Lock()
+
+    def _client_options(self, max_connections: int) -> dict:
+        return {
+            "follow_redirects": True,
+            "headers": {"User-Agent": self.user_agent},
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        """The shared blocking client (httpx.Client is safe to share between threads)."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = httpx.Client(**self._client_options(self.max_connections))
+        return self._client
+
+    def new_async_client(self, max_connections: Optional[int] = None) -> httpx.AsyncClient:
+        """An AsyncClient with the same settings; async clients are bound to one event loop, the caller closes it."""
+        return httpx.AsyncClient(**self._client_options(max_connections or self.max_connections))
+
+    def close(self) -> None:
+        with self._client_lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    # --- robots.txt ---
+
+    def _apply_robots(self, url: str, entry: Tuple[Optional[RobotFileParser], float], fresh: bool) -> None:
+        parser = entry[0]
+        if fresh:
+            delay = self.robots.crawl_delay(parser)
+            if delay:
+                self.limiter.bucket(url).limit(1.0 / delay)
+        if not self.robots.allowed(parser, url):
+            raise RobotsDisallowed(url, max(entry[1] - time.monotonic(), 1.0))
+
+    def check_robots(self, url: str) -> None:
+        """Raise RobotsDisallowed when robots.txt forbids url (blocking; fetches robots.txt when not cached)."""
+        origin = self.robots.origin(url)
+        entry = self.robots.cached(origin)
+        fresh = False
+        if entry is None:
+            with self.robots.origin_lock(origin):
+                entry = self.robots.cached(origin)
+                if entry is None:
+                    self.limiter.wait(url)
+                    try:
+                        resp = self.client.get(origin + "/robots.txt", timeout=ROBOTS_TIMEOUT)
+                        entry = self.robots.store(origin, resp.status_code, resp.text)
+                    except httpx.HTTPError as e:
+                        logger.info("Could not read %s/robots.txt: %s", origin, e)
+                        entry = self.robots.store(origin, None)
+                    fresh = True
+        self._apply_robots(url, entry, fresh)
+
+    async def check_robots_async(self, client: httpx.AsyncClient, url: str) -> None:
+        origin = self.robots.origin(url)
+        entry = self.robots.cached(origin)
+        fresh = False
+        if entry is None:
+            loop = asyncio.get_running_loop()
+            pending = self.robots.pending.get(origin)
+            if pending is not None and pending.get_loop() is loop:
+                entry = await asyncio.shield(pending)
+            else:
+                fut = self.robots.pending[origin] = loop.create_future()
+                try:
+                    await self.limiter.wait_async(url)
+                    try:
+                        resp = await client.get(origin + "/robots.txt", timeout=ROBOTS_TIMEOUT)
+                        entry = self.robots.store(origin, resp.status_code, resp.text)
+                    except httpx.HTTPError as e:
+                        logger.info("Could not read %s/robots.txt: %s", origin, e)
+                        entry = self.robots.store(origin, None)
+                    fut.set_result(entry)
+                    fresh = True
+                except Exception as e:
+                    # e.g. HostThrottled: downloads waiting for this robots.txt fail the same way
+                    fut.set_exception(e)
+                    fut.exception()
+                    raise
+                finally:
+                    if not fut.done():
+                        fut.cancel()
+                    self.robots.pending.pop(origin, None)
+        self._apply_robots(url, entry, fresh)
+
+    # --- requests ---
+
+    def prepare(self, url: str, respect_robots: bool = True) -> None:
+        """Check robots.txt and wait for the host's rate limit before requesting url.
+
+        Raises RobotsDisallowed, or HostThrottled when the host is not available within limiter.max_wait.
+        """
+        if respect_robots and self.respect_robots:
+            self.check_robots(url)
+        self.limiter.wait(url)
+
+    async def prepare_async(self, client: httpx.AsyncClient, url: str, respect_robots: bool = True) -> None:
+        if respect_robots and self.respect_robots:
+            await self.check_robots_async(client, url)
+        await self.limiter.wait_async(url)
+
+    def observe(self, url: str, resp: httpx.Response) -> None:
+        """Feed a response back to the host's rate limiter (429/503 throttle the host)."""
+        self.limiter.observe(url, resp)
+
+    def get(self, url: str, headers: Optional[Mapping[str, str]] = None, timeout: Optional[float] = None, respect_robots: bool = True) -> httpx.Response:
+        """Rate-limited, robots-checked GET with the shared client. Raises RobotsDisallowed / HostThrottled / httpx errors."""
+        self.prepare(url, respect_robots)
+        resp = self.client.get(url, headers=headers, timeout=timeout or self.timeout)
+        self.observe(url, resp)
+        return resp
+
+
+# shared by every source in the process
+http_client = PoliteHttpClient()
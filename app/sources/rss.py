@@ -1,31 +1,134 @@
-from typing import Iterable
-from datetime import timezone
+from typing import Callable, Iterable, List, Tuple
+from datetime import datetime, timezone
+import hashlib
 
-from bs4 import BeautifulSoup
 from dateutil import parser as dateparser
 import feedparser
 
 from app.sources.base import BaseSource, FetchedItem
+from app.sources.http_client import PoliteHttpClient
+from app.sources.url_canonical import canonical_entry_url
+from app.utils.html_text import html_to_text
 
 
 def _clean_html(html: str) -> str:
-    soup = BeautifulSoup(html or "", "lxml")
-    # remove scripts/styles
-    for s in soup(["script", "style"]):
-        s.decompose()
-    # 不传参数给 get_text，避免类型检查器误报；之后合并空白
-    text = soup.get_text().strip()
-    return " ".join(text.split())
+    # 去掉 script/style 后提取纯文本并合并空白（流式解析，不再构建 BeautifulSoup 树）
+    return html_to_text(html)
+
+
+def _entry_key(e) -> str | None:
+    return e.get("id") or e.get("link")
+
+
+def _entry_digest(e) -> str:
+    """对条目的原始字段做一次廉价哈希，用于判断条目自上次入库后是否变化。"""
+    h = hashlib.blake2b(digest_size=16)
+    for field in ("link", "title", "summary", "published", "updated"):
+        h.update(str(e.get(field) or "").encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _entry_timestamp(e) -> datetime | None:
+    # feedparser 已经把日期解析成 UTC struct_time，这里直接使用，不必再跑 dateparser
+    parsed = e.get("published_parsed") or e.get("updated_parsed")
+    if not parsed:
+        return None
+    try:
+        return datetime(*parsed[:6], tzinfo=timezone.utc)
+    except Exception:
+        return None
+
+
+def _as_utc(dt: datetime | None) -> datetime | None:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
 
 
 class RSSSource(BaseSource):
-    def __init__(self, name: str, url: str):
-        super().__init__(name, url)
+    def __init__(
+        self,
+        name: str,
+        url: str,
+        etag: str | None = None,
+        modified: str | None = None,
+        is_known: Callable[[str | None, str], bool] | None = None,
+        hwm_published_at: datetime | None = None,
+        hwm_entry_id: str | None = None,
+        stop_after_seen: int | None = None,
+        http: PoliteHttpClient | None = None,
+        respect_robots: bool = True,
+    ):
+        super().__init__(name, url, http)
+        self.respect_robots = respect_robots
+        # 条件请求校验器：构造时传入上次保存的值，fetch() 之后更新为服务端最新返回的值
+        self.etag = etag
+        self.modified = modified
+        self.not_modified = False
+        # is_known(entry_key, entry_digest) 返回 True 的条目视为已入库且未变化，直接跳过解析/清洗
+        self.is_known = is_known
+        self.skipped = 0
+        # 统计：feed 中读取的条目数、本次下载的字节数（data 由调用方传入时为 0）
+        self.entries = 0
+        self.bytes_fetched = 0
+        # 增量模式：高水位（已见过的最新发布时间 / 条目 id）。连续 stop_after_seen 个已见条目后停止解析；
+        # stop_after_seen 为 None 或 0 时解析全部条目（全量同步）
+        self.hwm_published_at = _as_utc(hwm_published_at)
+        self.hwm_entry_id = hwm_entry_id
+        self.stop_after_seen = stop_after_seen
+        self.stopped_early = False
+        # fetch() 过程中读到的条目 (entry_key, 时间, 是否已入库)，由 high_water_mark() 计算新的高水位
+        self._observed: List[Tuple[str | None, datetime | None, bool]] = []
 
-    def fetch(self) -> Iterable[FetchedItem]:
-        """从 RSS/Atom feed 拉取并产生 FetchedItem（不做持久化）。"""
-        feed = feedparser.parse(self.base_url)
+    def fetch(self, data: bytes | None = None) -> Iterable[FetchedItem]:
+        """从 RSS/Atom feed 拉取并产生 FetchedItem（不做持久化）。
+
+        data: 已下载好的 feed 内容（例如由 AsyncFeedFetcher 并发下载）；为 None 时通过 self.http（共享连接池、
+        按 host 限速、遵守 robots.txt）请求 base_url，并带上 If-None-Match / If-Modified-Since，下载后交给 feedparser 解析。
+        服务端返回 304 时不产生任何条目，且 self.not_modified 为 True；其它 HTTP 错误抛出 httpx.HTTPStatusError。
+        """
+        if data is not None:
+            feed = feedparser.parse(data)
+        else:
+            headers = {}
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.modified:
+                headers["If-Modified-Since"] = self.modified
+            resp = self.http.get(self.base_url, headers=headers, respect_robots=self.respect_robots)
+            if resp.status_code == 304:
+                self.not_modified = True
+                return
+            resp.raise_for_status()
+            self.bytes_fetched = len(resp.content)
+            self.etag = resp.headers.get("ETag") or self.etag
+            self.modified = resp.headers.get("Last-Modified") or self.modified
+            # content-type 用于编码识别，content-location 用于解析相对链接（与 feedparser 自行请求时一致）
+            feed = feedparser.parse(resp.content, response_headers={
+                "content-type": resp.headers.get("Content-Type", ""),
+                "content-location": str(resp.url),
+            })
+        seen_run = 0
         for e in feed.entries:
+            self.entries += 1
+            entry_key = _entry_key(e)
+            entry_digest = _entry_digest(e)
+            entry_ts = _entry_timestamp(e)
+            known = self.is_known is not None and self.is_known(entry_key, entry_digest)
+            self._observed.append((entry_key, entry_ts, known))
+            if known or self._below_high_water_mark(entry_key, entry_ts):
+                seen_run += 1
+                if self.stop_after_seen and seen_run >= self.stop_after_seen:
+                    self.stopped_early = True
+                    if known:
+                        self.skipped += 1
+                    break
+            else:
+                seen_run = 0
+            if known:
+                self.skipped += 1
+                continue
             url = e.get("link")
             title = e.get("title", "")
             published = e.get("published") or e.get("updated") or e.get("published_parsed")
@@ -53,16 +156,75 @@ class RSSSource(BaseSource):
             content = _clean_html(raw_content)
             yield FetchedItem(
                 url=url,
+                canonical_url=canonical_entry_url(url, e.get("links"), e.get("feedburner_origlink")),
                 title=title,
                 content=content,
                 raw_content=raw_content,
                 authors=authors,
                 source=self.name,
                 published_date=published_date,
-                meta={}
+                meta={"entry_id": entry_key, "entry_hash": entry_digest},
             )
 
 
+    def high_water_mark(self, saved_keys: Iterable[str | None] = ()) -> Tuple[datetime | None, str | None]:
+        """本次运行可以推进到的高水位 (published_at, entry_id)。
+
+        只考虑确实已入库的条目：跳过的已知条目，以及 saved_keys（调用方写入成功的条目 entry_id）中的条目。
+        没能入库的条目不能被高水位越过，否则之后的运行会把它计入 stop_after_seen 而永远跳过。
+        """
+        saved = set(saved_keys)
+        newest_ts: datetime | None = None
+        newest_id: str | None = None
+        for key, ts, known in self._observed:
+            if not known and key not in saved:
+                continue
+            if ts is not None and (newest_ts is None or ts > newest_ts):
+                newest_ts, newest_id = ts, key
+            elif newest_id is None and newest_ts is None:
+                # 没有日期的 feed：以第一个条目（通常最新）作为高水位 id
+                newest_id = key
+        return newest_ts, newest_id
+
+    def _below_high_water_mark(self, entry_key: str | None, entry_ts: datetime | None) -> bool:
+        """条目是否不新于上次的高水位。仅用于提前停止的计数：未变化的条目才会被跳过，
+        高水位以下但内容有变化的旧条目仍会被处理（最多 stop_after_seen 个）。"""
+        if self.hwm_entry_id and entry_key == self.hwm_entry_id:
+            return True
+        return entry_ts is not None and self.hwm_published_at is not None and entry_ts <= self.hwm_published_at
+
+
+def parse_feed_entries(
+    name: str,
+    url: str,
+    data: bytes,
+    known: frozenset | None = None,
+    hwm_published_at: datetime | None = None,
+    hwm_entry_id: str | None = None,
+    stop_after_seen: int | None = None,
+) -> Tuple[List[FetchedItem], RSSSource]:
+    """解析已下载的 feed 内容，返回 (FetchedItem 列表, 解析后的 RSSSource)。
+
+    模块级函数，便于在 ProcessPoolExecutor 中执行；known 为已入库条目的 (entry_key, entry_digest) 集合快照。
+    返回的 RSSSource 携带 skipped / stopped_early 等统计，写入阶段用它的 high_water_mark() 推进高水位。
+    """
+    is_known = None
+    if known:
+        def is_known(key, digest):
+            return (key, digest) in known
+    rss = RSSSource(
+        name, url,
+        is_known=is_known,
+        hwm_published_at=hwm_published_at,
+        hwm_entry_id=hwm_entry_id,
+        stop_after_seen=stop_after_seen,
+    )
+    items = list(rss.fetch(data))
+    # 本地函数无法 pickle，返回前移除
+    rss.is_known = None
+    return items, rss
+
+
 if __name__ == '__main__':
     rss_source = RSSSource("IT之家", "https://www.ithome.com/rss")
     fetch_items_list = [item for item in rss_source.fetch()]
@@ -0,0 +1,93 @@
+"""URL canonicalization for item dedupe.
+
+The same article reaches us under many spellings: tracking parameters (utm_*, fbclid, ...), upper-case
+hosts, default ports, fragments, a trailing slash or not. canonicalize_url() maps them to one string,
+which FetchedItemRepository hashes into the unique items.canonical_url_hash index. When the publisher
+names the canonical address itself (a rel="canonical" link on the entry, or FeedBurner's origLink),
+canonical_entry_url() prefers it over the entry link.
+
+The canonical URL is only a dedupe key: items keep their original url for display and linking. It is
+deliberately conservative, since two pages mapped to one key would be merged: only parameters that are
+known to be tracking-only are dropped (generic names like "ref" or "from" select content on some sites),
+and percent-escapes of reserved characters ("%2F" in a path segment) are kept.
+"""
+import re
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+# query parameters that only identify the campaign/click, never the resource
+TRACKING_PARAMS = frozenset({
+    "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_hsenc", "_hsmi", "mkt_tok", "oly_anon_id", "oly_enc_id", "vero_id",
+    "_ga", "_gl", "ref_src", "spm", "scm", "isappinstalled", "wt.mc_id",
+})
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hmsr", "hmpl", "hmcu", "hmkw", "hmci")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# characters left unescaped when quoting paths (RFC 3986 reserved + unreserved, and existing escapes)
+_PATH_SAFE = "/:@!$&'()*+,;=-._~%"
+_UNRESERVED = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-._~")
+_ESCAPE_RE = re.compile(r"%([0-9A-Fa-f]{2})")
+_BARE_PERCENT_RE = re.compile(r"%(?![0-9A-Fa-f]{2})")
+
+
+def _is_tracking(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def _normalize_path(path: str) -> str:
+    """RFC 3986 6.2.2 normalization: escapes of unreserved characters decoded, other escapes upper-cased and
+    kept (so "/a%2Fb" stays distinct from "/a/b"), characters that need it (non-ASCII, spaces) escaped."""
+    path = quote(_BARE_PERCENT_RE.sub("%25", path), safe=_PATH_SAFE)
+
+    def unescape(m: "re.Match[str]") -> str:
+        char = chr(int(m.group(1), 16))
+        return char if char in _UNRESERVED else "%" + m.group(1).upper()
+
+    return _ESCAPE_RE.sub(unescape, path)
+
+
+def canonicalize_url(url: Optional[str]) -> Optional[str]:
+    """Return the canonical form of an absolute http(s) URL; other values are returned stripped.
+
+    - scheme and host lower-cased, IDN hosts as punycode, default ports and userinfo dropped, http -> https
+    - fragment and tracking parameters removed, remaining parameters sorted
+    - path percent-encoding normalized (reserved escapes kept), "//" collapsed, trailing slash removed (except for "/")
+    """
+    if url is None:
+        return None
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+    host = parts.hostname.rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    if port is not None and port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+    path = _normalize_path(parts.path)
+    while "//" in path:
+        path = path.replace("//", "/")
+    if len(path) > 1:
+        path = path.rstrip("/")
+    path = path or "/"
+    params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k)]
+    query = urlencode(sorted(params), doseq=True)
+    # the same resource is served over both schemes by virtually every publisher
+    return urlunsplit(("https", host.lower(), path, query, ""))
+
+
+def canonical_entry_url(link: Optional[str], links: Iterable[dict] = (), origlink: Optional[str] = None) -> Optional[str]:
+    """Canonical URL of a feed entry: a rel="canonical" link, else FeedBurner's origLink, else the entry link."""
+    for candidate in links or ():
+        if (candidate.get("rel") or "").lower() == "canonical" and candidate.get("href"):
+            return canonicalize_url(candidate["href"])
+    return canonicalize_url(origlink or link)
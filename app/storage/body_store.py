@@ -0,0 +1,256 @@
+"""Optional zstd compression of items.raw_content.
+
+raw_content is the original feed HTML and is only read by the detail view, yet it is stored next to the
+cleaned content and roughly doubles the size of the items table. With BODY_COMPRESSION=zstd (and the
+zstandard package installed) new items store it compressed in items.raw_content_z instead, and
+Item.to_dict() decompresses it transparently. content, title and summary stay plain: search, lists and
+near-duplicate detection read them directly.
+
+Feed bodies are small and repetitive per source (the same markup, boilerplate and footer in every
+entry), which is exactly what zstd dictionaries are for. train() builds a dictionary from a source's
+stored bodies and saves it in body_dictionaries; later items of that source are compressed with the
+newest dictionary, and every compressed row keeps the id of the dictionary it needs (dictionaries are
+never modified). Sources without a dictionary are compressed without one.
+
+On a database created before compression existed, the raw_content_z / body_dict_id columns are added by
+app.storage.migrations (init_db runs it; `python -m app.storage.migrations upgrade` does it by hand).
+Existing rows are then converted with the command line (run from the repository root):
+    python -m app.storage.body_store train [--source ID]                   # train per-source dictionaries
+    python -m app.storage.body_store backfill [--older-than-days N] [--train]
+benchmarks/body_store/bench_body_store.py reports bytes per item and decode latency on stored items.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from .db import get_session
+from .models import BodyDictionary, Item
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, only needed when compression is enabled
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# "zstd" compresses raw_content of new items; anything else (default) stores plain text
+BODY_COMPRESSION = os.getenv("BODY_COMPRESSION", "").lower()
+ZSTD_LEVEL = int(os.getenv("BODY_ZSTD_LEVEL", "9"))
+DICT_SIZE = int(os.getenv("BODY_DICT_SIZE", str(32 * 1024)))
+# a source needs this many stored bodies before a dictionary is worth training
+DICT_MIN_SAMPLES = 100
+DICT_MAX_SAMPLES = 2000
+# how often the ingest side looks for dictionaries trained by another process
+DICT_REFRESH_SECONDS = 300.0
+BACKFILL_CHUNK_SIZE = 500
+
+
+class BodyStore:
+    """Compresses/decompresses raw bodies, caching dictionaries and (per thread) zstd contexts.
+
+    enabled: compress in encode(); decode() always works when zstandard is installed
+    level: zstd compression level
+    """
+
+    def __init__(self, enabled: Optional[bool] = None, level: int = ZSTD_LEVEL):
+        if enabled is None:
+            enabled = BODY_COMPRESSION == "zstd"
+        if enabled and zstandard is None:
+            logger.warning("BODY_COMPRESSION=zstd but the zstandard package is not installed; storing plain text")
+            enabled = False
+        self.enabled = enabled
+        self.level = level
+        self._dicts: Dict[int, "zstandard.ZstdCompressionDict"] = {}
+        # source_id -> id of its newest dictionary
+        self._latest: Dict[str, int] = {}
+        self._latest_loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        # zstd contexts are not thread-safe: one compressor/decompressor per (thread, dictionary)
+        self._local = threading.local()
+
+    # --- dictionaries ---
+
+    def _dictionary(self, dict_id: int) -> "zstandard.ZstdCompressionDict":
+        d = self._dicts.get(dict_id)
+        if d is None:
+            with get_session() as session:
+                data = session.execute(select(BodyDictionary.data).where(BodyDictionary.id == dict_id)).scalar_one()
+            d = zstandard.ZstdCompressionDict(data)
+            self._dicts[dict_id] = d
+        return d
+
+    async def load_dictionaries_async(self, session, dict_ids: Iterable[Optional[int]]) -> None:
+        """Load the dictionaries among dict_ids that are not cached yet through an AsyncSession.
+
+        decode() loads a missing dictionary with a synchronous query, which must not run on the API's
+        event loop: async readers call this first (see AsyncFetchedItemRepository.get).
+        """
+        missing = {d for d in dict_ids if d is not None and d not in self._dicts}
+        if not missing or zstandard is None:
+            return
+        rows = (await session.execute(
+            select(BodyDictionary.id, BodyDictionary.data).where(BodyDictionary.id.in_(missing))
+        )).all()
+        for dict_id, data in rows:
+            self._dicts[dict_id] = zstandard.ZstdCompressionDict(data)
+
+    def _latest_dict_id(self, source_id: Optional[str]) -> Optional[int]:
+        if not source_id:
+            return None
+        loaded_at = self._latest_loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= DICT_REFRESH_SECONDS:
+            with self._lock:
+                with get_session() as session:
+                    rows = session.execute(select(BodyDictionary.id, BodyDictionary.source_id).order_by(BodyDictionary.id)).all()
+                self._latest = {sid: did for did, sid in rows if sid}
+                self._latest_loaded_at = time.monotonic()
+        return self._latest.get(source_id)
+
+    def _compressor(self, dict_id: Optional[int]) -> "zstandard.ZstdCompressor":
+        cache = self._local.__dict__.setdefault("compressors", {})
+        c = cache.get(dict_id)
+        if c is None:
+            d = self._dictionary(dict_id) if dict_id is not None else None
+            c = cache[dict_id] = zstandard.ZstdCompressor(level=self.level, dict_data=d)
+        return c
+
+    def _decompressor(self, dict_id: Optional[int]) -> "zstandard.ZstdDecompressor":
+        cache = self._local.__dict__.setdefault("decompressors", {})
+        c = cache.get(dict_id)
+        if c is None:
+            d = self._dictionary(dict_id) if dict_id is not None else None
+            c = cache[dict_id] = zstandard.ZstdDecompressor(dict_data=d)
+        return c
+
+    # --- encode / decode ---
+
+    def encode(self, source_id: Optional[str], text: Optional[str]) -> Tuple[Optional[str], Optional[bytes], Optional[int]]:
+        """Return the (raw_content, raw_content_z, body_dict_id) column values for a raw body."""
+        if not self.enabled or not text:
+            return text, None, None
+        dict_id = self._latest_dict_id(source_id)
+        return None, self._compressor(dict_id).compress(text.encode("utf-8")), dict_id
+
+    def decode(self, blob: Optional[bytes], dict_id: Optional[int]) -> Optional[str]:
+        if blob is None:
+            return None
+        if zstandard is None:
+            raise RuntimeError("items.raw_content_z is compressed but the zstandard package is not installed")
+        return self._decompressor(dict_id).decompress(blob).decode("utf-8")
+
+    def apply(self, values: dict) -> None:
+        """Replace values["raw_content"] of an items row dict by its encoded columns (in place)."""
+        values["raw_content"], values["raw_content_z"], values["body_dict_id"] = self.encode(
+            values.get("source_id"), values.get("raw_content")
+        )
+
+    # --- maintenance ---
+
+    def train(self, source_id: str, samples: Optional[List[bytes]] = None) -> Optional[int]:
+        """Train and store a dictionary for source_id from samples (default: its newest stored bodies).
+
+        Returns the new dictionary id, or None when there are fewer than DICT_MIN_SAMPLES samples.
+        """
+        if zstandard is None:
+            raise RuntimeError("training dictionaries needs the zstandard package")
+        if samples is None:
+            with get_session() as session:
+                rows = session.execute(
+                    select(Item.raw_content, Item.raw_content_z, Item.body_dict_id)
+                    .where(Item.source_id == source_id, (Item.raw_content.is_not(None)) | (Item.raw_content_z.is_not(None)))
+                    .order_by(Item.fetched_at.desc())
+                    .limit(DICT_MAX_SAMPLES)
+                ).all()
+            samples = [
+                (raw if raw is not None else self.decode(blob, dict_id)).encode("utf-8")
+                for raw, blob, dict_id in rows
+            ]
+        samples = [s for s in samples if s]
+        if len(samples) < DICT_MIN_SAMPLES:
+            return None
+        d = zstandard.train_dictionary(DICT_SIZE, samples, level=self.level)
+        with get_session() as session:
+            row = BodyDictionary(source_id=source_id, data=d.as_bytes(), sample_count=len(samples))
+            session.add(row)
+            session.flush()
+            dict_id = row.id
+        self._dicts[dict_id] = d
+        with self._lock:
+            self._latest[source_id] = dict_id
+        logger.info("Trained %d byte dictionary %d for source %s from %d bodies", len(d.as_bytes()), dict_id, source_id, len(samples))
+        return dict_id
+
+    def backfill(self, older_than_days: Optional[float] = None, source_id: Optional[str] = None, chunk_size: int = BACKFILL_CHUNK_SIZE) -> Dict[str, int]:
+        """Compress the plain raw_content of stored items, chunk by chunk (one transaction per chunk).
+
+        older_than_days limits it to cold items (fetched before that age); source_id to one source.
+        Returns {"items", "plain_bytes", "compressed_bytes"}. On PostgreSQL the space is reused after
+        (auto)vacuum; run VACUUM FULL / pg_repack to return it to the operating system.
+        """
+        if not self.enabled:
+            raise RuntimeError("backfill needs BODY_COMPRESSION=zstd and the zstandard package")
+        clauses = [Item.raw_content.is_not(None)]
+        if older_than_days is not None:
+            clauses.append(Item.fetched_at < datetime.now(timezone.utc) - timedelta(days=older_than_days))
+        if source_id is not None:
+            clauses.append(Item.source_id == source_id)
+        stats = {"items": 0, "plain_bytes": 0, "compressed_bytes": 0}
+        last_id = ""
+        while True:
+            with get_session() as session:
+                chunk = session.execute(
+                    select(Item.id, Item.source_id, Item.raw_content)
+                    .where(Item.id > last_id, *clauses)
+                    .order_by(Item.id)
+                    .limit(chunk_size)
+                ).all()
+                if not chunk:
+                    break
+                rows = []
+                for item_id, sid, raw in chunk:
+                    values = {"id": item_id, "source_id": sid, "raw_content": raw}
+                    self.apply(values)
+                    del values["source_id"]
+                    rows.append(values)
+                    stats["plain_bytes"] += len(raw.encode("utf-8"))
+                    stats["compressed_bytes"] += len(values["raw_content_z"] or b"")
+                session.execute(update(Item), rows)
+                stats["items"] += len(rows)
+                last_id = chunk[-1].id
+            logger.info("Body backfill: %d items compressed", stats["items"])
+        return stats
+
+
+# shared by the item repository (ingest) and Item.to_dict (reads)
+body_store = BodyStore()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Maintain compressed item bodies")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_train = sub.add_parser("train", help="train a zstd dictionary per source")
+    p_train.add_argument("--source", help="only this source id")
+    p_backfill = sub.add_parser("backfill", help="compress the raw_content of stored items")
+    p_backfill.add_argument("--older-than-days", type=float, default=None)
+    p_backfill.add_argument("--source", help="only this source id")
+    p_backfill.add_argument("--train", action="store_true", help="train dictionaries first")
+    p_backfill.add_argument("--chunk-size", type=int, default=BACKFILL_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    store = BodyStore(enabled=True)
+    if args.command == "train" or args.train:
+        with get_session() as s:
+            source_ids = [args.source] if args.source else list(s.execute(select(Item.source_id).where(Item.source_id.is_not(None)).distinct()).scalars())
+        for sid in source_ids:
+            if store.train(sid) is None:
+                logger.info("Source %s has fewer than %d bodies, no dictionary trained", sid, DICT_MIN_SAMPLES)
+    if args.command == "backfill":
+        print(store.backfill(args.older_than_days, args.source, args.chunk_size))
@@ -1,9 +1,296 @@
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict, Any
 from datetime import datetime, timezone
+import base64
+import hashlib
+import json
 import uuid
 
-from .db import get_session
-from .models import Item
+from sqlalchemy import and_, case, false, func, null, or_, select, true, tuple_, union_all, update
+from sqlalchemy.orm import undefer_group
+
+from .body_store import body_store
+from .db import get_async_session, get_session
+from .models import Item, Source, utcnow
+from .near_duplicates import SIGNATURE_KEYS, assign_clusters, signature_values
+from .search import search_statement
+from app.utils.metrics import registry
+
+# rows per INSERT statement in upsert_many; keeps bound parameters well below driver limits
+UPSERT_CHUNK_SIZE = 500
+
+# ids per UPDATE in mark_read; keeps the IN list below driver parameter limits
+MARK_CHUNK_SIZE = 1000
+
+UPSERT_SECONDS = registry.histogram(
+    "item_upsert_duration_seconds", "Latency of FetchedItemRepository upserts (one call, including commit)", ("op",)
+)
+UPSERT_ROWS = registry.counter("item_upsert_rows_total", "Rows written by FetchedItemRepository upserts", ("op",))
+
+# length of Item.summary, precomputed at ingest so list pages never read content/raw_content
+SUMMARY_LENGTH = 200
+
+# feed order used by list/list_page; matches the ix_items_feed_order index in models
+FEED_ORDER = (Item.published_at.desc().nulls_last(), Item.fetched_at.desc(), Item.id.desc())
+
+
+def _url_key(data: dict) -> Tuple[Optional[str], Optional[str]]:
+    """(canonical_url, canonical_url_hash) of an item dict: canonical_url as computed by the source layer
+    (app.sources.url_canonical), or the plain url for callers that do not canonicalize."""
+    canonical_url = data.get("canonical_url") or data.get("url") or None
+    if not canonical_url:
+        return None, None
+    # fixed-size key for the unique index; URLs can exceed btree entry limits
+    return canonical_url, hashlib.sha256(canonical_url.encode("utf-8")).hexdigest()
+
+
+def _norm_title(title: Optional[str]) -> str:
+    return " ".join((title or "").split()).casefold()
+
+
+def _same_entry(stored_title: Optional[str], stored_meta: Optional[dict], data: dict) -> bool:
+    """Whether the stored item that owns data's canonical URL is the same entry as data.
+
+    Some feeds point several entries at one URL (the homepage, a landing page), so a URL match alone is
+    not enough: the entry ids (feed guids) must match, or the titles must. When the entry id is the link
+    itself (guid equal to the link, or no guid at all) the feed identifies its entries by URL, as the
+    seen cache does, and the URL match decides, so an edited title updates the stored row; entries
+    sharing a landing page URL are only told apart by guids of their own. Without a title on either side
+    there is nothing to tell the entries apart and the URL decides as well.
+    """
+    stored_id = (stored_meta or {}).get("entry_id")
+    new_id = (data.get("meta") or {}).get("entry_id")
+    if new_id and new_id == data.get("url"):
+        return True
+    if stored_id and stored_id == new_id:
+        return True
+    stored, new = _norm_title(stored_title), _norm_title(data.get("title"))
+    return not stored or not new or stored == new
+
+
+def make_summary(content: Optional[str]) -> Optional[str]:
+    """Summary stored in Item.summary: the first SUMMARY_LENGTH characters of the cleaned content."""
+    if content is None:
+        return None
+    return content[:SUMMARY_LENGTH]
+
+
+# columns loaded by list_page; content/raw_content stay in the database
+_SUMMARY_COLUMNS = (
+    Item.id,
+    Item.source_id,
+    Item.url,
+    Item.title,
+    # rows stored before the summary column existed fall back to a prefix computed by the database
+    func.coalesce(Item.summary, func.substr(Item.content, 1, SUMMARY_LENGTH)).label("summary"),
+    Item.published_at,
+    Item.fetched_at,
+    Item.is_read,
+    Item.is_starred,
+    Source.name.label("source_name"),
+)
+
+
+def encode_cursor(item: dict) -> str:
+    """Opaque pagination cursor pointing just after item (built from published_at, fetched_at, id)."""
+    published, fetched = item.get("published_at"), item.get("fetched_at")
+    raw = json.dumps({
+        "p": published.isoformat() if published else None,
+        "f": fetched.isoformat() if fetched else None,
+        "i": item.get("id"),
+    }, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], Optional[datetime], str]:
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        published = datetime.fromisoformat(data["p"]) if data.get("p") else None
+        fetched = datetime.fromisoformat(data["f"]) if data.get("f") else None
+        item_id = str(data["i"])
+    except Exception as e:
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    return published, fetched, item_id
+
+
+def _feed_filter():
+    """WHERE clause hiding near-duplicates: the feed shows one row per cluster (its head, see near_duplicates)."""
+    return Item.is_duplicate == false()
+
+
+def _status_filter(status: Optional[str]):
+    """WHERE clause for the reader status filter; "all" (or anything unknown) means no filter.
+
+    The unread/starred expressions are written exactly like the partial index predicates in models so
+    both PostgreSQL and SQLite pick those indexes.
+    """
+    if status == "unread":
+        return Item.is_read == false()
+    if status == "read":
+        return Item.is_read == true()
+    if status == "starred":
+        return Item.is_starred == true()
+    return None
+
+
+def _after_cursor(cursor: str) -> list:
+    """WHERE clauses, one per index range, selecting the rows that follow the cursor in FEED_ORDER.
+
+    Every clause is a row-value comparison on a prefix of the feed-order index, so each range is read
+    from the index in order and the scan stops at the page limit. A cursor on a dated row is followed by
+    the older dated rows and then by all undated ones (NULL published_at sorts last): two ranges, as an
+    OR of the two could not be read in index order and would sort everything after the cursor.
+    """
+    published, fetched, item_id = decode_cursor(cursor)
+    if published is not None:
+        return [
+            tuple_(Item.published_at, Item.fetched_at, Item.id) < tuple_(published, fetched, item_id),
+            Item.published_at.is_(None),
+        ]
+    return [and_(Item.published_at.is_(None), tuple_(Item.fetched_at, Item.id) < tuple_(fetched, item_id))]
+
+
+# --- statement builders shared by FetchedItemRepository and AsyncFetchedItemRepository ---
+
+
+def _get_stmt(item_id: str):
+    # detail view: load the deferred content/raw_content columns too
+    return select(Item).options(undefer_group("body")).where(Item.id == item_id)
+
+
+def _list_page_stmt(limit: int, cursor: Optional[str], offset: int, status: str):
+    stmt = select(*_SUMMARY_COLUMNS).outerjoin(Source, Source.id == Item.source_id).where(_feed_filter())
+    status_clause = _status_filter(status)
+    if status_clause is not None:
+        stmt = stmt.where(status_clause)
+    if not cursor:
+        if offset:
+            stmt = stmt.offset(offset)
+        return stmt.order_by(*FEED_ORDER).limit(limit)
+    ranges = _after_cursor(cursor)
+    if len(ranges) == 1:
+        return stmt.where(ranges[0]).order_by(*FEED_ORDER).limit(limit)
+    # at most one page from each range, merged
+    pages = [select(stmt.where(r).order_by(*FEED_ORDER).limit(limit).subquery()) for r in ranges]
+    merged = union_all(*pages).subquery("page")
+    return (
+        select(merged)
+        .order_by(merged.c.published_at.desc().nulls_last(), merged.c.fetched_at.desc(), merged.c.id.desc())
+        .limit(limit)
+    )
+
+
+def _page_result(rows, limit: int) -> Tuple[List[dict], Optional[str]]:
+    items = [dict(r._mapping) for r in rows]
+    next_cursor = encode_cursor(items[-1]) if items and len(items) == limit else None
+    return items, next_cursor
+
+
+def _search_stmt(
+    dialect: str,
+    q: str,
+    limit: int,
+    offset: int,
+    source_id: Optional[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    status: str,
+):
+    where = [_feed_filter()]
+    status_clause = _status_filter(status)
+    if status_clause is not None:
+        where.append(status_clause)
+    if source_id:
+        where.append(Item.source_id == source_id)
+    item_time = func.coalesce(Item.published_at, Item.fetched_at)
+    if since is not None:
+        where.append(item_time >= since)
+    if until is not None:
+        where.append(item_time < until)
+    stmt = search_statement(dialect, q, _SUMMARY_COLUMNS, where)
+    return stmt.outerjoin(Source, Source.id == Item.source_id).offset(offset).limit(limit)
+
+
+def _count_stmts() -> Dict[str, Any]:
+    return {
+        "total": select(func.count(Item.id)).where(_feed_filter()),
+        "unread": select(func.count(Item.id)).where(_status_filter("unread"), _feed_filter()),
+        "starred": select(func.count(Item.id)).where(_status_filter("starred"), _feed_filter()),
+    }
+
+
+def _cluster_stmt(item_id: str):
+    """Other members of item_id's near-duplicate cluster (head included), in feed order."""
+    cluster = select(Item.cluster_id).where(Item.id == item_id).scalar_subquery()
+    return (
+        select(*_SUMMARY_COLUMNS)
+        .outerjoin(Source, Source.id == Item.source_id)
+        .where(Item.cluster_id == cluster, Item.id != item_id)
+        .order_by(*FEED_ORDER)
+    )
+
+
+def _duplicate_ids_stmt(ids: List[str]):
+    return select(Item.id).where(Item.id.in_(ids), Item.is_duplicate == true())
+
+
+def _version_stmt():
+    # every insert/update bumps updated_at (indexed), so its maximum changes whenever any item changes
+    return select(func.max(Item.updated_at))
+
+
+def _item_version_stmt(item_id: str):
+    return select(Item.updated_at).where(Item.id == item_id)
+
+
+def _created_since_stmt(since: Optional[datetime], limit: int):
+    """Feed rows created after since (all rows when None), oldest first. Every new row has
+    updated_at >= created_at, so the range on the indexed updated_at limits the scan to recently
+    written rows."""
+    stmt = select(*_SUMMARY_COLUMNS, Item.created_at).outerjoin(Source, Source.id == Item.source_id)
+    if since is not None:
+        stmt = stmt.where(Item.updated_at > since, Item.created_at > since)
+    return stmt.where(_feed_filter()).order_by(Item.created_at, Item.id).limit(limit)
+
+
+def _version_token(value) -> str:
+    return value.isoformat() if value is not None else ""
+
+
+def _update_flags_stmt(item_id: str, fields: dict):
+    """UPDATE for update_flags, or None when fields contains nothing that may be changed."""
+    allowed = {"is_read", "is_starred"}
+    to_set = {k: bool(v) for k, v in fields.items() if k in allowed}
+    if not to_set:
+        return None
+    return update(Item).where(Item.id == item_id).values(**to_set, updated_at=utcnow())
+
+
+def _mark_read_stmts(
+    ids: Optional[List[str]],
+    before: Optional[datetime],
+    source_id: Optional[str],
+    all_items: bool,
+    is_read: bool,
+) -> list:
+    if ids is None and before is None and source_id is None and not all_items:
+        raise ValueError("mark_read needs ids, before, source_id or all_items=True")
+    target = bool(is_read)
+    clauses = [Item.is_read == (true() if not target else false())]
+    if before is not None:
+        # coalesce(published_at, fetched_at) < before, spelled as two ranges the feed-order indexes can serve
+        clauses.append(or_(Item.published_at < before, and_(Item.published_at.is_(None), Item.fetched_at < before)))
+    if source_id is not None:
+        clauses.append(Item.source_id == source_id)
+    stmt = update(Item).values(is_read=target, updated_at=utcnow())
+    if ids is None:
+        return [stmt.where(*clauses)]
+    unique_ids = list(dict.fromkeys(ids))
+    return [
+        stmt.where(Item.id.in_(unique_ids[start:start + MARK_CHUNK_SIZE]), *clauses)
+        for start in range(0, len(unique_ids), MARK_CHUNK_SIZE)
+    ]
 
 
 class FetchedItemRepository:
@@ -18,59 +305,97 @@ class FetchedItemRepository:
         self._session = session
 
     def upsert_by_fingerprint(self, fingerprint: Optional[str], data: dict) -> Tuple[str, bool]:
-        """Insert a new item or update an existing one based on fingerprint.
+        """Insert a new item or update an existing one.
+
+        The existing row is looked up by canonical URL first (see _url_key), then by fingerprint, so an
+        edited entry (new fingerprint, same URL) updates its row instead of creating a new one. A row found
+        by URL is only used when it is the same entry (_same_entry: same guid or title); otherwise the URL
+        belongs to another entry, the lookup falls back to the fingerprint and this item is stored without
+        a canonical_url_hash.
 
         Args:
             fingerprint: content fingerprint or None
-            data: dict with keys: url, title, content, raw_content, authors (list), source (name or id),
-                  published_date (datetime), meta (dict), source_id (optional)
+            data: dict with keys: url, canonical_url (optional, defaults to url), title, content, raw_content,
+                  authors (list), source (name or id), published_date (datetime), meta (dict), source_id (optional)
 
         Returns:
             (item_id, created) - created True if a new DB row was created.
         """
-        # prefer using the context-managed session if none provided
-        if self._session is None:
-            with get_session() as session:
-                return self._upsert(session, fingerprint, data)
-        else:
-            return self._upsert(self._session, fingerprint, data)
+        UPSERT_ROWS.inc(op="single")
+        with UPSERT_SECONDS.time(op="single"):
+            # prefer using the context-managed session if none provided
+            if self._session is None:
+                with get_session() as session:
+                    return self._upsert(session, fingerprint, data)
+            else:
+                return self._upsert(self._session, fingerprint, data)
 
-    def _upsert(self, session, fingerprint: Optional[str], data: dict) -> Tuple[str, bool]:
-        # Try to find by fingerprint when available
+    @staticmethod
+    def _find_existing(session, url_hash: Optional[str], fingerprint: Optional[str], data: dict) -> Tuple[Optional[Item], Optional[str]]:
+        """Returns (existing row or None, url_hash to store): the hash is None when another entry owns the URL."""
+        if url_hash:
+            by_url = session.query(Item).filter(Item.canonical_url_hash == url_hash).one_or_none()
+            if by_url is not None:
+                if _same_entry(by_url.title, by_url.meta, data):
+                    return by_url, url_hash
+                url_hash = None
         if fingerprint:
-            existing = session.query(Item).filter(Item.fingerprint == fingerprint).one_or_none()
-            if existing:
-                # merge basic fields and meta
-                if data.get("title"):
-                    existing.title = data["title"]
-                if data.get("content") is not None:
-                    existing.content = data["content"]
-                if data.get("raw_content") is not None:
-                    existing.raw_content = data["raw_content"]
-                if data.get("authors") is not None:
-                    existing.authors = data["authors"]
-                if data.get("published_date") is not None:
-                    existing.published_at = data["published_date"]
-                # merge meta dicts
-                new_meta = (existing.meta or {})
-                if data.get("meta"):
-                    new_meta.update(data.get("meta") or {})
-                existing.meta = new_meta
-                # use timezone-aware UTC now
-                existing.fetched_at = datetime.now(timezone.utc)
-                session.add(existing)
-                session.commit()
-                session.refresh(existing)
-                return existing.id, False
+            return session.query(Item).filter(Item.fingerprint == fingerprint).one_or_none(), url_hash
+        return None, url_hash
 
-        # Not found by fingerprint (or fingerprint was None) -> insert
+    def _upsert(self, session, fingerprint: Optional[str], data: dict) -> Tuple[str, bool]:
+        canonical_url, url_hash = _url_key(data)
+        existing, url_hash = self._find_existing(session, url_hash, fingerprint, data)
+        if existing:
+            # merge basic fields and meta
+            if data.get("title"):
+                existing.title = data["title"]
+            if data.get("content") is not None:
+                existing.content = data["content"]
+                existing.summary = make_summary(data["content"])
+            if data.get("raw_content") is not None:
+                existing.raw_content, existing.raw_content_z, existing.body_dict_id = body_store.encode(
+                    existing.source_id, data["raw_content"]
+                )
+            if data.get("authors") is not None:
+                existing.authors = data["authors"]
+            if data.get("published_date") is not None:
+                existing.published_at = data["published_date"]
+            if url_hash and existing.canonical_url_hash is None:
+                # row stored before canonical URLs existed (found by fingerprint)
+                existing.canonical_url, existing.canonical_url_hash = canonical_url, url_hash
+            if fingerprint and existing.fingerprint != fingerprint:
+                # edited entry: take the new fingerprint unless another row already has it
+                if session.query(Item.id).filter(Item.fingerprint == fingerprint).first() is None:
+                    existing.fingerprint = fingerprint
+            # merge meta dicts
+            new_meta = (existing.meta or {})
+            if data.get("meta"):
+                new_meta.update(data.get("meta") or {})
+            existing.meta = new_meta
+            # use timezone-aware UTC now
+            existing.fetched_at = datetime.now(timezone.utc)
+            session.add(existing)
+            session.commit()
+            session.refresh(existing)
+            return existing.id, False
+
+        # Not found by canonical URL or fingerprint -> insert
+        cluster = {"id": str(uuid.uuid4()), **signature_values(data.get("title"), data.get("content"))}
+        assign_clusters(session, [cluster])
+        raw_content, raw_content_z, body_dict_id = body_store.encode(data.get("source_id"), data.get("raw_content"))
         item = Item(
-            id=str(uuid.uuid4()),
+            **cluster,
             source_id=data.get("source_id"),
             url=data.get("url"),
+            canonical_url=canonical_url,
+            canonical_url_hash=url_hash,
             title=data.get("title"),
             content=data.get("content"),
-            raw_content=data.get("raw_content"),
+            raw_content=raw_content,
+            raw_content_z=raw_content_z,
+            body_dict_id=body_dict_id,
+            summary=make_summary(data.get("content")),
             authors=data.get("authors"),
             published_at=data.get("published_date"),
             fetched_at=data.get("fetched_at") or datetime.now(timezone.utc),
@@ -84,56 +409,467 @@ class FetchedItemRepository:
             return item.id, True
         except Exception:
             session.rollback()
-            # race condition or unique constraint -> try to fetch existing by fingerprint
-            if fingerprint:
-                existing = session.query(Item).filter(Item.fingerprint == fingerprint).one_or_none()
-                if existing:
-                    return existing.id, False
+            # race condition or unique constraint -> try to fetch the row inserted meanwhile
+            existing, _ = self._find_existing(session, _url_key(data)[1], fingerprint, data)
+            if existing:
+                return existing.id, False
             raise
 
+    def upsert_many(self, rows: List[dict]) -> List[Tuple[str, bool]]:
+        """Batched version of upsert_by_fingerprint.
+
+        Args:
+            rows: list of dicts with the same keys as upsert_by_fingerprint's data, plus "fingerprint".
+
+        Existing rows are resolved with one IN query on canonical_url_hash and one on fingerprint (both
+        unique indexes; a URL match only counts for the same entry, see _same_entry), then the batch is written with INSERT ... ON CONFLICT (id) DO UPDATE (PostgreSQL
+        and SQLite) and committed in one transaction. Merge rules match upsert_by_fingerprint (empty title /
+        None fields keep the stored value, meta dicts are merged, an edited entry updates its row and
+        fingerprint). A row inserted concurrently by another writer makes the batch fail with an
+        IntegrityError; callers retry with upsert_by_fingerprint, which then finds that row.
+        New rows get a SimHash signature and are assigned to a near-duplicate cluster (see
+        app.storage.near_duplicates) before the INSERT; signatures are computed after the lookups, for the
+        new rows only, and before the write transaction starts.
+
+        Returns:
+            list of (item_id, created) in the same order as rows.
+        """
+        if not rows:
+            return []
+        UPSERT_ROWS.inc(len(rows), op="batch")
+        with UPSERT_SECONDS.time(op="batch"):
+            if self._session is None:
+                with get_session() as session:
+                    return self._upsert_many(session, rows)
+            else:
+                return self._upsert_many(self._session, rows)
+
+    def _upsert_many(self, session, rows: List[dict]) -> List[Tuple[str, bool]]:
+        dialect = session.get_bind().dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            # no portable ON CONFLICT: fall back to the row-by-row path
+            return [self._upsert(session, r.get("fingerprint"), r) for r in rows]
+
+        now = datetime.now(timezone.utc)
+        keys = [_url_key(r) for r in rows]
+        url_hashes = {h for _, h in keys if h}
+        fingerprints = {r["fingerprint"] for r in rows if r.get("fingerprint")}
+        # hash/fingerprint -> (item_id, stored fingerprint, meta, title)
+        by_hash: Dict[str, Tuple[str, Optional[str], dict, Optional[str]]] = {}
+        by_fingerprint: Dict[str, Tuple[str, Optional[str], dict, Optional[str]]] = {}
+        columns = (Item.id, Item.fingerprint, Item.canonical_url_hash, Item.meta, Item.title)
+        if url_hashes:
+            for item_id, fp, url_hash, meta, title in session.execute(select(*columns).where(Item.canonical_url_hash.in_(url_hashes))):
+                by_hash[url_hash] = (item_id, fp, meta or {}, title)
+        if fingerprints:
+            for item_id, fp, url_hash, meta, title in session.execute(select(*columns).where(Item.fingerprint.in_(fingerprints))):
+                by_fingerprint[fp] = (item_id, fp, meta or {}, title)
+
+        # one VALUES row per item: a statement may not touch the same row twice, so rows of the batch that
+        # resolve to the same key, or through different keys to the same stored row, are merged here the
+        # same way sequential upserts would merge them
+        values: List[Dict[str, Any]] = []
+        by_key: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        by_id: Dict[str, Dict[str, Any]] = {}
+        results: List[Tuple[str, bool]] = []
+        for r, (canonical_url, url_hash) in zip(rows, keys):
+            fp = r.get("fingerprint")
+            if url_hash:
+                # the URL is only a key for the entry that owns it (stored, or earlier in this batch)
+                stored = by_hash.get(url_hash)
+                pending = by_key.get(("url", url_hash))
+                if (stored is not None and not _same_entry(stored[3], stored[2], r)) or (
+                    stored is None and pending is not None and not _same_entry(pending["title"], pending["meta"], r)
+                ):
+                    url_hash = None
+            key = ("url", url_hash) if url_hash else ("fp", fp) if fp else None
+            v = by_key.get(key) if key else None
+            if v is not None:
+                self._merge_values(v, r)
+                results.append((v["id"], False))
+                continue
+            found = (by_hash.get(url_hash) if url_hash else None) or (by_fingerprint.get(fp) if fp else None)
+            if found and found[0] in by_id:
+                v = by_id[found[0]]
+                self._merge_values(v, r)
+                if key:
+                    by_key[key] = v
+                results.append((v["id"], False))
+                continue
+            if found:
+                item_id, stored_fp, meta, _ = found
+                created = False
+                owner = by_fingerprint.get(fp) if fp else None
+                if owner is not None and owner[0] != item_id:
+                    # the new fingerprint belongs to another row; keep this row's own
+                    fp = stored_fp
+            else:
+                item_id, meta, created = str(uuid.uuid4()), {}, True
+            meta = dict(meta)
+            meta.update(r.get("meta") or {})
+            v = {
+                "id": item_id,
+                "source_id": r.get("source_id"),
+                "url": r.get("url"),
+                "canonical_url": canonical_url,
+                "canonical_url_hash": url_hash,
+                "title": r.get("title"),
+                "content": r.get("content"),
+                "raw_content": r.get("raw_content"),
+                "summary": make_summary(r.get("content")),
+                "authors": r.get("authors") if r.get("authors") is not None else null(),
+                "published_at": r.get("published_date"),
+                "fetched_at": r.get("fetched_at") or now,
+                "fingerprint": fp,
+                "meta": meta,
+                "is_read": False,
+                "is_starred": False,
+            }
+            body_store.apply(v)
+            values.append(v)
+            by_id[item_id] = v
+            if key:
+                by_key[key] = v
+            results.append((item_id, created))
+
+        # end the lookups' read transaction: hashing the new rows must not run inside a transaction
+        session.commit()
+        # near-duplicate clusters for the new rows; updates of existing rows keep their signature and cluster
+        # (the conflict clause below does not touch those columns)
+        new_ids = {item_id for item_id, created in results if created}
+        for v in values:
+            if v["id"] in new_ids:
+                v.update(signature_values(v["title"], v["content"]))
+            else:
+                v.update(dict.fromkeys(SIGNATURE_KEYS))
+            v["cluster_id"], v["is_duplicate"] = v["id"], False
+        assign_clusters(session, [v for v in values if v["id"] in new_ids])
+
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            stmt = insert(Item).values(values[start:start + UPSERT_CHUNK_SIZE])
+            ex = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Item.id],
+                set_={
+                    "title": func.coalesce(func.nullif(ex.title, ""), Item.title),
+                    "content": func.coalesce(ex.content, Item.content),
+                    # a new body replaces the stored one in whichever form (plain / compressed) it arrives
+                    "raw_content": case((ex.raw_content_z.is_not(None), null()), else_=func.coalesce(ex.raw_content, Item.raw_content)),
+                    "raw_content_z": case((ex.raw_content.is_not(None), null()), else_=func.coalesce(ex.raw_content_z, Item.raw_content_z)),
+                    "body_dict_id": case(
+                        (ex.raw_content.is_not(None), null()),
+                        (ex.raw_content_z.is_not(None), ex.body_dict_id),
+                        else_=Item.body_dict_id,
+                    ),
+                    "summary": func.coalesce(ex.summary, Item.summary),
+                    "authors": func.coalesce(ex.authors, Item.authors),
+                    "published_at": func.coalesce(ex.published_at, Item.published_at),
+                    "fingerprint": func.coalesce(ex.fingerprint, Item.fingerprint),
+                    "canonical_url": func.coalesce(ex.canonical_url, Item.canonical_url),
+                    "canonical_url_hash": func.coalesce(ex.canonical_url_hash, Item.canonical_url_hash),
+                    "meta": ex.meta,
+                    "fetched_at": ex.fetched_at,
+                    "updated_at": utcnow(),
+                },
+            )
+            session.execute(stmt)
+        session.commit()
+        return results
+
+    @staticmethod
+    def _merge_values(v: Dict[str, Any], r: dict) -> None:
+        if r.get("title"):
+            v["title"] = r["title"]
+        for src_key, dst_key in (("content", "content"), ("authors", "authors"), ("published_date", "published_at")):
+            if r.get(src_key) is not None:
+                v[dst_key] = r[src_key]
+        if r.get("raw_content") is not None:
+            v["raw_content"] = r["raw_content"]
+            body_store.apply(v)
+        if r.get("content") is not None:
+            v["summary"] = make_summary(r["content"])
+        if r.get("meta"):
+            v["meta"].update(r["meta"])
+
     def get(self, item_id: str) -> Optional[dict]:
+        """Return the full item, including the deferred content/raw_content columns."""
         if self._session is None:
             with get_session() as session:
-                item = session.query(Item).filter(Item.id == item_id).one_or_none()
+                item = session.execute(_get_stmt(item_id)).scalar_one_or_none()
         else:
-            item = self._session.query(Item).filter(Item.id == item_id).one_or_none()
+            item = self._session.execute(_get_stmt(item_id)).scalar_one_or_none()
         if not item:
             return None
         return item.to_dict()
 
-    def list(self, limit: int = 100, offset: int = 0) -> List[dict]:
+    def list(self, limit: int = 100, offset: int = 0, status: str = "all") -> List[dict]:
+        rows, _ = self.list_page(limit=limit, offset=offset, status=status)
+        return rows
+
+    def list_page(self, limit: int = 100, cursor: Optional[str] = None, offset: int = 0, status: str = "all") -> Tuple[List[dict], Optional[str]]:
+        """Return one page of items in feed order plus the cursor of the next page.
+
+        With cursor the page starts right after the cursor's row (keyset pagination: every page costs the
+        same and rows inserted meanwhile do not shift later pages); offset is only applied when no cursor
+        is given. next_cursor is None when this page is the last one.
+        status: "all" | "unread" | "read" | "starred", filtered in SQL so a page is always full when
+        enough matching rows exist.
+        Near-duplicates (is_duplicate) are not listed; list_cluster() returns them for a given item.
+
+        Items are summary dicts (id, source_id, url, title, summary, published_at, fetched_at, is_read,
+        is_starred, source_name): source_name comes from a join on sources, and the query selects only
+        those columns, so the large content/raw_content columns are never transferred. Use get() for the
+        full item.
+        """
+        stmt = _list_page_stmt(limit, cursor, offset, status)
+        if self._session is None:
+            with get_session() as session:
+                rows = session.execute(stmt).all()
+        else:
+            rows = self._session.execute(stmt).all()
+        return _page_result(rows, limit)
+
+    def search(
+        self,
+        q: str,
+        limit: int = 20,
+        offset: int = 0,
+        source_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        status: str = "all",
+    ) -> List[dict]:
+        """Full-text search over title and content, best matches first (see app.storage.search).
+
+        source_id / since / until / status narrow the matches; since/until compare against published_at
+        (fetched_at when the item has no published date). Items are the same summary dicts as list_page
+        plus "rank" (PostgreSQL ts_rank_cd, higher is better; SQLite bm25, lower is better).
+        """
+        def _query(session):
+            stmt = _search_stmt(session.get_bind().dialect.name, q, limit, offset, source_id, since, until, status)
+            return session.execute(stmt).all()
+
+        if self._session is None:
+            with get_session() as session:
+                rows = _query(session)
+        else:
+            rows = _query(self._session)
+        return [dict(r._mapping) for r in rows]
+
+    def list_cluster(self, item_id: str) -> List[dict]:
+        """Return the other items of item_id's near-duplicate cluster as summary dicts (see list_page)."""
+        if self._session is None:
+            with get_session() as session:
+                rows = session.execute(_cluster_stmt(item_id)).all()
+        else:
+            rows = self._session.execute(_cluster_stmt(item_id)).all()
+        return [dict(r._mapping) for r in rows]
+
+    def duplicate_ids(self, ids: List[str]) -> List[str]:
+        """Return those of ids that were stored as near-duplicates (hidden from the feed)."""
+        if not ids:
+            return []
+        if self._session is None:
+            with get_session() as session:
+                return list(session.execute(_duplicate_ids_stmt(ids)).scalars())
+        return list(self._session.execute(_duplicate_ids_stmt(ids)).scalars())
+
+    def count_by_status(self) -> Dict[str, int]:
+        """Return {"total", "unread", "starred"} counts of the feed (near-duplicates excluded).
+
+        unread/starred are answered from the partial indexes.
+        """
+        def _query(session):
+            return {k: session.execute(stmt).scalar() or 0 for k, stmt in _count_stmts().items()}
+
+        if self._session is None:
+            with get_session() as session:
+                return _query(session)
+        return _query(self._session)
+
+    def version(self) -> str:
+        """Opaque token that changes whenever any item is inserted or updated (max updated_at)."""
+        if self._session is None:
+            with get_session() as session:
+                return _version_token(session.execute(_version_stmt()).scalar())
+        return _version_token(self._session.execute(_version_stmt()).scalar())
+
+    def item_version(self, item_id: str) -> Optional[str]:
+        """Opaque token that changes whenever the item is updated (its updated_at); None if it does not exist."""
         if self._session is None:
             with get_session() as session:
-                rows = session.query(Item).order_by(Item.published_at.desc().nulls_last(), Item.fetched_at.desc()).offset(offset).limit(limit).all()
+                value = session.execute(_item_version_stmt(item_id)).scalar()
         else:
-            rows = self._session.query(Item).order_by(Item.published_at.desc().nulls_last(), Item.fetched_at.desc()).offset(offset).limit(limit).all()
-        return [r.to_dict() for r in rows]
+            value = self._session.execute(_item_version_stmt(item_id)).scalar()
+        return _version_token(value) if value is not None else None
+
+    def list_entry_keys(self, source_id: str, limit: int = 2000) -> List[Tuple[str, str]]:
+        """返回某个 source 最近入库条目的 (entry_id, entry_hash)，按 fetched_at 倒序。
+
+        这两个值由 RSSSource 写入 meta，供 SeenEntryCache 判断 feed 条目是否未变化。只查询 meta 列。
+        """
+        def _query(session):
+            return (
+                session.query(Item.meta)
+                .filter(Item.source_id == source_id)
+                .order_by(Item.fetched_at.desc())
+                .limit(limit)
+                .all()
+            )
+
+        if self._session is None:
+            with get_session() as session:
+                rows = _query(session)
+        else:
+            rows = _query(self._session)
+        keys: List[Tuple[str, str]] = []
+        for (meta,) in rows:
+            meta = meta or {}
+            if meta.get("entry_id") and meta.get("entry_hash"):
+                keys.append((meta["entry_id"], meta["entry_hash"]))
+        return keys
 
     def update_flags(self, item_id: str, fields: dict) -> bool:
         """更新 item 的 is_read / is_starred 标记。fields 可包含 'is_read' 和/或 'is_starred'。
 
         返回 True 表示成功更新，False 表示未找到对应条目。
         """
-        allowed = {"is_read", "is_starred"}
-        to_set = {k: v for k, v in fields.items() if k in allowed}
-        if not to_set:
+        stmt = _update_flags_stmt(item_id, fields)
+        if stmt is None:
             return False
         if self._session is None:
             with get_session() as session:
-                item = session.query(Item).filter(Item.id == item_id).one_or_none()
-                if not item:
-                    return False
-                for k, v in to_set.items():
-                    setattr(item, k, bool(v))
-                session.add(item)
-                session.commit()
-                return True
-        else:
-            item = self._session.query(Item).filter(Item.id == item_id).one_or_none()
-            if not item:
-                return False
-            for k, v in to_set.items():
-                setattr(item, k, bool(v))
-            self._session.add(item)
-            self._session.commit()
-            return True
+                return session.execute(stmt).rowcount > 0
+        updated = self._session.execute(stmt).rowcount > 0
+        self._session.commit()
+        return updated
+
+    def mark_read(
+        self,
+        ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+        source_id: Optional[str] = None,
+        all_items: bool = False,
+        is_read: bool = True,
+    ) -> int:
+        """批量设置 is_read，使用集合式 UPDATE 而不是逐条加载 ORM 对象。
+
+        ids / before / source_id 为条件，同时给出时取交集：
+          - ids: 指定的条目 id 列表
+          - before: 发布时间（没有发布时间时取抓取时间）早于该时刻的条目
+          - source_id: 某个 source 的全部条目
+        三者都未给出时必须显式传 all_items=True 才会更新全部条目，否则抛出 ValueError。
+        只更新 is_read 与目标值不同的行；返回受影响的行数。ids 很多时按 MARK_CHUNK_SIZE 分批，仍在同一事务内提交。
+        """
+        stmts = _mark_read_stmts(ids, before, source_id, all_items, is_read)
+        if self._session is None:
+            with get_session() as session:
+                return sum(session.execute(stmt).rowcount for stmt in stmts)
+        count = sum(self._session.execute(stmt).rowcount for stmt in stmts)
+        self._session.commit()
+        return count
+
+
+class AsyncFetchedItemRepository:
+    """Read/flag side of FetchedItemRepository on an AsyncSession, for the async API controllers.
+
+    Runs the same statements as the synchronous repository (see the builders above) and returns the same
+    dicts. Ingest (upsert_many & co.) stays on FetchedItemRepository: the pipelines are synchronous.
+    """
+
+    def __init__(self, session_factory=None):
+        # session_factory: async context manager factory yielding an AsyncSession (default get_async_session)
+        self._session_factory = session_factory or get_async_session
+
+    async def get(self, item_id: str) -> Optional[dict]:
+        async with self._session_factory() as session:
+            item = (await session.execute(_get_stmt(item_id))).scalar_one_or_none()
+            if item is not None and item.raw_content_z is not None:
+                # to_dict decompresses raw_content; its dictionary must not be loaded synchronously here
+                await body_store.load_dictionaries_async(session, [item.body_dict_id])
+        return item.to_dict() if item else None
+
+    async def list_page(self, limit: int = 100, cursor: Optional[str] = None, offset: int = 0, status: str = "all") -> Tuple[List[dict], Optional[str]]:
+        stmt = _list_page_stmt(limit, cursor, offset, status)
+        async with self._session_factory() as session:
+            rows = (await session.execute(stmt)).all()
+        return _page_result(rows, limit)
+
+    async def list(self, limit: int = 100, offset: int = 0, status: str = "all") -> List[dict]:
+        rows, _ = await self.list_page(limit=limit, offset=offset, status=status)
+        return rows
+
+    async def search(
+        self,
+        q: str,
+        limit: int = 20,
+        offset: int = 0,
+        source_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        status: str = "all",
+    ) -> List[dict]:
+        async with self._session_factory() as session:
+            stmt = _search_stmt(session.get_bind().dialect.name, q, limit, offset, source_id, since, until, status)
+            rows = (await session.execute(stmt)).all()
+        return [dict(r._mapping) for r in rows]
+
+    async def list_cluster(self, item_id: str) -> List[dict]:
+        async with self._session_factory() as session:
+            rows = (await session.execute(_cluster_stmt(item_id))).all()
+        return [dict(r._mapping) for r in rows]
+
+    async def count_by_status(self) -> Dict[str, int]:
+        async with self._session_factory() as session:
+            return {k: (await session.execute(stmt)).scalar() or 0 for k, stmt in _count_stmts().items()}
+
+    async def version(self) -> str:
+        async with self._session_factory() as session:
+            return _version_token((await session.execute(_version_stmt())).scalar())
+
+    async def item_version(self, item_id: str) -> Optional[str]:
+        async with self._session_factory() as session:
+            value = (await session.execute(_item_version_stmt(item_id))).scalar()
+        return _version_token(value) if value is not None else None
+
+    async def last_updated_at(self) -> Optional[datetime]:
+        """max(updated_at): the newest write time as seen by the database clock."""
+        async with self._session_factory() as session:
+            return (await session.execute(_version_stmt())).scalar()
+
+    async def db_now(self) -> Optional[datetime]:
+        """Current time of the database clock that fills created_at (func.now())."""
+        async with self._session_factory() as session:
+            return (await session.execute(select(func.now()))).scalar()
+
+    async def list_created_since(self, since: Optional[datetime], limit: int = 500) -> List[dict]:
+        """Summary dicts (plus created_at) of the feed items created after since (all when None), oldest first."""
+        async with self._session_factory() as session:
+            rows = (await session.execute(_created_since_stmt(since, limit))).all()
+        return [dict(r._mapping) for r in rows]
+
+    async def update_flags(self, item_id: str, fields: dict) -> bool:
+        stmt = _update_flags_stmt(item_id, fields)
+        if stmt is None:
+            return False
+        async with self._session_factory() as session:
+            return (await session.execute(stmt)).rowcount > 0
+
+    async def mark_read(
+        self,
+        ids: Optional[List[str]] = None,
+        before: Optional[datetime] = None,
+        source_id: Optional[str] = None,
+        all_items: bool = False,
+        is_read: bool = True,
+    ) -> int:
+        stmts = _mark_read_stmts(ids, before, source_id, all_items, is_read)
+        count = 0
+        async with self._session_factory() as session:
+            for stmt in stmts:
+                count += (await session.execute(stmt)).rowcount
+        return count
@@ -0,0 +1,455 @@
+"""Durable fetch job queue in the application database (table fetch_jobs), no external broker.
+
+A job asks for one fetch of one source. Its life cycle:
+
+- enqueue(): a "pending" job per source. There is at most one unfinished job per source (unique
+  active_key), so enqueueing a source that is already queued or running is a no-op. It returns the ids
+  of the new jobs;
+- lease(): workers claim ready jobs ("leased"). Each claim gets a fresh lease token and an expiry. Running
+  workers extend it with heartbeat(). A job whose lease expires (the worker process died) becomes
+  claimable again, so work in flight at a crash is resumed by the next process;
+- run() executes a job and then ack()s it ("done") or fail()s it. A failed job goes back to "pending"
+  with an exponential backoff plus jitter (JOB_RETRY_BASE_SECONDS * 2^(attempt-1), capped at
+  JOB_RETRY_MAX_SECONDS, each delay drawn from [d/2, d]). After JOB_MAX_ATTEMPTS attempts it is
+  dead-lettered ("dead") with its last error. An exception carrying retry_after (seconds, e.g.
+  app.sources.http_client.HostThrottled or RobotsDisallowed) is not a failure: the job is released and runs again after
+  that delay without using up an attempt;
+- drain() is a small worker pool that leases and runs ready jobs in parallel until the queue is empty.
+  Given job_ids it only leases, and waits for, those jobs (e.g. the ones a caller enqueued itself), so
+  it neither picks up nor waits on the jobs of a scheduler sharing the queue.
+
+Finished rows are kept for JOB_RETENTION_DAYS (purge()) and feed stats(): queue depth, the age of the
+oldest ready job, throughput and recent dead letters.
+
+Command line (from the repository root):
+    python -m app.storage.job_queue stats
+    python -m app.storage.job_queue purge [--days N]
+    python -m app.storage.job_queue requeue-dead [--hours N]    # enqueue again sources that were dead-lettered
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import and_, delete, func, insert, or_, select, update
+
+from .db import get_async_session, get_session
+from .models import FetchJob
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "3600"))
+# workers extend their leases every LEASE_SECONDS / 3, so a crashed worker's jobs are free again after this long
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+# idle workers look for ready jobs (new or retried) at least this often
+JOB_POLL_SECONDS = 5.0
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+# stored errors are truncated to this many characters
+_MAX_ERROR_LENGTH = 2000
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    # SQLite returns naive datetimes; everything is stored in UTC
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def retry_delay(attempts: int, base: float = JOB_RETRY_BASE_SECONDS, cap: float = JOB_RETRY_MAX_SECONDS) -> float:
+    """Seconds to wait before retrying a job that has failed `attempts` times (exponential, jittered)."""
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return random.uniform(delay / 2, delay)
+
+
+@dataclass
+class Job:
+    """A leased job. token identifies the lease; ack/fail/release are ignored once it is lost."""
+    id: int
+    source_id: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    token: str
+
+
+@dataclass
+class JobOutcome:
+    ok: bool
+    value: Any = None
+    error: Optional[str] = None
+    # next attempt of a failed or deferred job; None when it succeeded or was dead-lettered
+    retry_at: Optional[datetime] = None
+    # the job was given back (exception with retry_after) without counting the attempt
+    deferred: bool = False
+
+    @property
+    def dead(self) -> bool:
+        return not self.ok and self.retry_at is None
+
+
+class JobQueue:
+    """Fetch job queue on the fetch_jobs table. Safe to share between threads and processes.
+
+    worker_id: prefix of the lease tokens (default host:pid), shows who holds a job
+    """
+
+    def __init__(
+        self,
+        worker_id: Optional[str] = None,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        retry_base_seconds: float = JOB_RETRY_BASE_SECONDS,
+        retry_max_seconds: float = JOB_RETRY_MAX_SECONDS,
+    ):
+        self.worker_id = (worker_id or f"{socket.gethostname()}:{os.getpid()}")[:40]
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+
+    # --- producing ---
+
+    def enqueue(self, source_ids: Iterable[str], run_at: Optional[datetime] = None) -> List[int]:
+        """Queue a fetch of every source that has no unfinished job yet; returns the ids of the new jobs."""
+        source_ids = list(dict.fromkeys(source_ids))
+        if not source_ids:
+            return []
+        run_at = run_at or _now()
+        rows = [
+            {"source_id": sid, "active_key": sid, "status": PENDING, "attempts": 0, "max_attempts": self.max_attempts, "run_at": run_at}
+            for sid in source_ids
+        ]
+        with get_session() as session:
+            dialect = session.get_bind().dialect.name
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            elif dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                # no portable ON CONFLICT: skip sources with an active job (racy, the unique key still holds)
+                active = set(session.execute(select(FetchJob.active_key).where(FetchJob.active_key.in_(source_ids))).scalars())
+                rows = [r for r in rows if r["source_id"] not in active]
+                if not rows:
+                    return []
+                session.execute(insert(FetchJob), rows)
+                return list(session.execute(
+                    select(FetchJob.id).where(FetchJob.active_key.in_([r["source_id"] for r in rows]))
+                ).scalars())
+            # RETURNING only yields the inserted rows, not the ones skipped by ON CONFLICT
+            stmt = (
+                dialect_insert(FetchJob)
+                .values(rows)
+                .on_conflict_do_nothing(index_elements=["active_key"])
+                .returning(FetchJob.id)
+            )
+            return list(session.execute(stmt).scalars())
+
+    # --- consuming ---
+
+    def lease(self, limit: int, now: Optional[datetime] = None, job_ids: Optional[Collection[int]] = None) -> List[Job]:
+        """Claim up to limit ready jobs (pending and due, or leased with an expired lease), oldest first.
+
+        job_ids restricts the claim to those jobs.
+        """
+        if limit <= 0 or (job_ids is not None and not job_ids):
+            return []
+        now = now or _now()
+        token = f"{self.worker_id}/{uuid.uuid4().hex[:16]}"
+        expired = and_(FetchJob.status == LEASED, FetchJob.lease_expires_at <= now)
+        claimable = or_(and_(FetchJob.status == PENDING, FetchJob.run_at <= now), expired)
+        if job_ids is not None:
+            claimable = and_(FetchJob.id.in_(list(job_ids)), claimable)
+        with get_session() as session:
+            # a job whose worker died on its last attempt is not retried forever
+            session.execute(
+                update(FetchJob)
+                .where(expired, FetchJob.attempts >= FetchJob.max_attempts)
+                .values(status=DEAD, active_key=None, lease_owner=None, finished_at=now, last_error="lease expired on the last attempt")
+            )
+            ids = list(session.execute(
+                select(FetchJob.id).where(claimable).order_by(FetchJob.run_at).limit(limit).with_for_update(skip_locked=True)
+            ).scalars())
+            if not ids:
+                return []
+            # the WHERE is evaluated again under the row lock: a job claimed by another worker in between is skipped
+            session.execute(
+                update(FetchJob)
+                .where(FetchJob.id.in_(ids), claimable)
+                .values(
+                    status=LEASED,
+                    lease_owner=token,
+                    lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+                    attempts=FetchJob.attempts + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            rows = session.execute(
+                select(FetchJob.id, FetchJob.source_id, FetchJob.attempts, FetchJob.max_attempts, FetchJob.run_at)
+                .where(FetchJob.lease_owner == token)
+                .order_by(FetchJob.run_at)
+            ).all()
+        return [Job(r.id, r.source_id, r.attempts, r.max_attempts, _aware(r.run_at), token) for r in rows]
+
+    def heartbeat(self, jobs: Iterable[Job]) -> None:
+        """Extend the leases of running jobs."""
+        tokens = {j.token for j in jobs}
+        if not tokens:
+            return
+        with get_session() as session:
+            session.execute(
+                update(FetchJob)
+                .where(FetchJob.lease_owner.in_(tokens), FetchJob.status == LEASED)
+                .values(lease_expires_at=_now() + timedelta(seconds=self.lease_seconds))
+                .execution_options(synchronize_session=False)
+            )
+
+    def _finish(self, job: Job, **values) -> bool:
+        with get_session() as session:
+            res = session.execute(
+                update(FetchJob)
+                .where(FetchJob.id == job.id, FetchJob.lease_owner == job.token, FetchJob.status == LEASED)
+                .values(lease_owner=None, lease_expires_at=None, **values)
+                .execution_options(synchronize_session=False)
+            )
+        if res.rowcount != 1:
+            logger.warning("Lease of job %d (source %s) was lost before it finished", job.id, job.source_id)
+            return False
+        return True
+
+    def ack(self, job: Job, items_created: Optional[int] = None) -> bool:
+        """Mark a leased job done."""
+        return self._finish(job, status=DONE, active_key=None, finished_at=_now(), items_created=items_created, last_error=None)
+
+    def fail(self, job: Job, error: str) -> Optional[datetime]:
+        """Record a failed attempt: schedule a retry with backoff, or dead-letter after max_attempts.
+
+        Returns the retry time, None when the job was dead-lettered.
+        """
+        now = _now()
+        error = (error or "")[:_MAX_ERROR_LENGTH]
+        if job.attempts >= job.max_attempts:
+            self._finish(job, status=DEAD, active_key=None, finished_at=now, last_error=error)
+            logger.error("Job %d (source %s) dead-lettered after %d attempts: %s", job.id, job.source_id, job.attempts, error)
+            return None
+        retry_at = now + timedelta(seconds=retry_delay(job.attempts, self.retry_base_seconds, self.retry_max_seconds))
+        self._finish(job, status=PENDING, run_at=retry_at, last_error=error)
+        return retry_at
+
+    def release(self, job: Job, delay_seconds: float = 0.0) -> bool:
+        """Give a leased job back without counting the attempt (e.g. its source is already running here)."""
+        return self._finish(
+            job, status=PENDING, attempts=FetchJob.attempts - 1, run_at=_now() + timedelta(seconds=delay_seconds)
+        )
+
+    def run(self, job: Job, fn: Callable[[Job], Any]) -> JobOutcome:
+        """Run fn(job); ack on success (a list result is stored as the number of created items), fail on exception.
+
+        An exception with a retry_after attribute (seconds) releases the job for that long instead of failing it.
+        """
+        try:
+            value = fn(job)
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            retry_after = getattr(exc, "retry_after", None)
+            if retry_after is not None:
+                logger.info("Job %d (source %s) deferred for %.0fs: %s", job.id, job.source_id, retry_after, error)
+                self.release(job, retry_after)
+                return JobOutcome(ok=False, error=error, retry_at=_now() + timedelta(seconds=retry_after), deferred=True)
+            logger.exception("Job %d (source %s) failed, attempt %d/%d", job.id, job.source_id, job.attempts, job.max_attempts)
+            return JobOutcome(ok=False, error=error, retry_at=self.fail(job, error))
+        created = sum(1 for _, was_created in value if was_created) if isinstance(value, list) else None
+        self.ack(job, created)
+        return JobOutcome(ok=True, value=value)
+
+    def drain(
+        self,
+        handler: Callable[[Job], Any],
+        workers: int = 8,
+        wait_for_retries: bool = False,
+        stop: Optional[threading.Event] = None,
+        job_ids: Optional[Collection[int]] = None,
+    ) -> int:
+        """Lease and run ready jobs on `workers` threads until none are left; returns the number of jobs run.
+
+        handler(job) must ack/fail the job itself, usually lambda job: queue.run(job, fn). With
+        wait_for_retries the call also waits for the retries of failed jobs, until no job is unfinished.
+        job_ids limits both the leasing and the waiting to those jobs; by default every job of the queue counts.
+        """
+        if job_ids is not None:
+            job_ids = list(job_ids)
+        running: Dict[Future, Job] = {}
+        done = 0
+        cond = threading.Condition()
+        next_heartbeat = time.monotonic() + self.lease_seconds / 3
+
+        def finished(_fut):
+            with cond:
+                cond.notify_all()
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job-worker") as pool:
+            while stop is None or not stop.is_set():
+                for fut in [f for f in running if f.done()]:
+                    job = running.pop(fut)
+                    done += 1
+                    if fut.exception() is not None:
+                        logger.error("Handler of job %d (source %s) raised: %s", job.id, job.source_id, fut.exception())
+                        self.fail(job, f"{type(fut.exception()).__name__}: {fut.exception()}")
+                for job in self.lease(workers - len(running), job_ids=job_ids):
+                    fut = pool.submit(handler, job)
+                    running[fut] = job
+                    fut.add_done_callback(finished)
+                if not running and not (wait_for_retries and self.unfinished(job_ids)):
+                    break
+                if time.monotonic() >= next_heartbeat:
+                    self.heartbeat(running.values())
+                    next_heartbeat = time.monotonic() + self.lease_seconds / 3
+                timeout = JOB_POLL_SECONDS if running else min(JOB_POLL_SECONDS, self.next_run_in(job_ids))
+                with cond:
+                    if not any(f.done() for f in running):
+                        cond.wait(timeout)
+        return done
+
+    def active_source_ids(self) -> Set[str]:
+        """Ids of the sources with a pending or leased job."""
+        with get_session() as session:
+            return set(session.execute(select(FetchJob.active_key).where(FetchJob.active_key.is_not(None))).scalars())
+
+    def next_run_in(self, job_ids: Optional[Collection[int]] = None) -> float:
+        """Seconds until the earliest pending job (of job_ids) becomes ready (0 when one is ready, inf when none is pending)."""
+        stmt = select(func.min(FetchJob.run_at)).where(FetchJob.status == PENDING)
+        if job_ids is not None:
+            stmt = stmt.where(FetchJob.id.in_(list(job_ids)))
+        with get_session() as session:
+            at = session.execute(stmt).scalar_one()
+        if at is None:
+            return float("inf")
+        return max((_aware(at) - _now()).total_seconds(), 0.0)
+
+    def unfinished(self, job_ids: Optional[Collection[int]] = None) -> int:
+        """Number of pending or leased jobs (among job_ids)."""
+        stmt = select(func.count()).select_from(FetchJob).where(FetchJob.active_key.is_not(None))
+        if job_ids is not None:
+            stmt = stmt.where(FetchJob.id.in_(list(job_ids)))
+        with get_session() as session:
+            return session.execute(stmt).scalar_one()
+
+    # --- maintenance ---
+
+    def purge(self, older_than_days: float = JOB_RETENTION_DAYS) -> int:
+        """Delete done and dead jobs finished more than older_than_days ago; returns the number deleted."""
+        cutoff = _now() - timedelta(days=older_than_days)
+        with get_session() as session:
+            return session.execute(
+                delete(FetchJob).where(FetchJob.status.in_((DONE, DEAD)), FetchJob.finished_at < cutoff)
+            ).rowcount
+
+    def requeue_dead(self, since: Optional[datetime] = None) -> int:
+        """Enqueue again every source with a job dead-lettered after since (default: all kept); returns the number queued."""
+        stmt = select(FetchJob.source_id).where(FetchJob.status == DEAD).distinct()
+        if since is not None:
+            stmt = stmt.where(FetchJob.finished_at >= since)
+        with get_session() as session:
+            source_ids = list(session.execute(stmt).scalars())
+        return len(self.enqueue(source_ids))
+
+    # --- stats ---
+
+    @staticmethod
+    def _stats_statements(now: datetime, since: datetime) -> Dict[str, Any]:
+        active = FetchJob.status.in_((PENDING, LEASED))
+        ready = and_(FetchJob.status == PENDING, FetchJob.run_at <= now)
+        return {
+            "depth": select(FetchJob.status, func.count()).where(active).group_by(FetchJob.status),
+            "ready": select(func.count(), func.min(FetchJob.run_at)).where(ready),
+            "retrying": select(func.count()).where(FetchJob.status == PENDING, FetchJob.attempts > 0),
+            "finished": select(FetchJob.status, func.count(), func.sum(FetchJob.items_created))
+            .where(FetchJob.finished_at >= since)
+            .group_by(FetchJob.status),
+            "recent_dead": select(FetchJob.id, FetchJob.source_id, FetchJob.attempts, FetchJob.last_error, FetchJob.finished_at)
+            .where(FetchJob.status == DEAD)
+            .order_by(FetchJob.finished_at.desc())
+            .limit(10),
+        }
+
+    @staticmethod
+    def _stats_result(now: datetime, window_seconds: float, results: Dict[str, list]) -> Dict[str, Any]:
+        depth = dict(results["depth"])
+        ready, oldest = results["ready"][0]
+        finished = {status: (count, created) for status, count, created in results["finished"]}
+        done, created = finished.get(DONE, (0, 0))
+        throughput = done / window_seconds * 60
+        oldest = _aware(oldest)
+        return {
+            "pending": depth.get(PENDING, 0),
+            "leased": depth.get(LEASED, 0),
+            "ready": ready,
+            "retrying": results["retrying"][0][0],
+            "oldest_ready_age_seconds": round((now - oldest).total_seconds(), 1) if oldest else None,
+            "window_seconds": window_seconds,
+            "done": done,
+            "dead": finished.get(DEAD, (0, 0))[0],
+            "items_created": created or 0,
+            "jobs_per_minute": round(throughput, 2),
+            # time to work off the ready backlog at the recent rate
+            "drain_eta_seconds": round(ready / throughput * 60, 1) if ready and throughput else None,
+            "recent_dead": [dict(r._mapping) for r in results["recent_dead"]],
+        }
+
+    def stats(self, window_seconds: float = 3600) -> Dict[str, Any]:
+        """Queue depth, oldest ready job, throughput over the last window_seconds and recent dead letters."""
+        now = _now()
+        statements = self._stats_statements(now, now - timedelta(seconds=window_seconds))
+        with get_session() as session:
+            results = {name: session.execute(stmt).all() for name, stmt in statements.items()}
+        return self._stats_result(now, window_seconds, results)
+
+    async def stats_async(self, window_seconds: float = 3600) -> Dict[str, Any]:
+        """stats() on the async engine (API)."""
+        now = _now()
+        statements = self._stats_statements(now, now - timedelta(seconds=window_seconds))
+        async with get_async_session() as session:
+            results = {name: (await session.execute(stmt)).all() for name, stmt in statements.items()}
+        return self._stats_result(now, window_seconds, results)
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect and maintain the fetch job queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="queue depth, throughput and recent dead letters")
+    p_purge = sub.add_parser("purge", help="delete old finished jobs")
+    p_purge.add_argument("--days", type=float, default=JOB_RETENTION_DAYS)
+    p_requeue = sub.add_parser("requeue-dead", help="enqueue again sources whose jobs were dead-lettered")
+    p_requeue.add_argument("--hours", type=float, default=None, help="only jobs dead-lettered in the last N hours")
+    args = parser.parse_args()
+
+    q = JobQueue()
+    if args.command == "stats":
+        print(json.dumps(q.stats(), default=str, indent=2))
+    elif args.command == "purge":
+        print(f"{q.purge(args.days)} jobs deleted")
+    else:
+        since = _now() - timedelta(hours=args.hours) if args.hours is not None else None
+        print(f"{q.requeue_dead(since)} sources queued")
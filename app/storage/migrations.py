@@ -0,0 +1,98 @@
+"""Bring an existing database up to the current models.
+
+Base.metadata.create_all() (init_db) creates missing tables but never touches tables that already exist,
+so columns and indexes added to a model later are missing on databases created by an older version, and
+every query selecting them fails ("no such column"). upgrade_schema() inspects the live schema first and
+only adds what is missing, so it is idempotent; init_db runs it on every start.
+
+- missing columns are added with ALTER TABLE ... ADD COLUMN. A NOT NULL column needs a server default to
+  be added to a table with rows; without one it is added as nullable (and logged). Foreign keys of added
+  columns are not created (SQLite cannot add them, the application does not rely on them);
+- missing indexes, and unique constraints (created as unique indexes of the same name) are created.
+
+Adding a nullable column, or one with a constant default, only changes the catalog on PostgreSQL 11+
+and SQLite; the new indexes are built over columns that are still empty.
+
+Command line (from the repository root):
+    python -m app.storage.migrations upgrade     # what init_db does, without starting the application
+    python -m app.storage.migrations search      # create/rebuild the PostgreSQL full-text column; rewrites the
+                                                 # items table, so it is never run on startup (app.storage.search)
+"""
+import logging
+from typing import List
+
+from sqlalchemy import Index, inspect, text
+from sqlalchemy.schema import CreateColumn, UniqueConstraint
+
+from .db import Base, engine
+
+logger = logging.getLogger(__name__)
+
+
+def _add_column_sql(conn, column) -> str:
+    dialect = conn.dialect
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    if not column.nullable and column.server_default is None:
+        # existing rows would violate NOT NULL; the application fills the column for new rows
+        logger.warning("Adding %s.%s as nullable: it has no server default", column.table.name, column.name)
+        ddl = ddl.replace(" NOT NULL", "")
+    return f"ALTER TABLE {dialect.identifier_preparer.format_table(column.table)} ADD COLUMN {ddl}"
+
+
+def upgrade_schema(bind=None) -> List[str]:
+    """Add the columns and indexes of the models that existing tables lack; returns what was added."""
+    bind = bind or engine
+    # the models register their tables on Base.metadata when imported
+    from . import models  # noqa: F401
+
+    added: List[str] = []
+    with bind.begin() as conn:
+        inspector = inspect(conn)
+        existing_tables = set(inspector.get_table_names())
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                # create_all creates it with everything
+                continue
+            columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    conn.execute(text(_add_column_sql(conn, column)))
+                    added.append(f"column {table.name}.{column.name}")
+
+            index_names = {i["name"] for i in inspector.get_indexes(table.name)}
+            index_names |= {c["name"] for c in inspector.get_unique_constraints(table.name)}
+            for index in table.indexes:
+                if index.name not in index_names:
+                    # checkfirst again: the conditional (ddl_if) variants of an index share its name
+                    index.create(conn, checkfirst=True)
+                    if index.name in {i["name"] for i in inspect(conn).get_indexes(table.name)}:
+                        index_names.add(index.name)
+                        added.append(f"index {index.name}")
+            for constraint in table.constraints:
+                if isinstance(constraint, UniqueConstraint) and constraint.name and constraint.name not in index_names:
+                    Index(constraint.name, *constraint.columns, unique=True).create(conn)
+                    index_names.add(constraint.name)
+                    added.append(f"unique index {constraint.name}")
+    for change in added:
+        logger.info("Schema upgrade: added %s", change)
+    return added
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Upgrade the database schema to the current models")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("upgrade", help="add missing columns and indexes to existing tables")
+    sub.add_parser("search", help="create or rebuild the full-text index (rewrites items on PostgreSQL)")
+    args = parser.parse_args()
+
+    if args.command == "upgrade":
+        changes = upgrade_schema()
+        print(f"{len(changes)} changes" + "".join(f"\n  {c}" for c in changes))
+    else:
+        from .search import ensure_search_index
+
+        ensure_search_index(engine, rebuild=True)
+        print("full-text index ready")
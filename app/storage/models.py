@@ -1,9 +1,11 @@
 """SQLAlchemy ORM models for MyInfoPlatform.
 Designed to work with PostgreSQL (JSON/UUID) but falls back to SQLite types where necessary.
 """
-from sqlalchemy import Column, String, Text, DateTime, Boolean, func, UniqueConstraint, ForeignKey, Integer
+from sqlalchemy import Column, String, Text, DateTime, Boolean, func, UniqueConstraint, ForeignKey, Integer, BigInteger, Float, LargeBinary, Index, false, true
 from sqlalchemy.types import JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
 from app.storage.db import Base
 import uuid
 import typing as t
@@ -13,6 +15,34 @@ def _new_uuid() -> str:
     return str(uuid.uuid4())
 
 
+class utcnow(FunctionElement):
+    """数据库时钟的当前时间，用于 updated_at。
+
+    SQLite 的 CURRENT_TIMESTAMP（func.now()）只精确到秒，同一秒内的两次修改会得到相同的版本号（列表 ETag、
+    详情缓存键），因此在 SQLite 上改用带毫秒的 strftime；其它数据库与 func.now() 相同。
+    PostgreSQL 的 now() 是事务开始的时间：先开始、后提交的事务写入的 updated_at 会小于已经读到的
+    max(updated_at)，列表版本号不变，客户端一直拿到旧列表。因此在 PostgreSQL 上用 clock_timestamp()
+    （语句执行时的时间），与提交时间只差同一个短事务内的几条语句。
+    """
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    return compiler.process(func.now(), **kw)
+
+
+@compiles(utcnow, "postgresql")
+def _utcnow_postgresql(element, compiler, **kw):
+    return "clock_timestamp()"
+
+
+@compiles(utcnow, "sqlite")
+def _utcnow_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f', 'now')"
+
+
 class Source(Base):
     __tablename__ = "sources"
 
@@ -25,6 +55,24 @@ class Source(Base):
     enabled = Column(Boolean, nullable=False, default=True)
     # 拉取间隔，以秒为单位。为空表示使用全局默认或由外部调度决定。
     fetch_interval_seconds = Column(Integer, nullable=True)
+    # HTTP 条件请求校验器（ETag / Last-Modified），下次拉取时回传 If-None-Match / If-Modified-Since
+    etag = Column(String(255), nullable=True)
+    last_modified = Column(String(255), nullable=True)
+    # 最近一次拉取结果："ok" | "not_modified"
+    last_fetch_status = Column(String(32), nullable=True)
+    # 增量解析高水位：已入库的最新条目发布时间 / 条目 id
+    hwm_published_at = Column(DateTime(timezone=True), nullable=True)
+    hwm_entry_id = Column(Text, nullable=True)
+    # 调度：下一次计划拉取时间（含抖动），由 app.pipelines.scheduler 维护；到期查询走该索引。为空表示尚未排期
+    next_fetch_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # 自适应间隔（app.pipelines.fetch_policy）：学习到的间隔、发布速率估计（条/天）与连续失败次数
+    effective_interval_seconds = Column(Integer, nullable=True)
+    publish_rate_per_day = Column(Float, nullable=True)
+    consecutive_failures = Column(Integer, nullable=False, default=0, server_default="0")
+    # 累计统计：拉取次数、失败次数、新建条目数，用于评估抓取量
+    fetch_count = Column(Integer, nullable=False, default=0, server_default="0")
+    failure_count = Column(Integer, nullable=False, default=0, server_default="0")
+    items_created_total = Column(Integer, nullable=False, default=0, server_default="0")
 
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
@@ -36,18 +84,83 @@ class Source(Base):
         return f"<Source id={self.id} name={self.name} url={self.base_url}>"
 
 
+class BodyDictionary(Base):
+    """按 source 训练的 zstd 字典（app.storage.body_store）。字典只增不改：已压缩的条目通过 id 引用训练时的那一版。"""
+    __tablename__ = "body_dictionaries"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_id = Column(String(36), ForeignKey("sources.id"), nullable=True, index=True)
+    data = Column(LargeBinary, nullable=False)
+    sample_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    def __repr__(self) -> str:  # pragma: no cover - trivial
+        return f"<BodyDictionary id={self.id} source_id={self.source_id} size={len(self.data or b'')}>"
+
+
+class FetchJob(Base):
+    """持久化的抓取任务队列（app.storage.job_queue）：租约 / 确认 / 指数退避重试 / 死信，进程重启后继续执行。"""
+    __tablename__ = "fetch_jobs"
+    __table_args__ = (
+        # 每个 source 最多一个未完成任务：pending / leased 时 active_key = source_id，完成或进入死信后置空
+        UniqueConstraint("active_key", name="uq_fetch_jobs_active_key"),
+        # 取任务：status = 'pending' AND run_at <= now ORDER BY run_at
+        Index("ix_fetch_jobs_status_run_at", "status", "run_at"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source_id = Column(String(36), ForeignKey("sources.id"), nullable=False, index=True)
+    active_key = Column(String(36), nullable=True)
+    # "pending" | "leased" | "done" | "dead"
+    status = Column(String(16), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    max_attempts = Column(Integer, nullable=False)
+    # 最早可执行时间：首次为计划时间，失败后为退避后的重试时间
+    run_at = Column(DateTime(timezone=True), nullable=False)
+    # 租约：lease_owner 为领取时生成的令牌，租约过期（worker 崩溃）后任务可被重新领取
+    lease_owner = Column(String(64), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    items_created = Column(Integer, nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # 完成或进入死信的时间，吞吐统计与清理按它查询
+    finished_at = Column(DateTime(timezone=True), nullable=True, index=True)
+
+    def __repr__(self) -> str:  # pragma: no cover - trivial
+        return f"<FetchJob id={self.id} source_id={self.source_id} status={self.status} attempts={self.attempts}>"
+
+
+def _decode_body(blob: bytes, dict_id: t.Optional[int]) -> str:
+    # body_store imports this module, so it is imported on first use
+    from app.storage.body_store import body_store
+    return body_store.decode(blob, dict_id)
+
+
 class Item(Base):
     __tablename__ = "items"
     __table_args__ = (
         UniqueConstraint("fingerprint", name="uq_items_fingerprint"),
+        UniqueConstraint("canonical_url_hash", name="uq_items_canonical_url_hash"),
     )
 
     id = Column(String(36), primary_key=True, default=_new_uuid)
     source_id = Column(String(36), ForeignKey("sources.id"), nullable=True)
     url = Column(Text, nullable=True)
+    # 规范化后的 URL（app.sources.url_canonical）及其 sha256，后者唯一，是入库去重的主键；没有 URL 的条目退回按 fingerprint 去重。
+    # 多个条目指向同一 URL（如首页）时只有第一个持有该哈希，其余条目 canonical_url_hash 为空、按 fingerprint 去重
+    canonical_url = Column(Text, nullable=True)
+    canonical_url_hash = Column(String(64), nullable=True)
     title = Column(Text, nullable=True)
-    content = Column(Text, nullable=True)
-    raw_content = Column(Text, nullable=True)
+    # 正文列可能有几十 KB，默认延迟加载（deferred group "body"）；列表只读 summary，详情查询时再 undefer
+    content = deferred(Column(Text, nullable=True), group="body")
+    raw_content = deferred(Column(Text, nullable=True), group="body")
+    # 压缩存储的 raw_content（app.storage.body_store，启用 BODY_COMPRESSION 时写入），此时 raw_content 为空；
+    # body_dict_id 指向压缩时使用的 zstd 字典（为空表示未使用字典）。to_dict 会透明解压
+    raw_content_z = deferred(Column(LargeBinary, nullable=True), group="body")
+    body_dict_id = Column(Integer, ForeignKey("body_dictionaries.id"), nullable=True)
+    # 入库时预先截取的正文摘要，列表页只需要这一列
+    summary = Column(Text, nullable=True)
     authors = Column(JSON, nullable=True)
 
     published_at = Column(DateTime(timezone=True), nullable=True)
@@ -60,8 +173,19 @@ class Item(Base):
     is_read = Column(Boolean, nullable=False, default=False)
     is_starred = Column(Boolean, nullable=False, default=False)
 
+    # 近似重复检测（app.utils.simhash）：64 位 SimHash（有符号存储）及其 4 个 16 位 LSH 分段，用于按分段查找候选
+    simhash = Column(BigInteger, nullable=True)
+    simhash_band0 = Column(Integer, nullable=True, index=True)
+    simhash_band1 = Column(Integer, nullable=True, index=True)
+    simhash_band2 = Column(Integer, nullable=True, index=True)
+    simhash_band3 = Column(Integer, nullable=True, index=True)
+    # 所属簇：簇内最早入库的条目为簇头（cluster_id 等于自身 id），其余条目 is_duplicate 为真，不出现在信息流中
+    cluster_id = Column(String(36), nullable=True, index=True)
+    is_duplicate = Column(Boolean, nullable=False, default=False, server_default=false())
+
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
-    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+    # 每次插入/更新都会刷新（写入时用 utcnow()）；max(updated_at) 作为列表的版本号（ETag），单条的值作为详情缓存的版本，因此建索引
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), default=utcnow(), onupdate=utcnow(), nullable=False, index=True)
 
     source_obj = relationship("Source", back_populates="items")
 
@@ -70,9 +194,11 @@ class Item(Base):
             "id": self.id,
             "source_id": self.source_id,
             "url": self.url,
+            "canonical_url": self.canonical_url,
             "title": self.title,
             "content": self.content,
-            "raw_content": self.raw_content,
+            "raw_content": self.raw_content if self.raw_content_z is None else _decode_body(self.raw_content_z, self.body_dict_id),
+            "summary": self.summary,
             "authors": self.authors,
             "published_at": self.published_at,
             "fetched_at": self.fetched_at,
@@ -80,7 +206,37 @@ class Item(Base):
             "meta": self.meta,
             "is_read": self.is_read,
             "is_starred": self.is_starred,
+            "cluster_id": self.cluster_id,
+            "is_duplicate": self.is_duplicate,
+            "updated_at": self.updated_at,
         }
 
     def __repr__(self) -> str:  # pragma: no cover - trivial
         return f"<Item id={self.id} title={self.title!r}>"
+
+
+def _feed_order_index(name: str, **kw) -> None:
+    """信息流排序 / 游标分页使用的复合索引：published_at DESC NULLS LAST, fetched_at DESC, id DESC。
+
+    SQLite 不允许在索引定义中写 NULLS LAST，但它的 DESC 本来就把 NULL 排在最后，因此按方言分别建索引。
+    """
+    Index(
+        name, Item.published_at.desc().nulls_last(), Item.fetched_at.desc(), Item.id.desc(), **kw
+    ).ddl_if(callable_=lambda ddl, target, bind, dialect=None, **kw: dialect is None or dialect.name != "sqlite")
+    Index(
+        name, Item.published_at.desc(), Item.fetched_at.desc(), Item.id.desc(), **kw
+    ).ddl_if(dialect="sqlite")
+
+
+_feed_order_index("ix_items_feed_order")
+# 未读 / 收藏视图的部分索引：只包含满足条件的行，已读占多数后未读列表与计数仍然很快
+_feed_order_index(
+    "ix_items_unread_feed_order",
+    postgresql_where=Item.is_read == false(),
+    sqlite_where=Item.is_read == false(),
+)
+_feed_order_index(
+    "ix_items_starred_feed_order",
+    postgresql_where=Item.is_starred == true(),
+    sqlite_where=Item.is_starred == true(),
+)
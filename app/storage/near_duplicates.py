@@ -0,0 +1,152 @@
+"""Near-duplicate clusters over items (the same story syndicated by several feeds or re-published with a
+different URL), built from the SimHash signatures of app.utils.simhash.
+
+Every fingerprinted item stores its 64-bit SimHash plus the BANDS band values in indexed columns. A new
+item looks up candidates with one indexed query on equal band values (pigeonhole: any signature within
+MAX_DISTANCE bits shares at least one band), and the candidates are verified by Hamming distance in
+Python. The cost per item depends on how many rows share a 16-bit band value, not on the size of the
+table scanned.
+
+The oldest item of a cluster is its head (cluster_id == its own id); later members get the head's id as
+cluster_id and is_duplicate=True, and the feed queries hide them. Signatures are only computed when an
+item is first inserted; rebuild_clusters() recomputes everything from items.title/content, e.g. after
+changing the SimHash parameters or for rows stored before the columns existed. It overwrites the old
+values chunk by chunk instead of clearing them first, so hidden duplicates never reappear in the feed
+while it runs.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, tuple_, update
+from sqlalchemy.orm import Session
+
+from app.utils import simhash as sh
+
+from .db import get_session
+from .models import Item
+
+logger = logging.getLogger(__name__)
+
+BAND_COLUMNS = (Item.simhash_band0, Item.simhash_band1, Item.simhash_band2, Item.simhash_band3)
+# keys of signature_values()
+SIGNATURE_KEYS = ("simhash", *(col.key for col in BAND_COLUMNS))
+
+# band values per IN list of the candidate query (BANDS lists per statement)
+CANDIDATE_CHUNK_SIZE = 250
+# items per transaction in rebuild_clusters
+REBUILD_CHUNK_SIZE = 1000
+
+
+def signature_values(title: Optional[str], content: Optional[str]) -> Dict[str, Optional[int]]:
+    """Column values (simhash, simhash_band0..N) for an item; all None when the text is too short."""
+    value = sh.simhash(" ".join(p for p in (title, content) if p))
+    if value is None:
+        return dict.fromkeys(SIGNATURE_KEYS)
+    return {"simhash": sh.to_signed(value), **{col.key: b for col, b in zip(BAND_COLUMNS, sh.bands(value))}}
+
+
+def _candidates(
+    session: Session, rows: List[dict], upto: Optional[Tuple] = None
+) -> Dict[Tuple[int, int], List[Tuple[str, int, str]]]:
+    """Stored items sharing a band value with rows: {(band index, band value): [(id, simhash, cluster_id)]}.
+
+    With upto, only items at or before that (fetched_at, id) key are candidates.
+    """
+    wanted = [sorted({r[col.key] for r in rows}) for col in BAND_COLUMNS]
+    index: Dict[Tuple[int, int], List[Tuple[str, int, str]]] = {}
+    for start in range(0, max(len(w) for w in wanted), CANDIDATE_CHUNK_SIZE):
+        clauses = [col.in_(w[start:start + CANDIDATE_CHUNK_SIZE]) for col, w in zip(BAND_COLUMNS, wanted) if w[start:start + CANDIDATE_CHUNK_SIZE]]
+        stmt = select(Item.id, Item.simhash, Item.cluster_id, *BAND_COLUMNS).where(or_(*clauses))
+        if upto is not None:
+            stmt = stmt.where(tuple_(Item.fetched_at, Item.id) <= tuple_(*upto))
+        for row in session.execute(stmt):
+            entry = (row.id, sh.to_unsigned(row.simhash), row.cluster_id or row.id)
+            for i, col in enumerate(BAND_COLUMNS):
+                index.setdefault((i, row._mapping[col.key]), []).append(entry)
+    return index
+
+
+def assign_clusters(session: Session, rows: List[dict], upto: Optional[Tuple] = None) -> int:
+    """Set cluster_id / is_duplicate on new item rows (dicts with "id" and the signature_values keys).
+
+    rows must be in ingest order: an item that matches an earlier row of the same batch joins that row's
+    cluster. Rows without a signature form a cluster of their own. upto restricts the stored items that
+    are matched against (see _candidates); () matches against none. Returns the number of duplicates.
+    """
+    for r in rows:
+        r["cluster_id"] = r["id"]
+        r["is_duplicate"] = False
+    signed = [r for r in rows if r.get("simhash") is not None]
+    if not signed:
+        return 0
+    stored = _candidates(session, signed, upto) if upto != () else {}
+    batch: Dict[Tuple[int, int], List[Tuple[str, int, str]]] = {}
+    duplicates = 0
+    for r in signed:
+        value = sh.to_unsigned(r["simhash"])
+        keys = [(i, r[col.key]) for i, col in enumerate(BAND_COLUMNS)]
+        best: Optional[Tuple[int, str]] = None
+        for key in keys:
+            for other_id, other_value, cluster_id in stored.get(key, []) + batch.get(key, []):
+                if other_id == r["id"]:
+                    continue
+                distance = sh.hamming(value, other_value)
+                if distance <= sh.MAX_DISTANCE and (best is None or distance < best[0]):
+                    best = (distance, cluster_id)
+        if best is not None:
+            r["cluster_id"] = best[1]
+            r["is_duplicate"] = True
+            duplicates += 1
+        entry = (r["id"], value, r["cluster_id"])
+        for key in keys:
+            batch.setdefault(key, []).append(entry)
+    return duplicates
+
+
+def rebuild_clusters(chunk_size: int = REBUILD_CHUNK_SIZE) -> Dict[str, int]:
+    """Recompute signatures and clusters of all items from title/content, oldest first.
+
+    Walks items in (fetched_at, id) order and rewrites signature, cluster_id and is_duplicate of each
+    chunk_size rows in one transaction. Rows not reached yet keep their old values and are not matched
+    against (only the already rebuilt prefix is), so the feed stays deduplicated throughout and an
+    interrupted rebuild can simply be run again. Returns {"items", "fingerprinted", "duplicates"}.
+    """
+    stats = {"items": 0, "fingerprinted": 0, "duplicates": 0}
+    # (fetched_at, id) of the last rebuilt row; () before the first chunk
+    last: Tuple = ()
+    while True:
+        with get_session() as session:
+            stmt = (
+                select(Item.id, Item.fetched_at, Item.title, Item.content, Item.is_duplicate)
+                .order_by(Item.fetched_at, Item.id)
+                .limit(chunk_size)
+            )
+            if last:
+                stmt = stmt.where(tuple_(Item.fetched_at, Item.id) > tuple_(*last))
+            chunk = session.execute(stmt).all()
+            if not chunk:
+                break
+            rows = [{"id": c.id, **signature_values(c.title, c.content)} for c in chunk]
+            stats["duplicates"] += assign_clusters(session, rows, upto=last)
+            stats["items"] += len(rows)
+            stats["fingerprinted"] += sum(1 for r in rows if r["simhash"] is not None)
+            now = datetime.now(timezone.utc)
+            # bulk UPDATE by primary key; rows entering or leaving the feed get a new updated_at (list version)
+            was_duplicate = {c.id: bool(c.is_duplicate) for c in chunk}
+            session.execute(
+                update(Item), [dict(r, updated_at=now) if r["is_duplicate"] != was_duplicate[r["id"]] else r for r in rows]
+            )
+            last = (chunk[-1].fetched_at, chunk[-1].id)
+        logger.info("Near-duplicate rebuild: %d items processed", stats["items"])
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Rebuild the near-duplicate index from the items table")
+    parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE)
+    args = parser.parse_args()
+    print(rebuild_clusters(args.chunk_size))
@@ -0,0 +1,249 @@
+"""Full-text index over items.title + items.content, using what the database provides natively.
+
+- PostgreSQL: a STORED generated tsvector column items.search_vector (title weighted A, content B) with a
+  GIN index. The database recomputes it whenever title/content change, so every upsert indexes
+  incrementally.
+- SQLite: a contentless FTS5 table items_fts kept in sync by AFTER INSERT/UPDATE/DELETE triggers on
+  items. The UPDATE trigger only fires for title/content changes, so flag updates do not touch the index.
+
+Neither tokenizer splits text without spaces: an unspaced Chinese/Japanese/Korean run would be one
+token, and "苹果" would not find "苹果发布新手机". Both indexes therefore store cjk_tokens() of the text,
+where every CJK character and every pair of adjacent CJK characters is a separate token (SQL function
+cjk_tokens: a plain SQL function on PostgreSQL, registered from Python on SQLite connections by
+app.storage.db). Queries are split the same way (query_tokens): a CJK word matches items containing all
+of its character pairs, a single character matches that character. Other text is tokenized as before.
+
+ensure_search_index() is idempotent and is called from init_db; on SQLite it also indexes rows that existed
+before the index was created and replaces an index built by an older version. On PostgreSQL adding (or
+replacing) the generated column rewrites the whole items table under an ACCESS EXCLUSIVE lock, so
+init_db only does it while items is empty; an existing table is converted by the one-off command
+    python -m app.storage.migrations search
+which runs ensure_search_index(rebuild=True) and builds the GIN index CONCURRENTLY. Until then search
+keeps using the old column (without CJK tokens), or is unavailable if there is none.
+search_statement() builds the ranked query used by the item repositories' search(); it ranks at most
+SEARCH_MAX_CANDIDATES matches. benchmarks/search/bench_search.py measures it on a generated corpus.
+"""
+import logging
+import os
+import re
+from typing import List, Optional
+
+from sqlalchemy import bindparam, column, func, literal_column, select, table, text
+
+from .models import Item
+
+logger = logging.getLogger(__name__)
+
+# text search configuration for to_tsvector / websearch_to_tsquery on PostgreSQL
+PG_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "simple")
+# ranking is linear in the number of matches, so only the newest this many matches of a query are ranked:
+# a narrow query ranks all of its matches, a very broad one ("the") the most recent ones
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "1000"))
+
+# Hiragana/Katakana, CJK ideographs (incl. extension A) and Hangul, as in app.utils.simhash
+_CJK_CLASS = "[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]"
+_CJK_RUN_RE = re.compile(_CJK_CLASS + "+")
+
+# same output as cjk_tokens() below; the characters are split into an array first because substr() on
+# UTF-8 text is linear in the offset
+_PG_FUNCTION = (
+    "CREATE OR REPLACE FUNCTION cjk_tokens(t text) RETURNS text LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$ "
+    "SELECT CASE WHEN t !~ '" + _CJK_CLASS + "' THEN t ELSE ("
+    "SELECT string_agg(CASE WHEN c[i] ~ '" + _CJK_CLASS + "' THEN ' ' || c[i] || "
+    "CASE WHEN c[i + 1] ~ '" + _CJK_CLASS + "' THEN ' ' || c[i] || c[i + 1] ELSE '' END || ' ' "
+    "ELSE c[i] END, '' ORDER BY i) "
+    "FROM (SELECT regexp_split_to_array(t, '') AS c) chars, generate_series(1, cardinality(c)) AS i"
+    ") END $$"
+)
+
+_PG_COLUMN = (
+    "ALTER TABLE items ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('{cfg}', coalesce(cjk_tokens(title), '')), 'A') || "
+    "setweight(to_tsvector('{cfg}', coalesce(cjk_tokens(content), '')), 'B')) STORED"
+)
+_PG_INDEX = "CREATE INDEX {concurrently}IF NOT EXISTS ix_items_search_vector ON items USING GIN (search_vector)"
+
+_SQLITE_TRIGGERS = ("items_fts_ai", "items_fts_ad", "items_fts_au")
+# a contentless table: the tokens are not the stored text, so FTS5 must not read items itself
+_SQLITE_TABLE = (
+    "CREATE VIRTUAL TABLE items_fts USING fts5("
+    "title, content, content='', tokenize='unicode61 remove_diacritics 2')"
+)
+_SQLITE_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN "
+    "INSERT INTO items_fts(rowid, title, content) VALUES (new.rowid, cjk_tokens(new.title), cjk_tokens(new.content)); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, content) "
+    "VALUES ('delete', old.rowid, cjk_tokens(old.title), cjk_tokens(old.content)); END",
+    "CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF title, content ON items BEGIN "
+    "INSERT INTO items_fts(items_fts, rowid, title, content) "
+    "VALUES ('delete', old.rowid, cjk_tokens(old.title), cjk_tokens(old.content)); "
+    "INSERT INTO items_fts(rowid, title, content) VALUES (new.rowid, cjk_tokens(new.title), cjk_tokens(new.content)); END",
+)
+
+_fts = table("items_fts", column("rowid"))
+
+
+def _run_tokens(run: str) -> List[str]:
+    tokens = []
+    for i, char in enumerate(run):
+        tokens.append(char)
+        if i + 1 < len(run):
+            tokens.append(run[i:i + 2])
+    return tokens
+
+
+def cjk_tokens(value: Optional[str]) -> Optional[str]:
+    """Text as indexed: every CJK run replaced by its characters and adjacent character pairs, space separated."""
+    if not value:
+        return value
+    return _CJK_RUN_RE.sub(lambda m: " " + " ".join(_run_tokens(m.group(0))) + " ", value)
+
+
+def query_tokens(term: str) -> List[str]:
+    """Index tokens a query term must match: CJK runs as their character pairs (one character alone as
+    itself), other text unchanged."""
+    tokens: List[str] = []
+    pos = 0
+    for m in _CJK_RUN_RE.finditer(term):
+        if term[pos:m.start()].strip():
+            tokens.append(term[pos:m.start()].strip())
+        run = m.group(0)
+        tokens.extend([run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)])
+        pos = m.end()
+    if term[pos:].strip():
+        tokens.append(term[pos:].strip())
+    return tokens
+
+
+def register_sqlite_functions(dbapi_connection) -> None:
+    """Register cjk_tokens() on a SQLite connection (used by the items_fts triggers)."""
+    dbapi_connection.create_function("cjk_tokens", 1, cjk_tokens, deterministic=True)
+
+
+def ensure_search_index(bind, rebuild: bool = False) -> None:
+    """Create the full-text column/table, index and triggers if missing (PostgreSQL and SQLite only).
+
+    On PostgreSQL a non-empty items table is only rewritten with rebuild=True (see the module docstring).
+    """
+    dialect = bind.dialect.name
+    if dialect == "postgresql":
+        _ensure_pg_index(bind, rebuild)
+        return
+    with bind.begin() as conn:
+        if dialect == "sqlite":
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'items_fts'")).scalar()
+            rebuild = sql is None or "content=''" not in sql
+            if rebuild:
+                if sql is not None:
+                    # external-content table of an older version, indexing the raw text
+                    logger.info("Rebuilding items_fts with CJK tokens")
+                    for name in _SQLITE_TRIGGERS:
+                        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+                    conn.execute(text("DROP TABLE items_fts"))
+                conn.execute(text(_SQLITE_TABLE))
+            for stmt in _SQLITE_DDL:
+                conn.execute(text(stmt))
+            if rebuild:
+                # index the rows stored before the FTS table existed
+                conn.execute(text(
+                    "INSERT INTO items_fts(rowid, title, content) SELECT rowid, cjk_tokens(title), cjk_tokens(content) FROM items"
+                ))
+        else:
+            logger.warning("Full-text search is not supported on dialect %s", dialect)
+
+
+def _ensure_pg_index(bind, rebuild: bool) -> None:
+    with bind.begin() as conn:
+        conn.execute(text(_PG_FUNCTION))
+        expression = conn.execute(text(
+            "SELECT generation_expression FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = 'items' AND column_name = 'search_vector'"
+        )).scalar()
+        current = expression is not None and "cjk_tokens" in expression
+        if current and not rebuild:
+            # the index is built with the column; a missing one is left to the migration command as well
+            return
+        empty = conn.execute(text("SELECT NOT EXISTS (SELECT 1 FROM items)")).scalar()
+        if not (rebuild or empty):
+            logger.warning(
+                "items.search_vector is %s; run `python -m app.storage.migrations search` (rewrites the items "
+                "table, plan for it) to %s it",
+                "missing" if expression is None else "built without CJK tokens",
+                "create" if expression is None else "rebuild",
+            )
+            return
+        if expression is not None and not current:
+            # built without CJK tokens: dropping the column drops its index, both are recreated below
+            logger.info("Rebuilding items.search_vector with CJK tokens")
+            conn.execute(text("ALTER TABLE items DROP COLUMN search_vector"))
+        conn.execute(text(_PG_COLUMN.format(cfg=PG_TS_CONFIG)))
+        if empty:
+            conn.execute(text(_PG_INDEX.format(concurrently="")))
+            return
+    # a large table: build the index without blocking writes (cannot run inside a transaction)
+    with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(_PG_INDEX.format(concurrently="CONCURRENTLY ")))
+
+
+def fts5_query(q: str) -> str:
+    """Turn free user input into an FTS5 query: the query_tokens() of every whitespace-separated term, each
+    as a quoted phrase (AND)."""
+    tokens = [t.replace('"', '""') for term in q.split() for t in query_tokens(term)]
+    return " ".join(f'"{t}"' for t in tokens)
+
+
+def pg_query(q: str) -> str:
+    """websearch_to_tsquery input: q with every CJK run replaced by its query tokens (websearch syntax such as
+    quotes, "or" and "-" keeps working for the other words; CJK words become an AND of their pairs)."""
+    return _CJK_RUN_RE.sub(lambda m: " " + " ".join(query_tokens(m.group(0))) + " ", q)
+
+
+def search_statement(dialect: str, q: str, columns, where=(), max_candidates: int = SEARCH_MAX_CANDIDATES):
+    """Return a SELECT of columns + "rank" for the items matching q, best first.
+
+    dialect: name of the session's dialect ("postgresql" / "sqlite"); where: extra clauses on items.
+    Only the newest max_candidates matches are ranked (see SEARCH_MAX_CANDIDATES); pages past them are empty.
+    Raises NotImplementedError on dialects without a native full-text index.
+    """
+    if dialect == "postgresql":
+        vector = literal_column("items.search_vector")
+        tsq = func.websearch_to_tsquery(literal_column(f"'{PG_TS_CONFIG}'::regconfig"), bindparam("q", pg_query(q)))
+        # feed order, so a broad query walks ix_items_feed_order and stops after max_candidates matches
+        candidates = (
+            select(Item.id)
+            .where(vector.op("@@")(tsq), *where)
+            .order_by(Item.published_at.desc().nulls_last(), Item.fetched_at.desc(), Item.id.desc())
+            .limit(max_candidates)
+            .subquery("candidates")
+        )
+        rank = func.ts_rank_cd(vector, tsq).label("rank")
+        return (
+            select(*columns, rank)
+            .select_from(Item)
+            .join(candidates, candidates.c.id == Item.id)
+            .order_by(rank.desc(), Item.id)
+        )
+    if dialect == "sqlite":
+        match = literal_column("items_fts").op("MATCH")(bindparam("q", fts5_query(q)))
+        items_rowid = literal_column("items.rowid")
+        # driven by items_fts, which returns matches in rowid order without sorting them; the newest rows
+        # have the highest rowids. bm25() (lower is better; title hits weigh more, like the 'A' weight on
+        # PostgreSQL) is only computed for the rows the LIMIT keeps. A rowid constraint next to MATCH
+        # would make FTS5 evaluate the query once per rowid, so ranking happens in this one subquery
+        ranked = (
+            select(_fts.c.rowid.label("rowid"), literal_column("bm25(items_fts, 4.0, 1.0)").label("rank"))
+            .select_from(_fts)
+            .join(Item, items_rowid == _fts.c.rowid)
+            .where(match, *where)
+            .order_by(_fts.c.rowid.desc())
+            .limit(max_candidates)
+            .subquery("ranked")
+        )
+        return (
+            select(*columns, ranked.c.rank)
+            .select_from(Item)
+            .join(ranked, ranked.c.rowid == items_rowid)
+            .order_by(ranked.c.rank, Item.id)
+        )
+    raise NotImplementedError(f"full-text search is not supported on {dialect}")
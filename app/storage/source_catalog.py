@@ -0,0 +1,117 @@
+"""Process-wide, read-mostly cache of source metadata (id -> name/type/enabled).
+
+Sources change rarely but their names are needed on every list/detail request. The catalog loads all
+sources with one query, serves lookups from memory and reloads when the TTL expires or when
+SourceRepository writes (create/update call invalidate()). An id missing from the catalog (a source
+created by another process) triggers a reload, rate-limited by MISS_RELOAD_SECONDS.
+
+aget()/aname() are the asyncio variants used by the async RSSService: they reload through the async
+engine instead of blocking the event loop on the synchronous one.
+"""
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import select
+
+from .db import get_async_session, get_session
+from .models import Source
+
+SOURCE_CATALOG_TTL = float(os.getenv("SOURCE_CATALOG_TTL", "300"))
+MISS_RELOAD_SECONDS = 5.0
+
+
+def _load_all() -> List[dict]:
+    with get_session() as session:
+        rows = session.query(Source.id, Source.name, Source.type, Source.enabled).all()
+    return [{"id": r.id, "name": r.name, "type": r.type, "enabled": r.enabled} for r in rows]
+
+
+async def _aload_all() -> List[dict]:
+    async with get_async_session() as session:
+        rows = (await session.execute(select(Source.id, Source.name, Source.type, Source.enabled))).all()
+    return [{"id": r.id, "name": r.name, "type": r.type, "enabled": r.enabled} for r in rows]
+
+
+class SourceCatalog:
+    """TTL cache of all sources, safe to share between threads.
+
+    loader: returns a list of source dicts (at least "id" and "name"); defaults to one query on sources
+    async_loader: coroutine function with the same result, used by aget()/aname()
+    ttl_seconds: maximum age of the cached data
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[], List[dict]] = _load_all,
+        ttl_seconds: float = SOURCE_CATALOG_TTL,
+        async_loader: Callable[[], Awaitable[List[dict]]] = _aload_all,
+    ):
+        self.loader = loader
+        self.async_loader = async_loader
+        self.ttl_seconds = ttl_seconds
+        self._by_id: Dict[str, dict] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _reload(self) -> None:
+        self._install(self.loader())
+
+    def _install(self, rows: List[dict]) -> None:
+        self._by_id = {r["id"]: r for r in rows}
+        self._loaded_at = time.monotonic()
+
+    def _is_stale(self) -> bool:
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at >= self.ttl_seconds
+
+    def _ensure_fresh(self) -> None:
+        if not self._is_stale():
+            return
+        with self._lock:
+            if self._is_stale():
+                self._reload()
+
+    def get(self, source_id: Optional[str]) -> Optional[dict]:
+        if not source_id:
+            return None
+        self._ensure_fresh()
+        src = self._by_id.get(source_id)
+        if src is None:
+            with self._lock:
+                src = self._by_id.get(source_id)
+                if src is None and time.monotonic() - (self._loaded_at or 0.0) >= MISS_RELOAD_SECONDS:
+                    self._reload()
+                    src = self._by_id.get(source_id)
+        return src
+
+    def name(self, source_id: Optional[str]) -> Optional[str]:
+        src = self.get(source_id)
+        return src.get("name") if src else None
+
+    async def aget(self, source_id: Optional[str]) -> Optional[dict]:
+        if not source_id:
+            return None
+        # concurrent coroutines may reload at the same time; the result is identical, so no lock is held
+        # across the await
+        if self._is_stale():
+            self._install(await self.async_loader())
+        src = self._by_id.get(source_id)
+        if src is None and time.monotonic() - (self._loaded_at or 0.0) >= MISS_RELOAD_SECONDS:
+            self._install(await self.async_loader())
+            src = self._by_id.get(source_id)
+        return src
+
+    async def aname(self, source_id: Optional[str]) -> Optional[str]:
+        src = await self.aget(source_id)
+        return src.get("name") if src else None
+
+    def invalidate(self) -> None:
+        """Force a reload on the next lookup (called after every source write)."""
+        with self._lock:
+            self._loaded_at = None
+
+
+# shared by SourceRepository (invalidation) and RSSService (lookups)
+source_catalog = SourceCatalog()
@@ -1,14 +1,114 @@
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import uuid
 
-from .db import SessionLocal
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from .db import get_async_session, get_session
 from .models import Source
+from .source_catalog import source_catalog
+
+
+def _source_dict(s: Source) -> dict:
+    return {
+        "id": s.id,
+        "name": s.name,
+        "base_url": s.base_url,
+        "type": s.type,
+        "config": s.config,
+        "last_fetch_at": s.last_fetch_at,
+        "enabled": s.enabled,
+        "fetch_interval_seconds": s.fetch_interval_seconds,
+        "etag": s.etag,
+        "last_modified": s.last_modified,
+        "last_fetch_status": s.last_fetch_status,
+        "hwm_published_at": s.hwm_published_at,
+        "hwm_entry_id": s.hwm_entry_id,
+        "next_fetch_at": s.next_fetch_at,
+        "effective_interval_seconds": s.effective_interval_seconds,
+        "publish_rate_per_day": s.publish_rate_per_day,
+        "consecutive_failures": s.consecutive_failures,
+    }
+
+
+# 拉取统计（fetch_stats）查询的列
+_STATS_COLUMNS = (
+    Source.id,
+    Source.name,
+    Source.enabled,
+    Source.fetch_interval_seconds,
+    Source.effective_interval_seconds,
+    Source.publish_rate_per_day,
+    Source.consecutive_failures,
+    Source.fetch_count,
+    Source.failure_count,
+    Source.items_created_total,
+    Source.last_fetch_at,
+    Source.last_fetch_status,
+    Source.next_fetch_at,
+)
+
+
+def _fetch_stats(rows, default_interval_seconds: Optional[int]) -> Dict[str, Any]:
+    """把 _STATS_COLUMNS 的查询结果整理为 {"sources": [...], "totals": {...}}。
+
+    totals 对比固定间隔与自适应间隔下的预计每日拉取次数，以及新条目的平均发现延迟（约为间隔的一半）。
+    """
+    sources: List[dict] = []
+    static_per_day = adaptive_per_day = 0.0
+    weighted_delay = rate_sum = 0.0
+    for r in rows:
+        d = dict(r._mapping)
+        base = d["fetch_interval_seconds"] or default_interval_seconds
+        current = d["effective_interval_seconds"] or base
+        d["expected_delay_seconds"] = current / 2 if current else None
+        sources.append(d)
+        if not d["enabled"] or not base:
+            continue
+        static_per_day += 86400 / base
+        adaptive_per_day += 86400 / current
+        rate = d["publish_rate_per_day"] or 0.0
+        weighted_delay += rate * current / 2
+        rate_sum += rate
+    return {
+        "sources": sources,
+        "totals": {
+            "sources": len(sources),
+            "fetches_per_day_static": round(static_per_day, 1),
+            "fetches_per_day_adaptive": round(adaptive_per_day, 1),
+            "fetches": sum(d["fetch_count"] or 0 for d in sources),
+            "failures": sum(d["failure_count"] or 0 for d in sources),
+            "items_created": sum(d["items_created_total"] or 0 for d in sources),
+            # 按发布速率加权：新条目从发布到被抓取的平均等待时间
+            "expected_item_delay_seconds": round(weighted_delay / rate_sum, 1) if rate_sum else None,
+        },
+    }
+
+
+# 允许通过 update() 修改的字段（除 id 外）
+_UPDATABLE_FIELDS = {"name", "base_url", "type", "config", "enabled", "fetch_interval_seconds", "last_fetch_at", "etag", "last_modified"}
 
 
 class SourceRepository:
+    """Source 的同步仓库（抓取管道、调度器使用）。
+
+    每次调用都在 get_session() 提供的短生命周期会话中完成（与 FetchedItemRepository 相同），
+    因此同一个实例可以被 API、调度线程和管道线程并发使用，也不会读到过期的 identity map 数据。
+    传入 session 时改为使用该会话（测试或需要外部事务时），由调用方负责其生命周期。
+    """
+
     def __init__(self, session=None):
-        self._session = session or SessionLocal()
+        self._session = session
+
+    @contextmanager
+    def _session_scope(self) -> Iterator[Session]:
+        if self._session is not None:
+            yield self._session
+        else:
+            with get_session() as session:
+                yield session
 
     def create(self, name: str, base_url: str, type: Optional[str] = None, config: Optional[dict] = None, fetch_interval_seconds: Optional[int] = None) -> str:
         s = Source(
@@ -20,82 +120,225 @@ class SourceRepository:
             enabled=True,
             fetch_interval_seconds=fetch_interval_seconds,
         )
-        session = self._session
-        session.add(s)
-        session.commit()
-        session.refresh(s)
-        return s.id
+        with self._session_scope() as session:
+            session.add(s)
+            session.commit()
+            session.refresh(s)
+            source_catalog.invalidate()
+            return s.id
 
     def get(self, source_id: str) -> Optional[dict]:
-        session = self._session
-        s = session.query(Source).filter(Source.id == source_id).one_or_none()
-        if not s:
-            return None
-        return {
-            "id": s.id,
-            "name": s.name,
-            "base_url": s.base_url,
-            "type": s.type,
-            "config": s.config,
-            "last_fetch_at": s.last_fetch_at,
-            "enabled": s.enabled,
-            "fetch_interval_seconds": s.fetch_interval_seconds,
-        }
+        with self._session_scope() as session:
+            s = session.query(Source).filter(Source.id == source_id).one_or_none()
+            if not s:
+                return None
+            return _source_dict(s)
 
     def list(self, enabled_only: bool = False) -> List[dict]:
-        session = self._session
-        q = session.query(Source)
-        if enabled_only:
-            q = q.filter(Source.enabled == True)
-        rows = q.order_by(Source.name).all()
-        return [{"id": r.id, "name": r.name, "base_url": r.base_url, "type": r.type, "enabled": r.enabled, "fetch_interval_seconds": r.fetch_interval_seconds} for r in rows]
+        with self._session_scope() as session:
+            q = session.query(Source)
+            if enabled_only:
+                q = q.filter(Source.enabled == True)
+            rows = q.order_by(Source.name).all()
+            return [{"id": r.id, "name": r.name, "base_url": r.base_url, "type": r.type, "config": r.config, "enabled": r.enabled, "fetch_interval_seconds": r.fetch_interval_seconds, "etag": r.etag, "last_modified": r.last_modified, "hwm_published_at": r.hwm_published_at, "hwm_entry_id": r.hwm_entry_id} for r in rows]
 
     def update_last_fetch(self, source_id: str, when: Optional[datetime]):
-        session = self._session
-        s = session.query(Source).filter(Source.id == source_id).one_or_none()
-        if not s:
-            return False
-        s.last_fetch_at = when
-        session.add(s)
-        session.commit()
-        return True
+        with self._session_scope() as session:
+            s = session.query(Source).filter(Source.id == source_id).one_or_none()
+            if not s:
+                return False
+            s.last_fetch_at = when
+            session.add(s)
+            session.commit()
+            return True
+
+    def update_fetch_state(
+        self,
+        source_id: str,
+        when: Optional[datetime],
+        status: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        hwm_published_at: Optional[datetime] = None,
+        hwm_entry_id: Optional[str] = None,
+    ) -> bool:
+        """记录一次拉取的结果：last_fetch_at、last_fetch_status、服务端返回的 ETag / Last-Modified，以及高水位。
+
+        etag / last_modified 为 None 时保留原值（304 响应不一定会重复携带校验器）。
+        hwm_* 为 None 时保留原值；hwm_published_at 只会前进不会后退。
+        """
+        with self._session_scope() as session:
+            s = session.query(Source).filter(Source.id == source_id).one_or_none()
+            if not s:
+                return False
+            s.last_fetch_at = when
+            s.last_fetch_status = status
+            if etag is not None:
+                s.etag = etag
+            if last_modified is not None:
+                s.last_modified = last_modified
+            if hwm_published_at is not None:
+                current = s.hwm_published_at
+                if current is not None and current.tzinfo is None:
+                    current = current.replace(tzinfo=timezone.utc)
+                if current is None or hwm_published_at > current:
+                    s.hwm_published_at = hwm_published_at
+                    s.hwm_entry_id = hwm_entry_id
+            elif hwm_entry_id is not None:
+                s.hwm_entry_id = hwm_entry_id
+            session.add(s)
+            session.commit()
+            return True
 
     def update(self, source_id: str, fields: Dict[str, Any]) -> bool:
-        """更新指定 source 的多个字段。只允许更新除 id 外的字段：name, base_url, type, config, enabled, fetch_interval_seconds, last_fetch_at。
+        """更新指定 source 的多个字段。只允许更新除 id 外的字段：name, base_url, type, config, enabled, fetch_interval_seconds, last_fetch_at, etag, last_modified。
 
         fields: dict 中可包含上述键。返回 True 表示成功，False 表示未找到 source。
         """
-        allowed = {"name", "base_url", "type", "config", "enabled", "fetch_interval_seconds", "last_fetch_at"}
-        session = self._session
-        s = session.query(Source).filter(Source.id == source_id).one_or_none()
-        if not s:
-            return False
-        for k, v in fields.items():
-            if k in allowed:
-                setattr(s, k, v)
-        session.add(s)
-        session.commit()
-        return True
+        allowed = _UPDATABLE_FIELDS
+        with self._session_scope() as session:
+            s = session.query(Source).filter(Source.id == source_id).one_or_none()
+            if not s:
+                return False
+            for k, v in fields.items():
+                if k in allowed:
+                    setattr(s, k, v)
+            session.add(s)
+            session.commit()
+            source_catalog.invalidate()
+            return True
 
-    def list_due_sources(self, now: datetime, default_interval_seconds: Optional[int] = None) -> List[dict]:
-        """返回当前已到期需要拉取的 sources 列表。
+    def list_due_sources(self, now: datetime, default_interval_seconds: Optional[int] = None, limit: Optional[int] = None) -> List[dict]:
+        """返回 next_fetch_at 不晚于 now 的已启用 sources，按 next_fetch_at 升序（尚未排期的排在最前）。
 
-        逻辑：只考虑 enabled 的 sources；优先使用 source.fetch_interval_seconds，若为 None 则使用传入的 default_interval_seconds；
-        若最终间隔为 None 则忽略该 source（表示由外部/手动调度）。
-        如果 last_fetch_at 为 None 则视为到期。
+        到期判断在 SQL 中通过 next_fetch_at 索引完成，不再加载全部 source。
+        间隔优先使用 source.fetch_interval_seconds，为 None 时使用 default_interval_seconds；两者都为 None 的
+        source 不自动调度（由外部/手动触发），不会出现在结果中。
+        每项包含 id, name, base_url, type, config, fetch_interval_seconds（配置的间隔，为空时取默认值）, last_fetch_at,
+        next_fetch_at，以及自适应调度状态 effective_interval_seconds, publish_rate_per_day, consecutive_failures。
         """
-        session = self._session
-        rows = session.query(Source).filter(Source.enabled == True).all()
-        due: List[dict] = []
-        for r in rows:
-            interval = r.fetch_interval_seconds if r.fetch_interval_seconds is not None else default_interval_seconds
-            if interval is None:
-                # no automatic schedule for this source
-                continue
-            if r.last_fetch_at is None:
-                due.append({"id": r.id, "name": r.name, "base_url": r.base_url, "type": r.type, "fetch_interval_seconds": interval})
-                continue
-            elapsed = (now - r.last_fetch_at).total_seconds()
-            if elapsed >= interval:
-                due.append({"id": r.id, "name": r.name, "base_url": r.base_url, "type": r.type, "fetch_interval_seconds": interval})
-        return due
+        stmt = (
+            select(
+                Source.id, Source.name, Source.base_url, Source.type, Source.config, Source.fetch_interval_seconds,
+                Source.last_fetch_at, Source.next_fetch_at, Source.effective_interval_seconds, Source.publish_rate_per_day,
+                Source.consecutive_failures,
+            )
+            .where(Source.enabled == True, or_(Source.next_fetch_at.is_(None), Source.next_fetch_at <= now))
+            .order_by(Source.next_fetch_at.asc().nulls_first())
+        )
+        if default_interval_seconds is None:
+            stmt = stmt.where(Source.fetch_interval_seconds.is_not(None))
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        with self._session_scope() as session:
+            rows = session.execute(stmt).all()
+        return [
+            {
+                "id": r.id,
+                "name": r.name,
+                "base_url": r.base_url,
+                "type": r.type,
+                "fetch_interval_seconds": r.fetch_interval_seconds if r.fetch_interval_seconds is not None else default_interval_seconds,
+                "config": r.config,
+                "last_fetch_at": r.last_fetch_at,
+                "next_fetch_at": r.next_fetch_at,
+                "effective_interval_seconds": r.effective_interval_seconds,
+                "publish_rate_per_day": r.publish_rate_per_day,
+                "consecutive_failures": r.consecutive_failures or 0,
+            }
+            for r in rows
+        ]
+
+    def set_next_fetch(self, schedule: Dict[str, Optional[datetime]]) -> None:
+        """批量写入 next_fetch_at：schedule 为 {source_id: 下一次拉取时间}，按主键批量 UPDATE。"""
+        if not schedule:
+            return
+        with self._session_scope() as session:
+            session.execute(update(Source), [{"id": sid, "next_fetch_at": at} for sid, at in schedule.items()])
+            session.commit()
+
+    def record_schedule(
+        self,
+        source_id: str,
+        next_fetch_at: datetime,
+        effective_interval_seconds: Optional[int],
+        publish_rate_per_day: Optional[float],
+        consecutive_failures: int,
+        created: Optional[int],
+    ) -> None:
+        """记录一次调度运行的结果：下一次时间、自适应状态，并累加统计（created 为 None 表示失败）。"""
+        values: Dict[str, Any] = {
+            "next_fetch_at": next_fetch_at,
+            "effective_interval_seconds": effective_interval_seconds,
+            "publish_rate_per_day": publish_rate_per_day,
+            "consecutive_failures": consecutive_failures,
+            "fetch_count": Source.fetch_count + 1,
+        }
+        if created is None:
+            values["failure_count"] = Source.failure_count + 1
+        else:
+            values["items_created_total"] = Source.items_created_total + created
+        with self._session_scope() as session:
+            session.execute(update(Source).where(Source.id == source_id).values(**values))
+            session.commit()
+
+    def fetch_stats(self, default_interval_seconds: Optional[int] = None) -> Dict[str, Any]:
+        """每个 source 的调度统计与汇总，见 _fetch_stats。"""
+        with self._session_scope() as session:
+            rows = session.execute(select(*_STATS_COLUMNS).order_by(Source.name)).all()
+        return _fetch_stats(rows, default_interval_seconds)
+
+
+class AsyncSourceRepository:
+    """SourceRepository 的异步版本（AsyncSession），供 async controller / service 使用。
+
+    每次调用使用独立的短生命周期会话；写操作同样会使共享的 source_catalog 失效。
+    """
+
+    def __init__(self, session_factory=None):
+        self._session_factory = session_factory or get_async_session
+
+    async def create(self, name: str, base_url: str, type: Optional[str] = None, config: Optional[dict] = None, fetch_interval_seconds: Optional[int] = None) -> str:
+        s = Source(
+            id=str(uuid.uuid4()),
+            name=name,
+            base_url=base_url,
+            type=type,
+            config=config or {},
+            enabled=True,
+            fetch_interval_seconds=fetch_interval_seconds,
+        )
+        async with self._session_factory() as session:
+            session.add(s)
+        source_catalog.invalidate()
+        return s.id
+
+    async def get(self, source_id: str) -> Optional[dict]:
+        async with self._session_factory() as session:
+            s = (await session.execute(select(Source).where(Source.id == source_id))).scalar_one_or_none()
+        return _source_dict(s) if s else None
+
+    async def list(self, enabled_only: bool = False) -> List[dict]:
+        stmt = select(Source)
+        if enabled_only:
+            stmt = stmt.where(Source.enabled == True)
+        async with self._session_factory() as session:
+            rows = (await session.execute(stmt.order_by(Source.name))).scalars().all()
+        return [_source_dict(r) for r in rows]
+
+    async def update(self, source_id: str, fields: Dict[str, Any]) -> bool:
+        """与 SourceRepository.update 相同：只更新允许的字段，返回 False 表示未找到 source。"""
+        async with self._session_factory() as session:
+            s = (await session.execute(select(Source).where(Source.id == source_id))).scalar_one_or_none()
+            if not s:
+                return False
+            for k, v in fields.items():
+                if k in _UPDATABLE_FIELDS:
+                    setattr(s, k, v)
+        source_catalog.invalidate()
+        return True
+
+    async def fetch_stats(self, default_interval_seconds: Optional[int] = None) -> Dict[str, Any]:
+        async with self._session_factory() as session:
+            rows = (await session.execute(select(*_STATS_COLUMNS).order_by(Source.name))).all()
+        return _fetch_stats(rows, default_interval_seconds)
@@ -0,0 +1,135 @@
+"""In-process publish/subscribe for server-sent events.
+
+Publishers (the ingest pipeline, possibly on worker threads, and app.services.item_event_relay for items
+ingested by other processes) call EventBus.publish(); every subscriber (one per open SSE connection,
+living on the API's event loop) receives the event through its own bounded buffer. A subscriber whose buffer is full is dropped instead of slowing down publishers or
+growing without bound: its stream ends and the client reconnects.
+
+Event ids are "<epoch>-<seq>" with a per-process epoch, and the last history_size events are kept in a
+ring buffer, so a reconnecting client sending Last-Event-ID gets exactly the events it missed. When the
+id is unknown (bus restarted, or the client fell further behind than the ring buffer) the subscription
+is flagged with reset=True so the client can reload its list instead.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Event:
+    id: str
+    seq: int
+    kind: str
+    data: Dict[str, Any] = field(default_factory=dict)
+
+
+class Subscription:
+    """One consumer of the bus. Use `await sub.get()`; None means the subscription was dropped."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, max_buffer: int):
+        self.loop = loop
+        self.max_buffer = max_buffer
+        self.queue: "asyncio.Queue[Optional[Event]]" = asyncio.Queue()
+        self.dropped = False
+        # events missed since Last-Event-ID, to be sent before anything from the queue
+        self.replay: List[Event] = []
+        # Last-Event-ID could not be resumed from; the client should reload instead of replaying
+        self.reset = False
+
+    def _deliver(self, event: Event) -> None:
+        # runs on the subscriber's loop (scheduled with call_soon_threadsafe)
+        if self.dropped:
+            return
+        if self.queue.qsize() >= self.max_buffer:
+            self.dropped = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        self.queue.put_nowait(event)
+
+    async def get(self) -> Optional[Event]:
+        return await self.queue.get()
+
+
+class EventBus:
+    """Thread-safe fan-out of events to asyncio subscribers.
+
+    history_size: number of recent events kept for Last-Event-ID resume
+    client_buffer: events buffered per subscriber before it is considered too slow and dropped
+    """
+
+    def __init__(self, history_size: int = 1000, client_buffer: int = 256):
+        self.client_buffer = client_buffer
+        self._epoch = format(int(time.time() * 1000), "x")
+        self._seq = 0
+        self._history: Deque[Event] = deque(maxlen=history_size)
+        self._subs: Set[Subscription] = set()
+        self._lock = threading.Lock()
+        self.dropped_subscribers = 0
+
+    def publish(self, kind: str, data: Dict[str, Any]) -> Event:
+        """Record an event and hand it to every subscriber; callable from any thread."""
+        with self._lock:
+            self._seq += 1
+            event = Event(id=f"{self._epoch}-{self._seq}", seq=self._seq, kind=kind, data=data)
+            self._history.append(event)
+            subs = list(self._subs)
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(self._deliver, sub, event)
+            except RuntimeError:
+                # the subscriber's loop is closed
+                self.unsubscribe(sub)
+        return event
+
+    def _deliver(self, sub: Subscription, event: Event) -> None:
+        was_dropped = sub.dropped
+        sub._deliver(event)
+        if sub.dropped and not was_dropped:
+            self.dropped_subscribers += 1
+            logger.warning("Dropping slow event subscriber (more than %d buffered events)", sub.max_buffer)
+            self.unsubscribe(sub)
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """Register a subscriber on the running event loop, resuming after last_event_id when possible."""
+        sub = Subscription(asyncio.get_running_loop(), self.client_buffer)
+        with self._lock:
+            if last_event_id:
+                seq = self._parse_id(last_event_id)
+                oldest = self._history[0].seq if self._history else self._seq + 1
+                if seq is None or seq > self._seq or seq < oldest - 1:
+                    sub.reset = True
+                else:
+                    sub.replay = [e for e in self._history if e.seq > seq]
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def _parse_id(self, event_id: str) -> Optional[int]:
+        epoch, _, seq = event_id.strip().partition("-")
+        if epoch != self._epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def history(self, kind: Optional[str] = None) -> List[Event]:
+        """The events kept for resume (of one kind), oldest first."""
+        with self._lock:
+            return [e for e in self._history if kind is None or e.kind == kind]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subs)
+
+
+# shared by the pipelines (publishers) and the API (SSE subscribers) of one process
+event_bus = EventBus()
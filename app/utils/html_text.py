@@ -0,0 +1,84 @@
+"""HTML -> plain text extraction for feed/email bodies.
+
+Streams lxml's HTML parser events into a small collector instead of building a tree, which is several
+times faster than BeautifulSoup on typical feed summaries. The output matches the previous
+BeautifulSoup(html, "lxml") + get_text() + whitespace-collapse implementation exactly:
+
+- text inside script/style (and rt/rp/template, which BeautifulSoup's get_text also leaves out) is dropped
+- comments, processing instructions and doctypes are ignored
+- all runs of whitespace collapse to a single space, leading/trailing whitespace is removed
+
+Golden files and a benchmark against the BeautifulSoup version live in benchmarks/html_text/.
+"""
+import threading
+
+from lxml import etree
+
+# tags whose text BeautifulSoup's get_text() does not return (string containers with special types)
+SKIP_TEXT_TAGS = frozenset({"script", "style", "rt", "rp", "template"})
+
+_local = threading.local()
+
+
+class _TextCollector:
+    """lxml parser target: keeps character data that is not inside a SKIP_TEXT_TAGS element."""
+
+    def __init__(self):
+        self.parts = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrib):
+        if tag in SKIP_TEXT_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag):
+        if tag in SKIP_TEXT_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def close(self):
+        text = "".join(self.parts)
+        self.parts = []
+        self.skip_depth = 0
+        return text
+
+
+def _parser() -> etree.HTMLParser:
+    # lxml parsers are not thread-safe; keep one (reusable) parser per thread
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = etree.HTMLParser(target=_TextCollector(), recover=True, strip_cdata=False)
+        _local.parser = parser
+    return parser
+
+
+def _extract_with_bs4(html: str) -> str:
+    # reference implementation, only used when lxml refuses the input (e.g. nothing but a comment)
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "lxml")
+    for s in soup(["script", "style"]):
+        s.decompose()
+    return soup.get_text()
+
+
+def html_to_text(html: str | None) -> str:
+    """Return the visible text of an HTML fragment with whitespace collapsed to single spaces."""
+    if not html:
+        return ""
+    if html[0] == "\ufeff":
+        html = html[1:]
+    if not html or html.isspace():
+        return ""
+    parser = _parser()
+    try:
+        parser.feed(html)
+        text = parser.close()
+    except etree.LxmlError:
+        # reset the thread-local parser state and fall back to the slow path for this input
+        _local.parser = None
+        text = _extract_with_bs4(html)
+    return " ".join(text.split())
@@ -0,0 +1,228 @@
+"""In-process metrics (counters and histograms) rendered in the Prometheus text exposition format.
+
+Recording sits in hot loops (every fetched feed, every upsert batch, every API request), so it takes no
+lock: each thread writes to its own shard (a plain dict of label values -> number or bucket list) and
+only the scrape (render()) walks all shards and adds them up. Shards of finished threads are folded into
+a retired shard at scrape time, so short-lived threads do not lose their counts.
+
+Usage:
+    from app.utils.metrics import registry
+    FETCHES = registry.counter("rss_fetches_total", "Feed fetches", ("status",))
+    LATENCY = registry.histogram("item_upsert_duration_seconds", "Upsert latency", ("op",))
+    FETCHES.inc(status="ok")
+    LATENCY.observe(0.012, op="batch")
+    with LATENCY.time(op="batch"):
+        ...
+
+The API serves registry.render() at GET /metrics. Processes without the API (the scheduler) can expose
+their own registry with serve(port) (METRICS_PORT for python -m app.pipelines.scheduler).
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# latency buckets in seconds, from a cached API response to a slow feed download
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_Key = Tuple[str, Tuple[str, ...]]
+
+
+class _Shard:
+    __slots__ = ("thread", "counters", "histograms")
+
+    def __init__(self, thread: Optional[threading.Thread]):
+        self.thread = thread
+        self.counters: Dict[_Key, float] = {}
+        # key -> [count per bucket (len(buckets) + 1 for +Inf)..., sum]
+        self.histograms: Dict[_Key, List[float]] = {}
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, documentation: str, labelnames: Sequence[str]):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Dict[str, object]) -> _Key:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return self.name, tuple(str(labels[n]) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        counters = self.registry._shard().counters
+        key = self._key(labels)
+        counters[key] = counters.get(key, 0.0) + amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        histograms = self.registry._shard().histograms
+        key = self._key(labels)
+        h = histograms.get(key)
+        if h is None:
+            h = histograms[key] = [0.0] * (len(self.buckets) + 2)
+        h[bisect.bisect_left(self.buckets, value)] += 1
+        h[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class MetricsRegistry:
+    """Set of metrics with per-thread shards; see the module docstring."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None)
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if existing.kind != metric.kind or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"metric {metric.name} already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _collect(self) -> Tuple[Dict[_Key, float], Dict[_Key, List[float]]]:
+        with self._lock:
+            alive = []
+            for shard in self._shards:
+                if shard.thread is not None and not shard.thread.is_alive():
+                    # the thread is gone, its shard cannot change any more
+                    self._merge(self._retired, shard.counters.items(), shard.histograms.items())
+                else:
+                    alive.append(shard)
+            self._shards = alive
+            total = _Shard(None)
+            self._merge(total, self._retired.counters.items(), self._retired.histograms.items())
+            for shard in alive:
+                # list() copies the dicts atomically under the GIL while their threads keep writing
+                self._merge(total, list(shard.counters.items()), list(shard.histograms.items()))
+        return total.counters, total.histograms
+
+    @staticmethod
+    def _merge(into: _Shard, counters, histograms) -> None:
+        for key, value in counters:
+            into.counters[key] = into.counters.get(key, 0.0) + value
+        for key, values in histograms:
+            h = into.histograms.get(key)
+            if h is None:
+                into.histograms[key] = list(values)
+            else:
+                for i, v in enumerate(values):
+                    h[i] += v
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        counters, histograms = self._collect()
+        by_name: Dict[str, list] = {}
+        for (name, values), value in counters.items():
+            by_name.setdefault(name, []).append((values, value))
+        for (name, values), value in histograms.items():
+            by_name.setdefault(name, []).append((values, value))
+        lines: List[str] = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for values, value in sorted(by_name.get(name, ()), key=lambda s: s[0]):
+                if isinstance(metric, Histogram):
+                    cumulative = 0.0
+                    for bound, count in zip(metric.buckets + (float("inf"),), value):
+                        cumulative += count
+                        le = 'le="%s"' % _number(bound)
+                        lines.append(f"{name}_bucket{_labels(metric.labelnames, values, le)} {_number(cumulative)}")
+                    lines.append(f"{name}_sum{_labels(metric.labelnames, values)} {_number(value[-1])}")
+                    lines.append(f"{name}_count{_labels(metric.labelnames, values)} {_number(cumulative)}")
+                else:
+                    lines.append(f"{name}{_labels(metric.labelnames, values)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# process-wide registry used by the pipelines, repositories, scheduler and API
+registry = MetricsRegistry()
+
+# Prometheus text format content type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def serve(port: int, host: str = "0.0.0.0", metrics: Optional[MetricsRegistry] = None):
+    """Serve GET /metrics on a daemon thread (for processes without the API); returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    metrics = metrics or registry
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
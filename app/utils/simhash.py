@@ -0,0 +1,70 @@
+"""64-bit SimHash signatures and LSH banding for near-duplicate detection.
+
+Two texts whose SimHashes differ in at most MAX_DISTANCE bits are treated as near-duplicates. The
+signature is split into BANDS bands of 64 / BANDS bits; with BANDS > MAX_DISTANCE any two signatures within
+MAX_DISTANCE bits agree on at least one whole band (pigeonhole), so looking up candidates by equal band
+values finds every near-duplicate while touching only a tiny fraction of the corpus.
+
+Features are shingles of SHINGLE_SIZE consecutive tokens; words are split on non-word characters and
+CJK characters count as one token each, so Chinese text without spaces is handled too.
+"""
+import hashlib
+import re
+from collections import Counter
+from typing import List, Optional
+
+BITS = 64
+BANDS = 4
+BAND_BITS = BITS // BANDS
+MAX_DISTANCE = 3
+SHINGLE_SIZE = 3
+# texts with fewer tokens give unstable signatures (e.g. title-only items) and are not fingerprinted
+MIN_TOKENS = 8
+
+_MASK = (1 << BITS) - 1
+_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]|[^\W_]+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _hash64(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def simhash(text: Optional[str]) -> Optional[int]:
+    """Unsigned 64-bit SimHash of text, or None when the text is too short to fingerprint."""
+    tokens = tokenize(text or "")
+    if len(tokens) < MIN_TOKENS:
+        return None
+    shingles = Counter(" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1))
+    weights = [0] * BITS
+    for feature, count in shingles.items():
+        h = _hash64(feature)
+        for bit in range(BITS):
+            weights[bit] += count if (h >> bit) & 1 else -count
+    value = 0
+    for bit in range(BITS):
+        if weights[bit] > 0:
+            value |= 1 << bit
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & _MASK).bit_count()
+
+
+def bands(value: int) -> List[int]:
+    """The BANDS band values (each BAND_BITS wide) of an unsigned signature."""
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (i * BAND_BITS)) & mask for i in range(BANDS)]
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned 64-bit signature into the BIGINT range for storage."""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK
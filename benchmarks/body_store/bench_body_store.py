@@ -0,0 +1,105 @@
+"""Size and decode-latency benchmark for app.storage.body_store (zstd-compressed raw_content).
+
+Usage (from the repository root, against the configured DATABASE_URL):
+    python -m benchmarks.body_store.bench_body_store                 # up to 2000 bodies per source
+    python -m benchmarks.body_store.bench_body_store --per-source 500 --level 3
+
+For every source with stored bodies, the newest ones are split into a training part (80%, used for the
+dictionary) and a test part (20%, measured), so dictionary numbers are not flattered by compressing the
+training data. Reports bytes per item for plain UTF-8, zstd without a dictionary and zstd with a
+per-source dictionary, plus the decode latency of each. Nothing is written to the database.
+"""
+import argparse
+import sys
+import time
+from collections import defaultdict
+
+import zstandard
+from sqlalchemy import select
+
+from app.storage.body_store import DICT_MIN_SAMPLES, DICT_SIZE, ZSTD_LEVEL, body_store
+from app.storage.db import get_session
+from app.storage.models import Item
+
+
+def load_bodies(per_source: int):
+    by_source = defaultdict(list)
+    with get_session() as session:
+        rows = session.execute(
+            select(Item.source_id, Item.raw_content, Item.raw_content_z, Item.body_dict_id)
+            .where((Item.raw_content.is_not(None)) | (Item.raw_content_z.is_not(None)))
+            .order_by(Item.source_id, Item.fetched_at.desc())
+        )
+        for source_id, raw, blob, dict_id in rows:
+            if len(by_source[source_id]) < per_source:
+                text = raw if raw is not None else body_store.decode(blob, dict_id)
+                if text:
+                    by_source[source_id].append(text.encode("utf-8"))
+    return by_source
+
+
+def decode_time(decompressor, blobs, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for blob in blobs:
+            decompressor.decompress(blob)
+    return (time.perf_counter() - start) / (rounds * len(blobs))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--per-source", type=int, default=2000, help="newest bodies per source to sample")
+    ap.add_argument("--level", type=int, default=ZSTD_LEVEL)
+    ap.add_argument("--dict-size", type=int, default=DICT_SIZE)
+    ap.add_argument("--rounds", type=int, default=20)
+    args = ap.parse_args(argv)
+
+    by_source = load_bodies(args.per_source)
+    if not by_source:
+        print("no stored bodies; ingest some feeds first")
+        return 1
+
+    totals = defaultdict(float)
+    plain_c = zstandard.ZstdCompressor(level=args.level)
+    plain_d = zstandard.ZstdDecompressor()
+    for source_id, bodies in sorted(by_source.items(), key=lambda kv: str(kv[0])):
+        split = len(bodies) * 4 // 5
+        train, test = bodies[:split], bodies[split:]
+        if len(train) < DICT_MIN_SAMPLES or not test:
+            # too few bodies for a dictionary: measure everything without one
+            train, test = [], bodies
+        nodict = [plain_c.compress(b) for b in test]
+        line = {
+            "plain": sum(map(len, test)),
+            "zstd": sum(map(len, nodict)),
+            "zstd_s": decode_time(plain_d, nodict, args.rounds) * len(test),
+        }
+        if train:
+            d = zstandard.train_dictionary(args.dict_size, train, level=args.level)
+            dict_c = zstandard.ZstdCompressor(level=args.level, dict_data=d)
+            withdict = [dict_c.compress(b) for b in test]
+            line["dict"] = sum(map(len, withdict))
+            line["dict_s"] = decode_time(zstandard.ZstdDecompressor(dict_data=d), withdict, args.rounds) * len(test)
+        else:
+            line["dict"], line["dict_s"] = line["zstd"], line["zstd_s"]
+        for k, v in line.items():
+            totals[k] += v
+        totals["items"] += len(test)
+        n = len(test)
+        print(
+            f"{str(source_id)[:36]:36}  n={n:5d}  plain {line['plain'] / n:8.0f} B  zstd {line['zstd'] / n:7.0f} B"
+            f"  dict {line['dict'] / n:7.0f} B{'' if train else ' (no dict)'}"
+        )
+
+    n = totals["items"]
+    print(f"\n{int(n)} items measured, level {args.level}, dictionary {args.dict_size} B")
+    print(f"plain          : {totals['plain'] / n:8.0f} bytes/item")
+    print(f"zstd           : {totals['zstd'] / n:8.0f} bytes/item  ({totals['plain'] / totals['zstd']:.2f}x)"
+          f"  decode {totals['zstd_s'] / n * 1e6:6.1f} us/item")
+    print(f"zstd + dict    : {totals['dict'] / n:8.0f} bytes/item  ({totals['plain'] / totals['dict']:.2f}x)"
+          f"  decode {totals['dict_s'] / n * 1e6:6.1f} us/item")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+"""Golden-file check and benchmark for app.utils.html_text against the old BeautifulSoup cleaner.
+
+Usage (from the repository root):
+    python -m benchmarks.html_text.bench_html_text              # verify golden files, then benchmark
+    python -m benchmarks.html_text.bench_html_text --regen      # rewrite golden *.txt from the BeautifulSoup reference
+    python -m benchmarks.html_text.bench_html_text --feed URL   # also check/benchmark the summaries of a live feed
+
+Every corpus/<name>.html has a golden corpus/<name>.txt. The script exits non-zero if either the new
+extractor or the BeautifulSoup reference differs from a golden file (or from each other on feed input).
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from app.utils.html_text import html_to_text
+
+CORPUS_DIR = Path(__file__).parent / "corpus"
+
+
+def bs4_clean_html(html: str) -> str:
+    """The previous app.sources.rss._clean_html implementation, kept as the reference."""
+    soup = BeautifulSoup(html or "", "lxml")
+    for s in soup(["script", "style"]):
+        s.decompose()
+    text = soup.get_text().strip()
+    return " ".join(text.split())
+
+
+def load_corpus():
+    docs = []
+    for path in sorted(CORPUS_DIR.glob("*.html")):
+        docs.append((path, path.read_text(encoding="utf-8")))
+    return docs
+
+
+def load_feed(url: str):
+    import feedparser
+
+    feed = feedparser.parse(url)
+    return [(f"{url}#{i}", e.get("summary", "")) for i, e in enumerate(feed.entries)]
+
+
+def check_golden(docs) -> int:
+    failures = 0
+    for path, html in docs:
+        golden = path.with_suffix(".txt").read_text(encoding="utf-8")
+        for name, func in (("html_to_text", html_to_text), ("bs4", bs4_clean_html)):
+            got = func(html)
+            if got != golden:
+                failures += 1
+                print(f"MISMATCH {path.name} ({name}):\n  expected {golden!r}\n  got      {got!r}")
+    return failures
+
+
+def check_equal(docs) -> int:
+    failures = 0
+    for name, html in docs:
+        expected, got = bs4_clean_html(html), html_to_text(html)
+        if expected != got:
+            failures += 1
+            print(f"MISMATCH {name}:\n  bs4          {expected!r}\n  html_to_text {got!r}")
+    return failures
+
+
+def bench(func, htmls, rounds: int) -> float:
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in htmls:
+            func(html)
+    return (time.perf_counter() - start) / (rounds * len(htmls))
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--regen", action="store_true", help="rewrite golden files from the BeautifulSoup reference")
+    ap.add_argument("--feed", action="append", default=[], help="feed URL whose summaries are added to the benchmark")
+    ap.add_argument("--rounds", type=int, default=200)
+    args = ap.parse_args(argv)
+
+    docs = load_corpus()
+    if args.regen:
+        for path, html in docs:
+            path.with_suffix(".txt").write_text(bs4_clean_html(html), encoding="utf-8")
+        print(f"rewrote {len(docs)} golden files")
+        return 0
+
+    failures = check_golden(docs)
+    htmls = [html for _, html in docs]
+    for url in args.feed:
+        feed_docs = load_feed(url)
+        failures += check_equal(feed_docs)
+        htmls.extend(html for _, html in feed_docs)
+    if failures:
+        print(f"{failures} mismatches")
+        return 1
+    print(f"golden check ok: {len(docs)} corpus files, {len(htmls)} documents benchmarked")
+
+    old = bench(bs4_clean_html, htmls, args.rounds)
+    new = bench(html_to_text, htmls, args.rounds)
+    print(f"bs4 get_text : {old * 1e6:8.1f} us/doc")
+    print(f"html_to_text : {new * 1e6:8.1f} us/doc")
+    print(f"speedup      : {old / new:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Latency benchmark for full-text search (app.storage.search) on a generated corpus.
+
+Usage (from the repository root, against a scratch database):
+    DATABASE_URL=sqlite:////tmp/search_bench.db python -m benchmarks.search.bench_search               # 1M items
+    DATABASE_URL=... python -m benchmarks.search.bench_search --items 200000 --rounds 20
+    DATABASE_URL=... python -m benchmarks.search.bench_search --reuse      # query an already generated corpus
+
+The corpus mixes Zipf-distributed English words and Chinese text, so queries range from a rare term (a few
+hundred matches) to one that is in most items. Every query runs first page (LIMIT 20) searches through
+search_statement() as the repositories do (feed filter included), once with the default candidate cap
+(SEARCH_MAX_CANDIDATES) and once uncapped, and reports the median and p95 latency of each. The generator
+refuses to write into a database whose items table already has rows.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, insert, select
+
+from app.storage.db import engine, get_session, init_db
+from app.storage.models import Item
+from app.storage.search import SEARCH_MAX_CANDIDATES, search_statement
+
+WORDS = [f"w{i}" for i in range(20000)]
+HANZI = "的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严"
+
+
+def _word(rng: random.Random) -> str:
+    # Zipf-like: the first words are very common, most are rare
+    return WORDS[min(int(rng.paretovariate(1.1)) - 1, len(WORDS) - 1)]
+
+
+def _cjk(rng: random.Random, n: int) -> str:
+    return "".join(HANZI[min(int(rng.paretovariate(0.9)) - 1, len(HANZI) - 1)] for _ in range(n))
+
+
+def generate(items: int, batch: int = 5000, seed: int = 1) -> None:
+    rng = random.Random(seed)
+    start = datetime.now(timezone.utc) - timedelta(days=365)
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, items, batch):
+            rows = []
+            for i in range(offset, min(offset + batch, items)):
+                title = " ".join(_word(rng) for _ in range(6)) + " " + _cjk(rng, 8)
+                content = " ".join(_word(rng) for _ in range(60)) + " " + _cjk(rng, 80)
+                rows.append({
+                    "id": str(uuid.uuid4()),
+                    "title": title,
+                    "content": content,
+                    "summary": content[:200],
+                    "fingerprint": f"bench-{i}",
+                    "published_at": start + timedelta(seconds=i * 31),
+                    "is_duplicate": False,
+                })
+            conn.execute(insert(Item), rows)
+            if (offset // batch) % 20 == 0:
+                print(f"  {offset + len(rows)} items ({time.perf_counter() - t0:.0f}s)", flush=True)
+    print(f"generated {items} items in {time.perf_counter() - t0:.0f}s")
+
+
+def time_query(session, dialect: str, q: str, max_candidates: int, rounds: int):
+    stmt = search_statement(dialect, q, (Item.id, Item.title), [Item.is_duplicate.is_(False)], max_candidates).limit(20)
+    timings = []
+    for _ in range(rounds):
+        t = time.perf_counter()
+        session.execute(stmt).all()
+        timings.append(time.perf_counter() - t)
+    timings.sort()
+    return statistics.median(timings), timings[max(int(len(timings) * 0.95) - 1, 0)]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--items", type=int, default=1_000_000)
+    ap.add_argument("--rounds", type=int, default=10)
+    ap.add_argument("--reuse", action="store_true", help="do not generate, query the existing corpus")
+    args = ap.parse_args(argv)
+
+    init_db()
+    with get_session() as session:
+        existing = session.execute(select(func.count(Item.id))).scalar()
+    if not args.reuse:
+        if existing:
+            print(f"items already has {existing} rows; use a scratch database or --reuse")
+            return 1
+        generate(args.items)
+
+    queries = {
+        "rare word": WORDS[300],
+        "mid word": WORDS[40],
+        "common word": WORDS[0],
+        "two words": f"{WORDS[3]} {WORDS[60]}",
+        "CJK word": HANZI[10:12],
+        "CJK char": "的",
+    }
+    uncapped = 10 ** 9
+    with get_session() as session:
+        dialect = session.get_bind().dialect.name
+        total = session.execute(select(func.count(Item.id))).scalar()
+        print(f"{total} items on {dialect}, first page of 20, {args.rounds} rounds")
+        print(f"{'query':12} {'matches':>9}  {'capped p50/p95 (ms)':>22}  {'uncapped p50/p95 (ms)':>24}")
+        for name, q in queries.items():
+            matches = len(session.execute(search_statement(dialect, q, (Item.id,), max_candidates=uncapped)).all())
+            c50, c95 = time_query(session, dialect, q, SEARCH_MAX_CANDIDATES, args.rounds)
+            u50, u95 = time_query(session, dialect, q, uncapped, args.rounds)
+            print(f"{name:12} {matches:9d}  {c50 * 1e3:10.1f} / {c95 * 1e3:9.1f}  {u50 * 1e3:11.1f} / {u95 * 1e3:10.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""Shared test setup: the whole session runs against a throw-away SQLite database.
+
+app.storage.db creates its engine from DATABASE_URL when it is first imported, so the variable is set
+here, before any test module imports the application.
+"""
+import os
+import shutil
+import tempfile
+
+_DB_DIR = tempfile.mkdtemp(prefix="myinfo-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_DB_DIR, "test.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def _schema():
+    from app.storage.db import engine, init_db
+
+    init_db()
+    yield
+    engine.dispose()
+    shutil.rmtree(_DB_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def db(_schema):
+    """An initialized database, emptied again after the test."""
+    yield
+    from app.storage.db import Base, engine
+
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
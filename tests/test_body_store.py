@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.storage.body_store import DICT_MIN_SAMPLES, BodyStore
+
+zstandard = pytest.importorskip("zstandard")
+
+BODY = "<div class=\"post\"><p>正文 with <b>markup</b></p>" + "<footer>subscribe to our newsletter</footer></div>" * 3
+
+
+def _samples(n=DICT_MIN_SAMPLES * 2):
+    return [
+        f"<div class=\"post\"><h1>Story {i}</h1><p>Paragraph number {i * 7} of the story.</p>"
+        "<footer>Follow us for more news, subscribe to our newsletter</footer></div>".encode("utf-8")
+        for i in range(n)
+    ]
+
+
+def test_disabled_store_keeps_plain_text():
+    assert BodyStore(enabled=False).encode("s", BODY) == (BODY, None, None)
+
+
+def test_encode_decode_round_trip(db):
+    store = BodyStore(enabled=True)
+    raw, blob, dict_id = store.encode("no-dictionary-source", BODY)
+    assert raw is None and dict_id is None
+    assert isinstance(blob, bytes) and len(blob) < len(BODY.encode("utf-8"))
+    assert store.decode(blob, dict_id) == BODY
+
+
+@pytest.mark.parametrize("text", [None, ""])
+def test_empty_bodies_are_not_compressed(text):
+    assert BodyStore(enabled=True).encode("s", text) == (text, None, None)
+
+
+def test_decode_of_plain_row():
+    assert BodyStore(enabled=True).decode(None, None) is None
+
+
+def test_apply_replaces_raw_content_in_place(db):
+    store = BodyStore(enabled=True)
+    values = {"source_id": "s", "raw_content": BODY}
+    store.apply(values)
+    assert values["raw_content"] is None
+    assert store.decode(values["raw_content_z"], values["body_dict_id"]) == BODY
+
+
+def test_too_few_samples_train_no_dictionary(db):
+    assert BodyStore(enabled=True).train("s", _samples(DICT_MIN_SAMPLES - 1)) is None
+
+
+def test_dictionary_is_used_and_found_by_other_processes(db):
+    from app.storage.source_repository import SourceRepository
+
+    source_id = SourceRepository().create("s", "https://example.com/feed")
+    writer = BodyStore(enabled=True)
+    dict_id = writer.train(source_id, _samples())
+    assert dict_id is not None
+    body = _samples(1)[0].decode("utf-8")
+    raw, blob, used = writer.encode(source_id, body)
+    assert used == dict_id
+    assert len(blob) < len(BodyStore(enabled=True).encode("other", body)[1])
+    # a store without the dictionary cached (another process) loads it from body_dictionaries
+    assert BodyStore(enabled=True).decode(blob, used) == body
+
+
+def test_async_readers_preload_dictionaries(db):
+    from app.storage.db import get_async_session
+    from app.storage.source_repository import SourceRepository
+
+    source_id = SourceRepository().create("s", "https://example.com/feed")
+    dict_id = BodyStore(enabled=True).train(source_id, _samples())
+    reader = BodyStore(enabled=True)
+
+    async def load():
+        async with get_async_session() as session:
+            await reader.load_dictionaries_async(session, [dict_id, None])
+
+    asyncio.run(load())
+    assert dict_id in reader._dicts
@@ -0,0 +1,82 @@
+import math
+
+import pytest
+
+from app.pipelines.fetch_policy import AdaptiveIntervalPolicy, SourceSchedule
+
+HOUR = 3600
+DAY = 86400
+
+
+@pytest.fixture
+def policy():
+    return AdaptiveIntervalPolicy(min_interval=300, max_interval=DAY, max_backoff=DAY, target_new_items=1.0,
+                                  rate_window_seconds=2 * DAY, growth_factor=2.0)
+
+
+def test_first_fetch_keeps_base_interval(policy):
+    state = SourceSchedule(base_interval=HOUR)
+    # the backlog of a new feed says nothing about its rate
+    assert policy.observe(state, created=50, elapsed=None) == HOUR
+    assert state.rate_per_day is None
+    assert state.interval == HOUR
+
+
+def test_first_measured_rate_sets_interval(policy):
+    state = SourceSchedule(base_interval=HOUR)
+    # 12 items in an hour: 288/day, one item every 5 minutes
+    assert policy.observe(state, created=12, elapsed=HOUR) == 300
+    assert state.rate_per_day == pytest.approx(288.0)
+
+
+def test_rate_is_continuous_time_ewma(policy):
+    state = SourceSchedule(base_interval=HOUR, rate_per_day=24.0)
+    policy.observe(state, created=0, elapsed=HOUR)
+    weight = 1.0 - math.exp(-HOUR / (2 * DAY))
+    assert state.rate_per_day == pytest.approx(24.0 * (1 - weight))
+
+
+def test_interval_is_clamped_to_bounds(policy):
+    busy = SourceSchedule(base_interval=HOUR)
+    assert policy.observe(busy, created=1000, elapsed=HOUR) == 300
+    quiet = SourceSchedule(base_interval=DAY, interval=DAY, rate_per_day=0.01)
+    assert policy.observe(quiet, created=0, elapsed=DAY) == DAY
+
+
+def test_per_source_bounds_override_global(policy):
+    state = SourceSchedule(base_interval=HOUR, min_interval=1800)
+    assert policy.observe(state, created=1000, elapsed=HOUR) == 1800
+
+
+def test_growth_is_limited_per_fetch(policy):
+    state = SourceSchedule(base_interval=HOUR, rate_per_day=0.1)
+    # the rate alone asks for max_interval; one fetch may only double the interval
+    assert policy.observe(state, created=0, elapsed=HOUR) == 2 * HOUR
+    assert policy.observe(state, created=0, elapsed=2 * HOUR) == 4 * HOUR
+
+
+def test_shrinks_at_once(policy):
+    state = SourceSchedule(base_interval=HOUR, interval=DAY, rate_per_day=1.0)
+    assert policy.observe(state, created=200, elapsed=DAY) < HOUR
+
+
+def test_failures_back_off_exponentially_and_cap(policy):
+    state = SourceSchedule(base_interval=HOUR)
+    assert [policy.observe(state, None, HOUR) for _ in range(6)] == [2 * HOUR, 4 * HOUR, 8 * HOUR, 16 * HOUR, DAY, DAY]
+    assert state.consecutive_failures == 6
+    # the interval itself is untouched by failures
+    assert state.current_interval == HOUR
+
+
+def test_success_resets_failures(policy):
+    state = SourceSchedule(base_interval=HOUR, rate_per_day=24.0, consecutive_failures=3)
+    policy.observe(state, created=1, elapsed=HOUR)
+    assert state.consecutive_failures == 0
+    assert policy.observe(state, None, HOUR) == 2 * state.current_interval
+
+
+def test_non_adaptive_source_keeps_base_interval(policy):
+    state = SourceSchedule(base_interval=HOUR, adaptive=False)
+    assert policy.observe(state, created=1000, elapsed=HOUR) == HOUR
+    # the rate is still tracked
+    assert state.rate_per_day == pytest.approx(24000.0)
@@ -0,0 +1,153 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select
+
+from app.storage.db import get_session
+from app.storage.job_queue import DEAD, DONE, LEASED, PENDING, JobQueue
+from app.storage.models import FetchJob
+from app.storage.source_repository import SourceRepository
+
+
+@pytest.fixture
+def sources(db):
+    repo = SourceRepository()
+    return [repo.create(f"source {i}", f"https://example{i}.com/feed") for i in range(3)]
+
+
+@pytest.fixture
+def queue():
+    return JobQueue(worker_id="test", max_attempts=3, retry_base_seconds=10, retry_max_seconds=60)
+
+
+def _job_row(job_id):
+    with get_session() as session:
+        return session.execute(select(FetchJob).where(FetchJob.id == job_id)).scalar_one()
+
+
+def _status(job_id):
+    return _job_row(job_id).status
+
+
+class Deferred(Exception):
+    retry_after = 30.0
+
+
+def test_enqueue_returns_new_jobs_only(sources, queue):
+    ids = queue.enqueue(sources[:2] + sources[:1])
+    assert len(ids) == 2
+    # a source with a pending job is not queued twice
+    assert len(queue.enqueue(sources)) == 1
+    assert queue.active_source_ids() == set(sources)
+    assert queue.enqueue([]) == []
+
+
+def test_lease_takes_due_jobs_and_counts_attempts(sources, queue):
+    now = datetime.now(timezone.utc)
+    due, = queue.enqueue(sources[:1], run_at=now - timedelta(minutes=1))
+    later, = queue.enqueue(sources[1:2], run_at=now + timedelta(hours=1))
+    jobs = queue.lease(10, now=now)
+    assert [j.id for j in jobs] == [due]
+    assert jobs[0].attempts == 1 and jobs[0].source_id == sources[0]
+    assert _status(due) == LEASED
+    # a leased job is not claimed again while its lease holds
+    assert queue.lease(10, now=now) == []
+    assert queue.ack(jobs[0])
+    assert [j.id for j in queue.lease(10, now=now + timedelta(hours=2))] == [later]
+
+
+def test_expired_lease_is_claimed_again(sources, queue):
+    job_id, = queue.enqueue(sources[:1])
+    first, = queue.lease(1)
+    second, = queue.lease(1, now=datetime.now(timezone.utc) + timedelta(seconds=queue.lease_seconds + 1))
+    assert second.id == job_id and second.attempts == 2
+    # the first worker lost its lease
+    assert queue.ack(first) is False
+    assert queue.ack(second) is True
+    assert _status(job_id) == DONE
+
+
+def test_lease_restricted_to_job_ids(sources, queue):
+    ids = queue.enqueue(sources)
+    assert [j.id for j in queue.lease(10, job_ids=ids[1:2])] == ids[1:2]
+    assert queue.lease(10, job_ids=[]) == []
+
+
+def test_fail_retries_with_backoff_then_dead_letters(sources, queue):
+    job_id, = queue.enqueue(sources[:1])
+    for attempt in (1, 2):
+        job, = queue.lease(1, now=datetime.now(timezone.utc) + timedelta(hours=attempt))
+        before = datetime.now(timezone.utc)
+        retry_at = queue.fail(job, "boom")
+        delay = min(60, 10 * 2 ** (attempt - 1))
+        assert before + timedelta(seconds=delay / 2) <= retry_at <= datetime.now(timezone.utc) + timedelta(seconds=delay)
+        assert _status(job_id) == PENDING
+    job, = queue.lease(1, now=datetime.now(timezone.utc) + timedelta(hours=3))
+    assert job.attempts == 3
+    assert queue.fail(job, "boom") is None
+    row = _job_row(job_id)
+    assert (row.status, row.active_key, row.last_error) == (DEAD, None, "boom")
+    # the source can be queued again
+    assert len(queue.enqueue(sources[:1])) == 1
+
+
+def test_release_does_not_count_the_attempt(sources, queue):
+    job_id, = queue.enqueue(sources[:1])
+    job, = queue.lease(1)
+    assert queue.release(job)
+    job, = queue.lease(1)
+    assert job.attempts == 1
+
+
+def test_run_acks_fails_and_defers(sources, queue):
+    ok_id, fail_id, defer_id = queue.enqueue(sources)
+    jobs = {j.id: j for j in queue.lease(10)}
+
+    outcome = queue.run(jobs[ok_id], lambda job: [(object(), True), (object(), False)])
+    assert outcome.ok and _job_row(ok_id).items_created == 1
+
+    def broken(job):
+        raise ValueError("bad feed")
+
+    outcome = queue.run(jobs[fail_id], broken)
+    assert not outcome.ok and not outcome.dead and outcome.retry_at is not None
+    assert _job_row(fail_id).last_error == "ValueError: bad feed"
+
+    def throttled(job):
+        raise Deferred("host busy")
+
+    outcome = queue.run(jobs[defer_id], throttled)
+    assert outcome.deferred and not outcome.dead
+    row = _job_row(defer_id)
+    assert (row.status, row.attempts) == (PENDING, 0)
+    assert queue.lease(10, job_ids=[defer_id]) == []
+
+
+def test_drain_runs_only_the_given_jobs(sources, queue):
+    mine = queue.enqueue(sources[:2])
+    other, = queue.enqueue(sources[2:])
+    seen = []
+    lock = threading.Lock()
+
+    def handler(job):
+        with lock:
+            seen.append(job.id)
+        return queue.run(job, lambda j: [])
+
+    assert queue.drain(handler, workers=2, job_ids=mine) == 2
+    assert sorted(seen) == sorted(mine)
+    assert all(_status(i) == DONE for i in mine)
+    assert _status(other) == PENDING
+    assert queue.unfinished(mine) == 0 and queue.unfinished() == 1
+
+
+def test_drain_fails_jobs_whose_handler_raises(sources, queue):
+    job_id, = queue.enqueue(sources[:1])
+
+    def handler(job):
+        raise RuntimeError("handler bug")
+
+    assert queue.drain(handler, workers=1, job_ids=[job_id]) == 1
+    row = _job_row(job_id)
+    assert row.status == PENDING and row.last_error == "RuntimeError: handler bug"
@@ -0,0 +1,76 @@
+from sqlalchemy import select
+
+from app.storage.db import get_session
+from app.storage.fetched_item_repository import FetchedItemRepository
+from app.storage.models import Item
+from app.storage.search import cjk_tokens, fts5_query, query_tokens, search_statement
+
+
+def test_cjk_tokens_index_characters_and_pairs():
+    assert cjk_tokens("苹果发布").split() == ["苹", "苹果", "果", "果发", "发", "发布", "布"]
+
+
+def test_cjk_tokens_keep_other_text():
+    assert cjk_tokens("Hello world") == "Hello world"
+    assert cjk_tokens("苹果iPhone 15").split() == ["苹", "苹果", "果", "iPhone", "15"]
+    assert cjk_tokens(None) is None
+    assert cjk_tokens("") == ""
+
+
+def test_query_tokens():
+    assert query_tokens("发布新手机") == ["发布", "布新", "新手", "手机"]
+    assert query_tokens("苹") == ["苹"]
+    assert query_tokens("iPhone苹果") == ["iPhone", "苹果"]
+    assert query_tokens("東京タワー") == ["東京", "京タ", "タワ", "ワー"]
+
+
+def test_fts5_query_quotes_every_token():
+    assert fts5_query("苹果 iPhone") == '"苹果" "iPhone"'
+    assert fts5_query("发布新手机") == '"发布" "布新" "新手" "手机"'
+    # FTS5 syntax in user input is matched literally
+    assert fts5_query('say "hi" OR NEAR(x)') == '"say" """hi""" "OR" "NEAR(x)"'
+    assert fts5_query("   ") == ""
+
+
+def _store(*rows):
+    repo = FetchedItemRepository()
+    return repo.upsert_many([
+        {"fingerprint": f"fp-{i}", "url": f"https://example.com/{i}", "title": title, "content": content}
+        for i, (title, content) in enumerate(rows)
+    ])
+
+
+def _search(q, max_candidates=1000):
+    with get_session() as session:
+        stmt = search_statement("sqlite", q, (Item.title,), [Item.is_duplicate.is_(False)], max_candidates)
+        return [row.title for row in session.execute(stmt)]
+
+
+def test_search_finds_cjk_substrings(db):
+    _store(("苹果发布新手机", "发布会在加州举行"), ("Hello world", "nothing to see"))
+    assert _search("新手机") == ["苹果发布新手机"]
+    assert _search("苹") == ["苹果发布新手机"]
+    assert _search("world") == ["Hello world"]
+    assert _search("果手") == []
+
+
+def test_search_ranks_title_matches_first(db):
+    _store(("a story", "the keyword appears in the body"), ("keyword in the title", "body text"))
+    assert _search("keyword") == ["keyword in the title", "a story"]
+
+
+def test_search_ranks_only_the_newest_candidates(db):
+    _store(*[(f"match {i}", "common") for i in range(5)])
+    assert sorted(_search("common", max_candidates=2)) == ["match 3", "match 4"]
+    assert len(_search("common")) == 5
+
+
+def test_search_index_follows_updates(db):
+    (item_id, _), = _store(("香蕉大会", "old text"))
+    FetchedItemRepository().upsert_many([
+        {"fingerprint": "fp-0", "url": "https://example.com/0", "title": "香蕉大会", "content": "new words"}
+    ])
+    assert _search("old") == []
+    assert _search("words") == ["香蕉大会"]
+    with get_session() as session:
+        assert session.execute(select(Item.id)).scalar_one() == item_id
@@ -0,0 +1,88 @@
+import pytest
+
+from app.sources.url_canonical import canonical_entry_url, canonicalize_url
+from app.storage.fetched_item_repository import FetchedItemRepository
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("HTTP://Example.COM:80/a//b/?utm_source=x&b=2&a=1#frag", "https://example.com/a/b?a=1&b=2"),
+    ("https://example.com", "https://example.com/"),
+    ("  https://example.com/  ", "https://example.com/"),
+    ("https://user:pw@example.com:8443/x/", "https://example.com:8443/x"),
+    ("https://例え.jp/パス", "https://xn--r8jz45g.jp/%E3%83%91%E3%82%B9"),
+    ("https://example.com/?fbclid=1&gclid=2&_ga=3&mc_cid=4", "https://example.com/"),
+])
+def test_canonicalize_url(url, expected):
+    assert canonicalize_url(url) == expected
+
+
+def test_content_selecting_parameters_are_kept():
+    assert canonicalize_url("https://example.com/?ref=home&from=rss&id=7") == "https://example.com/?from=rss&id=7&ref=home"
+
+
+def test_reserved_escapes_stay_distinct():
+    assert canonicalize_url("https://example.com/a%2fb") == "https://example.com/a%2Fb"
+    assert canonicalize_url("https://example.com/a%2Fb") != canonicalize_url("https://example.com/a/b")
+    assert canonicalize_url("https://example.com/%7Euser") == "https://example.com/~user"
+    assert canonicalize_url("https://example.com/50%off") == "https://example.com/50%25off"
+
+
+@pytest.mark.parametrize("value", [None, "mailto:someone@example.com", "not a url", "/relative/path"])
+def test_non_http_values_pass_through(value):
+    assert canonicalize_url(value) == value
+
+
+def test_canonical_entry_url_prefers_publisher_links():
+    links = [{"rel": "alternate", "href": "https://example.com/a?utm_medium=rss"}, {"rel": "canonical", "href": "https://example.com/A/"}]
+    assert canonical_entry_url("https://feeds.example.com/~r/x", links) == "https://example.com/A"
+    assert canonical_entry_url("https://feeds.example.com/~r/x", origlink="https://example.com/b") == "https://example.com/b"
+    assert canonical_entry_url("https://example.com/c?utm_source=x") == "https://example.com/c"
+
+
+def _row(fingerprint, url, title, entry_id=None, content="body"):
+    return {
+        "fingerprint": fingerprint,
+        "url": url,
+        "canonical_url": canonicalize_url(url),
+        "title": title,
+        "content": content,
+        "meta": {"entry_id": entry_id or url},
+    }
+
+
+def test_tracking_variants_dedupe_to_one_item(db):
+    repo = FetchedItemRepository()
+    (first, created), = repo.upsert_many([_row("f1", "https://example.com/post?utm_source=rss", "Post")])
+    (second, created_again), = repo.upsert_many([_row("f2", "https://EXAMPLE.com/post/#comments", "Post")])
+    assert created and not created_again
+    assert first == second
+
+
+def test_entries_sharing_a_landing_page_with_own_guids_stay_apart(db):
+    repo = FetchedItemRepository()
+    results = repo.upsert_many([
+        _row("f1", "https://example.com/", "First", entry_id="guid-1"),
+        _row("f2", "https://example.com/", "Second", entry_id="guid-2"),
+    ])
+    assert results[0][0] != results[1][0]
+    assert len(repo.list(limit=10)) == 2
+
+
+def test_guid_equal_to_link_survives_an_edited_title(db):
+    repo = FetchedItemRepository()
+    (item_id, _), = repo.upsert_many([_row("f1", "https://example.com/p", "Old title")])
+    assert repo.upsert_many([_row("f2", "https://example.com/p", "New title", content="edited")]) == [(item_id, False)]
+    assert repo.upsert_by_fingerprint("f3", _row("f3", "https://example.com/p", "Newer title")) == (item_id, False)
+    assert repo.get(item_id)["title"] == "Newer title"
+
+
+def test_batch_rows_resolving_to_one_item_are_merged(db):
+    repo = FetchedItemRepository()
+    (item_id, _), = repo.upsert_many([_row("f1", "https://example.com/a", "T", entry_id="g1")])
+    # one row finds the item by fingerprint, the other by canonical URL
+    results = repo.upsert_many([
+        _row("f1", "https://example.com/moved", "T", entry_id="g9", content="first"),
+        _row("f2", "https://example.com/a", "T", entry_id="g1", content="second"),
+    ])
+    assert results == [(item_id, False), (item_id, False)]
+    assert repo.get(item_id)["content"] == "second"